@@ -0,0 +1,521 @@
+"""
+Async (ASGI) serving mode.
+
+    uvicorn asgi:app --port 5001
+
+The hot endpoints (predictions, vehicles, stations, alerts, directions)
+run as coroutines on one event loop and talk to the MBTA and Google
+through pooled httpx.AsyncClients, so concurrency is no longer capped by
+the thread count of Flask's dev server. Every other route is handed to
+the Flask app in server.py on a worker thread, so both modes expose the
+same API and the same JSON shapes.
+
+/api/directions with "include_live": true fans out concurrently: the
+Google request, the alerts list and the station list are fetched side by
+side, then live predictions for every boarding station in one MBTA call.
+
+Vehicle pushes (/api/mbta/vehicles/stream as SSE, /api/mbta/vehicles/ws
+as a WebSocket) are served natively too, so an open connection costs a
+coroutine rather than a worker thread.
+"""
+import io
+import re
+import sys
+import time
+from urllib.parse import parse_qs
+
+import anyio
+import anyio.from_thread
+import anyio.to_thread
+
+import ingester
+import metrics
+import push
+import responses
+import server
+import upstream
+from cache import UpstreamError
+from singleflight import async_flights, make_key
+
+
+# ============================================
+# 1. UPSTREAM HELPERS
+# ============================================
+
+async def fetch_json(url, parse, params=None, headers=None, priority=None):
+    """Async twin of server.fetch_json (coalesced GET + parse)."""
+    async def load():
+        try:
+            response = await upstream.aget(url, params=params, headers=headers, priority=priority)
+        except Exception as e:
+            raise UpstreamError(f"{url}: {e}")
+        if response.status_code != 200:
+            raise UpstreamError(f"HTTP {response.status_code} from {url}")
+        with metrics.span('json_parse'):
+            return parse(response.json())
+    return await async_flights.do(make_key(url, params), load)
+
+
+async def cached(resource):
+    """CachedResource.get() without blocking the loop on a cold cache."""
+    if resource.warm:
+        return resource.get()
+    return await anyio.to_thread.run_sync(resource.get)
+
+
+async def ensure_predictions(stop_ids):
+    """Async twin of server._ensure_predictions."""
+    if ingester.predictions.ready:
+        return
+    stale = server.prediction_store.stale_stops(stop_ids, server.PREDICTIONS_TTL)
+    if not stale:
+        return
+    headers = {"x-api-key": server.MBTA_API_KEY}
+    params = {
+        'filter[stop]': ','.join(stale),
+        'include': 'route,stop',
+        'sort': 'arrival_time'
+    }
+    records = await fetch_json(f'{server.MBTA_BASE_URL}/predictions',
+                               server._parse_prediction_records, params, headers, priority='predictions')
+    server.prediction_store.replace_stops(stale, records)
+
+
+async def fetch_google_routes(origin, destination):
+    """Async twin of server.fetch_google_routes (shares its cache)."""
+    key = server._directions_key(origin, destination)
+    res = server.directions_cache.get(key)
+    if res is not None:
+        return res
+
+    params = server._google_params(origin, destination)
+    print(f"📡 Google Search: {origin} -> {destination}")
+
+    async def load():
+        response = await upstream.aget(server.GOOGLE_BASE_URL, params=params, priority='directions')
+        with metrics.span('json_parse'):
+            return response.json()
+    try:
+        res = await async_flights.do(make_key(server.GOOGLE_BASE_URL, params), load)
+    except Exception as e:
+        res = server._directions_fallback(key, e)
+        if res is None:
+            raise UpstreamError(f"Google Directions: {e}")
+        return res
+    return server._checked_directions(key, res)
+
+
+# ============================================
+# 2. ENDPOINTS
+# ============================================
+
+async def get_stations(request):
+    try:
+        fields = responses.parse_fields(request['args'].get('fields'))
+        return 200, {'success': True, 'data': responses.project(await cached(server.stations_cache), fields)}
+    except Exception as e:
+        print(f"Error fetching stations: {e}")
+        return 200, {'success': False, 'data': []}
+
+
+async def get_alerts(request):
+    try:
+        return 200, {'success': True, 'data': await cached(server.alerts_cache)}
+    except Exception:
+        return 200, {'success': False, 'data': []}
+
+
+async def get_predictions(request, stop_id):
+    try:
+        try:
+            await ensure_predictions([stop_id])
+        except UpstreamError:
+            pass  # serve whatever the store last had
+        return 200, {'success': True, 'data': server.prediction_store.next_departures(stop_id, 5)}
+    except Exception as e:
+        print(f"Error predictions: {e}")
+        return 200, {'success': False, 'data': []}
+
+
+async def get_predictions_batch(request):
+    args = request['args']
+    try:
+        stop_ids, limit, route, direction_id = server._prediction_query(args)
+    except ValueError as e:
+        return 400, {'success': False, 'error': str(e), 'data': {}}
+    try:
+        try:
+            await ensure_predictions(stop_ids)
+        except UpstreamError:
+            pass
+        fields = responses.parse_fields(args.get('fields'))
+        data = {
+            stop_id: responses.project(server.prediction_store.next_departures(stop_id, limit, route, direction_id), fields)
+            for stop_id in stop_ids
+        }
+        return 200, {'success': True, 'data': data}
+    except Exception as e:
+        print(f"Error predictions: {e}")
+        return 200, {'success': False, 'data': {}}
+
+
+async def get_vehicles(request):
+    try:
+        try:
+            area = server._parse_area(request['args'])
+        except ValueError:
+            return 400, {'success': False, 'error': 'bad bbox or radius filter', 'data': []}
+        fields = responses.parse_fields(request['args'].get('fields'))
+
+        if ingester.vehicles.ready:
+            vehicles, version = server._live_vehicles()
+            if area:
+                vehicles = server._filter_area(server.vehicle_index.get(vehicles, version), area)
+            return 200, {'success': True, 'data': responses.project(vehicles, fields)}
+
+        headers = {"x-api-key": server.MBTA_API_KEY}
+        params = {
+            'filter[route]': ingester.SUBWAY_ROUTES,
+            'include': 'route'
+        }
+        last_good = server._last_good_vehicles
+        stale_for = None
+        try:
+            vehicles = await fetch_json(f'{server.MBTA_BASE_URL}/vehicles', server._parse_vehicles, params, headers,
+                                        priority='vehicles')
+            last_good.update(data=vehicles, at=time.time())
+        except UpstreamError:
+            if last_good['data'] is None:
+                return 200, {'success': False, 'data': []}
+            vehicles = last_good['data']
+            stale_for = round(time.time() - last_good['at'])
+        if area:
+            vehicles = server._filter_area(server.vehicle_index.get(vehicles), area)
+        payload = {'success': True, 'data': responses.project(vehicles, fields)}
+        if stale_for is not None:
+            payload['stale_s'] = stale_for
+        return 200, payload
+
+    except Exception as e:
+        print(f"Error fetching vehicles: {e}")
+        return 500, {
+            'success': False,
+            'error': str(e),
+            'message': 'Failed to fetch live vehicle data.'
+        }
+
+
+async def get_directions(request):
+    try:
+        data = request['json']
+        speed_profile = data.get('walking_speed', 'normal')
+        user_speed = server.SPEED_MAP.get(speed_profile, 1.4)
+        origin = server._location_param(data.get('origin'))
+        destination = server._location_param(data.get('destination'))
+        include_live = bool(data.get('include_live'))
+        try:
+            fields, path_format, zoom = server.directions_options(data, request['args'])
+        except ValueError as e:
+            return 400, {'success': False, 'error': str(e)}
+
+        # The CSA search is CPU-bound: keep it off the event loop.
+        local = await anyio.to_thread.run_sync(
+            lambda: server.local_directions(data, user_speed, fields, path_format, zoom))
+        if local is not None:
+            return 200, local
+
+        results = {}
+        errors = {}
+
+        async def run(name, coro_fn):
+            try:
+                results[name] = await coro_fn()
+            except UpstreamError as e:
+                errors[name] = e
+
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(run, 'google', lambda: fetch_google_routes(origin, destination))
+            if include_live:
+                tg.start_soon(run, 'alerts', lambda: cached(server.alerts_cache))
+                tg.start_soon(run, 'stations', lambda: cached(server.stations_cache))
+
+        if 'google' in errors:
+            raise errors['google']  # same "Google Directions: ..." error as the sync path
+        res = results['google']
+        if res['status'] != 'OK':
+            return 200, {'success': False, 'error': f"Google Error: {res['status']}"}
+
+        if data.get('profiles'):
+            labels, speeds = server.resolve_profiles(data['profiles'])
+            per_profile = server.catchable_routes_multi(res, speeds, path_format=path_format, zoom=zoom)
+            return 200, server._with_staleness({'success': True, 'data': {
+                label: responses.project(routes, fields) for label, routes in zip(labels, per_profile)
+            }}, res)
+
+        routes = server.catchable_routes(res, user_speed, path_format=path_format, zoom=zoom)
+        if not include_live:
+            return 200, server._with_staleness({'success': True, 'data': responses.project(routes, fields)}, res)
+
+        # May fetch stations synchronously if the concurrent fetch above failed.
+        station_ids = await anyio.to_thread.run_sync(server.boarding_station_ids, res, routes)
+        try:
+            await ensure_predictions([sid for sid in station_ids if sid])
+        except UpstreamError:
+            pass
+        return 200, server._with_staleness({
+            'success': True,
+            'data': responses.project(server.attach_live(routes, station_ids), fields),
+            'alerts': results.get('alerts', [])
+        }, res)
+
+    except Exception as e:
+        print(f"Server Error: {e}")
+        return 200, {'success': False, 'error': str(e)}
+
+
+ROUTES = [
+    ('GET', re.compile(r'^/api/mbta/stations$'), get_stations),
+    ('GET', re.compile(r'^/api/mbta/alerts$'), get_alerts),
+    ('GET', re.compile(r'^/api/mbta/predictions$'), get_predictions_batch),
+    ('GET', re.compile(r'^/api/mbta/predictions/(?P<stop_id>[^/]+)$'), get_predictions),
+    ('GET', re.compile(r'^/api/mbta/vehicles$'), get_vehicles),
+    ('POST', re.compile(r'^/api/directions$'), get_directions),
+]
+
+
+# ============================================
+# 3. PUSH CHANNELS
+# ============================================
+
+async def _push_loop(subscriber, emit, heartbeat=None):
+    """Sends the subscriber's snapshot/deltas through emit(), at most one per MIN_INTERVAL."""
+    idle = 0.0
+    while True:
+        message = subscriber.take()
+        if message is not None:
+            await emit(message)
+            idle = 0.0
+        elif heartbeat is not None and idle >= push.HEARTBEAT:
+            await heartbeat()
+            idle = 0.0
+        # Coalescing window: changes arriving meanwhile merge into the next delta.
+        await anyio.sleep(push.MIN_INTERVAL)
+        idle += push.MIN_INTERVAL
+
+
+async def _until(receive, message_type, cancel_scope):
+    """Cancels cancel_scope once the client disconnects."""
+    while (await receive())['type'] != message_type:
+        pass
+    cancel_scope.cancel()
+
+
+async def stream_vehicles(scope, receive, send):
+    """Async twin of server.stream_vehicles (SSE)."""
+    fields = responses.parse_fields(_query_args(scope).get('fields'))
+    subscriber = server.vehicle_hub.subscribe(fields)
+
+    async def emit(message):
+        await send({'type': 'http.response.body', 'body': push.sse_message(message).encode(), 'more_body': True})
+
+    async def heartbeat():
+        await send({'type': 'http.response.body', 'body': b': keepalive\n\n', 'more_body': True})
+
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+                (b'access-control-allow-origin', b'*'),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': b'retry: 3000\n\n', 'more_body': True})
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(_until, receive, 'http.disconnect', tg.cancel_scope)
+            await _push_loop(subscriber, emit, heartbeat)
+    finally:
+        subscriber.close()
+
+
+async def vehicles_websocket(scope, receive, send):
+    """WebSocket at /api/mbta/vehicles/ws: the same snapshot/delta messages as JSON text frames."""
+    await receive()  # websocket.connect
+    if scope['path'] != '/api/mbta/vehicles/ws':
+        await send({'type': 'websocket.close', 'code': 1008})
+        return
+    await send({'type': 'websocket.accept'})
+    fields = responses.parse_fields(_query_args(scope).get('fields'))
+    subscriber = server.vehicle_hub.subscribe(fields)
+
+    async def emit(message):
+        await send({'type': 'websocket.send', 'text': responses.dumps(message).decode()})
+
+    try:
+        async with anyio.create_task_group() as tg:
+            # Anything the client sends is ignored; we only watch for the close.
+            tg.start_soon(_until, receive, 'websocket.disconnect', tg.cancel_scope)
+            await _push_loop(subscriber, emit)
+    finally:
+        subscriber.close()
+
+
+# ============================================
+# 4. ASGI PLUMBING
+# ============================================
+
+def _query_args(scope):
+    return {k: v[0] for k, v in parse_qs(scope['query_string'].decode('latin-1')).items()}
+
+
+async def _read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+async def _send_json(send, status, payload, scope=None, trace=None):
+    """Serializes and sends a JSON response; `trace` is the metrics.begin() token to finish."""
+    accept_encoding = None
+    if scope is not None:
+        accept_encoding = next((v.decode('latin-1') for k, v in scope['headers'] if k == b'accept-encoding'), None)
+    with metrics.span('serialize'):
+        body = responses.dumps(payload)
+    body, encoding = responses.compress(body, accept_encoding)
+    headers = [
+        (b'content-type', b'application/json'),
+        (b'content-length', str(len(body)).encode()),
+        (b'access-control-allow-origin', b'*'),
+        (b'vary', b'Accept-Encoding'),
+    ]
+    if encoding:
+        headers.append((b'content-encoding', encoding.encode()))
+    if trace is not None:
+        timing = metrics.finish(trace, scope['method'], status, scope['path'])
+        if timing:
+            headers.append((b'server-timing', timing.encode('latin-1')))
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': headers,
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def _wsgi_environ(scope, body):
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'CONTENT_LENGTH':
+            key = f'HTTP_{name}'
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def _call_flask(scope, body, send):
+    """Runs the Flask app for this request on a worker thread, streaming its body back."""
+    environ = _wsgi_environ(scope, body)
+
+    def run():
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+            return lambda data: None
+
+        result = server.app(environ, start_response)
+        try:
+            sent_start = False
+            for chunk in result:
+                if not sent_start:
+                    anyio.from_thread.run(send, {'type': 'http.response.start', 'status': started['status'],
+                                                 'headers': started['headers']})
+                    sent_start = True
+                if chunk:
+                    anyio.from_thread.run(send, {'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if not sent_start:
+                anyio.from_thread.run(send, {'type': 'http.response.start', 'status': started['status'],
+                                             'headers': started['headers']})
+            anyio.from_thread.run(send, {'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+    await anyio.to_thread.run_sync(run)
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                if server.snapshot_reader is not None:
+                    server.snapshot_reader.ensure_started()
+                if server.FAVORITES_PRECOMPUTE:
+                    server.precomputer.start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await upstream.aclose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    if scope['type'] == 'websocket':
+        await vehicles_websocket(scope, receive, send)
+        return
+
+    if scope['type'] != 'http':
+        return
+
+    if scope['path'] == '/api/mbta/vehicles/stream' and scope['method'] == 'GET':
+        await stream_vehicles(scope, receive, send)
+        return
+
+    body = await _read_body(receive)
+    for method, pattern, handler in ROUTES:
+        match = pattern.match(scope['path'])
+        if match and scope['method'] == method:
+            # Same endpoint labels as the Flask views (function names).
+            trace = metrics.begin(handler.__name__)
+            try:
+                payload = responses.loads(body or b'{}') if method == 'POST' else None
+            except ValueError:
+                await _send_json(send, 400, {'success': False, 'error': 'Invalid JSON body'}, scope, trace)
+                return
+            request = {
+                'args': _query_args(scope),
+                'json': payload,
+            }
+            status, payload = await handler(request, **match.groupdict())
+            await _send_json(send, status, payload, scope, trace)
+            return
+
+    # Everything else (stats, favorites, CORS preflight, ...) is served by Flask.
+    await _call_flask(scope, body, send)
@@ -0,0 +1,227 @@
+"""
+Bounded, sharded on-disk cache for synthesized announcements.
+
+- Keys hash the text together with the voice, model and voice settings,
+  so changing any of them never serves stale audio.
+- Files live in two levels of shard directories (ab/cd/<key>.mp3) so no
+  single directory grows huge.
+- An in-memory index (size + last access per key) answers "is it cached?"
+  without touching the filesystem, and drives LRU eviction once the total
+  size passes max_bytes.
+- A small RAM hot tier keeps the bytes of frequently repeated
+  announcements ("Doors closing", station names) so they skip disk I/O.
+- Flat <md5(text)>.mp3 files from before the sharded layout are indexed
+  under LEGACY_PREFIX, so they count against max_bytes and age out like
+  everything else; adopt_legacy() moves one into its shard the first
+  time its text is asked for again.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+LEGACY_PREFIX = 'legacy:'
+
+
+def cache_key(text, voice_id, model_id, voice_settings):
+    raw = json.dumps(
+        {'text': text, 'voice': voice_id, 'model': model_id, 'settings': voice_settings},
+        sort_keys=True,
+    )
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+class AudioCache:
+    def __init__(self, root, max_bytes, hot_max_bytes=16 * 1024 * 1024,
+                 hot_item_max_bytes=256 * 1024, hot_after_hits=2):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.hot_max_bytes = hot_max_bytes
+        self.hot_item_max_bytes = hot_item_max_bytes
+        self.hot_after_hits = hot_after_hits
+
+        self._lock = threading.Lock()
+        self._index = OrderedDict()     # key -> [path, size, last_access, hits], LRU order
+        self._hot = OrderedDict()       # key -> bytes, LRU order
+        self._hot_bytes = 0
+        self.total_bytes = 0
+        self.counters = {
+            'hot_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0,
+            'evicted_bytes': 0,
+            'legacy_adopted': 0,
+        }
+        os.makedirs(self.root, exist_ok=True)
+        self._scan()
+
+    # --------------------------------------------
+    # Public API
+    # --------------------------------------------
+    def path_for(self, key):
+        """Sharded file path for a key (creates the shard directories)."""
+        shard = os.path.join(self.root, key[:2], key[2:4])
+        os.makedirs(shard, exist_ok=True)
+        return os.path.join(shard, f"{key}.mp3")
+
+    def lookup(self, key):
+        """
+        Returns ('hot', bytes), ('disk', path) or None. Answered from memory;
+        the filesystem is only touched to load a newly hot entry.
+        """
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                self.counters['misses'] += 1
+                return None
+            self._index.move_to_end(key)
+            entry[2] = time.time()
+            entry[3] += 1
+            if key in self._hot:
+                self._hot.move_to_end(key)
+                self.counters['hot_hits'] += 1
+                return ('hot', self._hot[key])
+            self.counters['disk_hits'] += 1
+            path, size, hits = entry[0], entry[1], entry[3]
+
+        if hits >= self.hot_after_hits and size <= self.hot_item_max_bytes:
+            try:
+                with open(path, 'rb') as f:
+                    self._promote(key, f.read())
+            except OSError:
+                pass
+        return ('disk', path)
+
+    def path_if_cached(self, key):
+        """Disk path for a cached key, or None. Refreshes LRU order but not the hit/miss counters."""
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                return None
+            self._index.move_to_end(key)
+            entry[2] = time.time()
+            return entry[0]
+
+    def add(self, key, path):
+        """Registers a finished file (already renamed into place) and evicts if over budget."""
+        size = os.path.getsize(path)
+        with self._lock:
+            old = self._index.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[1]
+            self._index[key] = [path, size, time.time(), 0]
+            self.total_bytes += size
+            self.counters['stores'] += 1
+            victims = self._pick_victims()
+        for victim_path in victims:
+            try:
+                os.remove(victim_path)
+            except OSError:
+                pass
+
+    def adopt_legacy(self, legacy_key, key):
+        """
+        Moves the flat pre-shard file `legacy_key`.mp3 (md5 of the text) to
+        `key`'s shard and indexes it there. The caller vouches that it was
+        made with the voice, model and settings `key` stands for. True if
+        there was such a file.
+        """
+        with self._lock:
+            entry = self._index.pop(LEGACY_PREFIX + legacy_key, None)
+            if entry is None:
+                return False
+            self.total_bytes -= entry[1]
+        path = self.path_for(key)
+        try:
+            os.replace(entry[0], path)
+        except OSError:
+            return False
+        with self._lock:
+            if key in self._index:
+                self.total_bytes -= self._index[key][1]
+            entry[0] = path
+            self._index[key] = entry
+            self._index.move_to_end(key)
+            self.total_bytes += entry[1]
+            self.counters['legacy_adopted'] += 1
+        return True
+
+    def stats(self):
+        with self._lock:
+            out = dict(self.counters)
+            out['entries'] = len(self._index)
+            out['bytes'] = self.total_bytes
+            out['max_bytes'] = self.max_bytes
+            out['hot_entries'] = len(self._hot)
+            out['hot_bytes'] = self._hot_bytes
+            lookups = out['hot_hits'] + out['disk_hits'] + out['misses']
+            out['hit_ratio'] = round((out['hot_hits'] + out['disk_hits']) / lookups, 3) if lookups else 0.0
+        return out
+
+    # --------------------------------------------
+    # Internals
+    # --------------------------------------------
+    def _scan(self):
+        """Builds the index from files already on disk, oldest access first."""
+        found = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if name.endswith('.part'):
+                    # Left behind by a crash mid-synthesis.
+                    if st.st_mtime < time.time() - 3600:
+                        os.remove(path)
+                    continue
+                if not name.endswith('.mp3'):
+                    continue
+                key = name[:-4]
+                if dirpath == self.root:
+                    # Flat file from the old md5(text) layout: the name doesn't
+                    # carry the voice/model/settings, so it can't be re-keyed
+                    # until its text comes up again (adopt_legacy).
+                    key = LEGACY_PREFIX + key
+                elif dirpath != os.path.join(self.root, key[:2], key[2:4]):
+                    continue
+                found.append((st.st_atime, key, path, st.st_size))
+        found.sort()
+        for atime, key, path, size in found:
+            self._index[key] = [path, size, atime, 0]
+            self.total_bytes += size
+        victims = self._pick_victims()
+        for path in victims:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _pick_victims(self):
+        """Pops least-recently-used entries until under budget (caller holds the lock)."""
+        victims = []
+        while self.total_bytes > self.max_bytes and len(self._index) > 1:
+            key, (path, size, _, _) = self._index.popitem(last=False)
+            self.total_bytes -= size
+            self.counters['evictions'] += 1
+            self.counters['evicted_bytes'] += size
+            data = self._hot.pop(key, None)
+            if data is not None:
+                self._hot_bytes -= len(data)
+            victims.append(path)
+        return victims
+
+    def _promote(self, key, data):
+        with self._lock:
+            if key in self._hot or key not in self._index:
+                return
+            self._hot[key] = data
+            self._hot_bytes += len(data)
+            while self._hot_bytes > self.hot_max_bytes and self._hot:
+                _, dropped = self._hot.popitem(last=False)
+                self._hot_bytes -= len(dropped)
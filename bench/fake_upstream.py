@@ -0,0 +1,205 @@
+"""
+Local stand-in for the MBTA V3 API, Google Directions and ElevenLabs.
+
+    python -m bench.fake_upstream --port 5900 --latency-ms 80 --jitter-ms 30 --error-rate 0.02
+
+Serves the recorded responses in bench/fixtures/. Every timestamp is
+shifted by (now - recorded_at), so predictions and Google departures
+always look like they were recorded a moment ago.
+
+Point the backend at it with:
+
+    MBTA_BASE_URL=http://127.0.0.1:5900
+    GOOGLE_BASE_URL=http://127.0.0.1:5900/maps/api/directions/json
+    ELEVENLABS_BASE_URL=http://127.0.0.1:5900
+
+Each request waits latency ± jitter before answering.
+- --error-rate: the share of requests that get a 503.
+- --throttle-rate: the share that get a 429 with Retry-After.
+- --tts-chunk-ms: ElevenLabs audio arrives in chunks this far apart.
+
+GET /_stats returns request counts per path, so a benchmark can report
+how many upstream calls its traffic caused.
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+TIME_KEYS = ('arrival_time', 'departure_time')
+TTS_BYTES_PER_CHAR = 400    # ~ a 128 kbps MP3 of speech
+TTS_CHUNK_BYTES = 4096
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, f'{name}.json')) as f:
+        fixture = json.load(f)
+    return datetime.fromisoformat(fixture['recorded_at']).timestamp(), fixture['response']
+
+
+def shift_times(obj, delta):
+    """Moves every arrival/departure time (ISO string or {'value': epoch}) forward by delta seconds."""
+    if isinstance(obj, list):
+        return [shift_times(item, delta) for item in obj]
+    if not isinstance(obj, dict):
+        return obj
+    out = {}
+    for key, value in obj.items():
+        if key in TIME_KEYS and isinstance(value, str):
+            out[key] = datetime.fromtimestamp(datetime.fromisoformat(value).timestamp() + delta).astimezone().isoformat()
+        elif key in TIME_KEYS and isinstance(value, dict) and 'value' in value:
+            out[key] = dict(value, value=int(value['value'] + delta))
+        else:
+            out[key] = shift_times(value, delta)
+    return out
+
+
+class FakeUpstream:
+    def __init__(self, latency_ms=50, jitter_ms=0, error_rate=0.0, throttle_rate=0.0, tts_chunk_ms=20):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.tts_chunk_ms = tts_chunk_ms
+        self.fixtures = {name: load_fixture(name)
+                         for name in ('stops', 'alerts', 'predictions', 'vehicles', 'directions')}
+        self._lock = threading.Lock()
+        self.counts = {}
+
+    def count(self, path, status):
+        with self._lock:
+            entry = self.counts.setdefault(path, {})
+            entry[status] = entry.get(status, 0) + 1
+
+    def delay(self):
+        ms = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if ms > 0:
+            time.sleep(ms / 1000)
+
+    def injected_failure(self):
+        """503 or 429 for the configured share of requests, else None."""
+        roll = random.random()
+        if roll < self.error_rate:
+            return 503
+        if roll < self.error_rate + self.throttle_rate:
+            return 429
+        return None
+
+    def body(self, name, query):
+        recorded_at, response = self.fixtures[name]
+        response = shift_times(response, time.time() - recorded_at)
+        if name == 'predictions' and 'filter[stop]' in query:
+            wanted = set(query['filter[stop]'][0].split(','))
+            parents = {s['id']: (s['relationships']['parent_station']['data'] or {}).get('id')
+                       for s in response.get('included', [])}
+            response['data'] = [
+                p for p in response['data']
+                if p['relationships']['stop']['data']['id'] in wanted
+                or parents.get(p['relationships']['stop']['data']['id']) in wanted
+            ]
+        return response
+
+
+def make_handler(fake):
+    routes = {
+        '/stops': 'stops',
+        '/alerts': 'alerts',
+        '/predictions': 'predictions',
+        '/vehicles': 'vehicles',
+        '/maps/api/directions/json': 'directions',
+    }
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'   # keep-alive, like the real APIs
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if url.path == '/_stats':
+                with fake._lock:
+                    return self._json(200, fake.counts, count=False)
+            name = routes.get(url.path)
+            if name is None:
+                return self._json(404, {'errors': [{'status': '404'}]})
+            fake.delay()
+            failure = fake.injected_failure()
+            if failure:
+                return self._json(failure, {'errors': [{'status': str(failure)}]})
+            self._json(200, fake.body(name, parse_qs(url.query)))
+
+        def do_POST(self):
+            url = urlsplit(self.path)
+            length = int(self.headers.get('Content-Length') or 0)
+            payload = json.loads(self.rfile.read(length) or b'{}')
+            if not (url.path.startswith('/v1/text-to-speech/') and url.path.endswith('/stream')):
+                return self._json(404, {'detail': 'not found'})
+            fake.delay()
+            failure = fake.injected_failure()
+            if failure:
+                return self._json(failure, {'detail': 'injected failure'})
+            self._stream_audio(url.path, len(payload.get('text', '')))
+
+        def _stream_audio(self, path, chars):
+            size = max(TTS_CHUNK_BYTES, chars * TTS_BYTES_PER_CHAR)
+            self.send_response(200)
+            self.send_header('Content-Type', 'audio/mpeg')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            sent = 0
+            while sent < size:
+                n = min(TTS_CHUNK_BYTES, size - sent)
+                self.wfile.write(f'{n:x}\r\n'.encode() + b'\xff' * n + b'\r\n')
+                self.wfile.flush()
+                sent += n
+                time.sleep(fake.tts_chunk_ms / 1000)
+            self.wfile.write(b'0\r\n\r\n')
+            fake.count(path.rsplit('/', 2)[0] + '/stream', 200)
+
+        def _json(self, status, body, count=True):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            if status == 429:
+                self.send_header('Retry-After', '1')
+            self.end_headers()
+            self.wfile.write(data)
+            if count:
+                fake.count(urlsplit(self.path).path, status)
+
+    return Handler
+
+
+def serve(port=5900, **options):
+    fake = FakeUpstream(**options)
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(fake))
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--port', type=int, default=5900)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--tts-chunk-ms', type=float, default=20)
+    args = parser.parse_args(argv)
+    server = serve(args.port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                   error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+                   tts_chunk_ms=args.tts_chunk_ms)
+    print(f"Fake upstream on http://127.0.0.1:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+"""
+Closed-loop load generator for the AccessiBus endpoints.
+
+    python -m bench.loadgen --duration 15 --concurrency 8 --out bench/results/latest.json
+    python -m bench.loadgen --compare bench/results/baseline.json --out bench/results/latest.json
+
+Each endpoint is driven on its own, so the numbers don't interfere with
+each other. --concurrency workers each send one request, read the whole
+body, and send the next, for --duration seconds. For every endpoint it
+reports requests, errors, RPS and p50/p95/p99 latency (time to the last
+byte). With --upstream pointing at bench/fake_upstream.py, it also
+reports the upstream calls made per client request.
+
+--compare checks the run against an earlier results file. The exit status
+is 1 if any endpoint's p95 or RPS regressed by more than --threshold.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+SERVER_URL = os.getenv('ACCESSIBUS_URL', 'http://127.0.0.1:5001')
+TTS_URL = os.getenv('TTS_URL', 'http://127.0.0.1:5000')
+
+TRIPS = [
+    {'origin': 'Park Street', 'destination': 'Harvard'},
+    {'origin': 'Downtown Crossing', 'destination': 'Harvard', 'walking_speed': 'slow'},
+    {'origin': {'lat': 42.3564, 'lng': -71.0624}, 'destination': 'Kendall/MIT', 'walking_speed': 'fast'},
+]
+STOPS = ['place-pktrm', 'place-dwnxg', 'place-sstat', 'place-harsq', 'place-state', 'place-gover']
+PHRASES = [
+    'Red Line arriving at Park Street',
+    'Board Red Line at Downtown Crossing',
+    'Departs in 4 min',
+    'Government Center elevator 910 unavailable',
+]
+
+
+def scenarios(server_url, tts_url):
+    """name -> function(session) returning a finished response."""
+    return {
+        'directions': lambda s: s.post(f'{server_url}/api/directions', json=random.choice(TRIPS)),
+        'predictions': lambda s: s.get(f'{server_url}/api/mbta/predictions/{random.choice(STOPS)}'),
+        'vehicles': lambda s: s.get(f'{server_url}/api/mbta/vehicles'),
+        'tts': lambda s: s.post(f'{tts_url}/stream-tts', json={'text': random.choice(PHRASES)}),
+    }
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def is_error(response):
+    if response.status_code != 200:
+        return True
+    if response.headers.get('Content-Type', '').startswith('application/json'):
+        try:
+            return response.json().get('success') is False
+        except ValueError:
+            return True
+    return False
+
+
+def run_endpoint(call, duration, concurrency):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def worker():
+        session = requests.Session()
+        mine, failed = [], 0
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            try:
+                response = call(session)
+                _ = response.content
+                bad = is_error(response)
+            except requests.RequestException:
+                bad = True
+            mine.append((time.perf_counter() - start) * 1000)
+            failed += bad
+        with lock:
+            latencies.extend(mine)
+            errors.append(failed)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    n = len(latencies)
+    return {
+        'requests': n,
+        'errors': sum(errors),
+        'rps': round(n / elapsed, 1) if elapsed else 0.0,
+        'mean_ms': round(sum(latencies) / n, 2) if n else None,
+        'p50_ms': _round(percentile(latencies, 50)),
+        'p95_ms': _round(percentile(latencies, 95)),
+        'p99_ms': _round(percentile(latencies, 99)),
+        'max_ms': _round(latencies[-1] if latencies else None),
+    }
+
+
+def upstream_calls(upstream_url):
+    """Total requests the fake upstream has seen so far (None without one)."""
+    if not upstream_url:
+        return None
+    counts = requests.get(f'{upstream_url}/_stats', timeout=5).json()
+    return sum(sum(by_status.values()) for by_status in counts.values())
+
+
+def compare(results, baseline, threshold):
+    """Prints per-endpoint deltas; returns the list of regressions."""
+    regressions = []
+    print(f"\n{'endpoint':<12} {'metric':<7} {'baseline':>10} {'now':>10} {'change':>8}")
+    for name, now in results['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(name)
+        if not before:
+            continue
+        for metric, worse_if_higher in (('p50_ms', True), ('p95_ms', True), ('p99_ms', True), ('rps', False)):
+            old, new = before.get(metric), now.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            flag = ''
+            if (change > threshold) if worse_if_higher else (change < -threshold):
+                flag = '  REGRESSION'
+                if metric in ('p95_ms', 'rps'):
+                    regressions.append(f'{name} {metric}')
+            print(f"{name:<12} {metric:<7} {old:>10} {new:>10} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--server', default=SERVER_URL)
+    parser.add_argument('--tts', default=TTS_URL)
+    parser.add_argument('--upstream', default=os.getenv('FAKE_UPSTREAM_URL'),
+                        help='fake upstream URL, to count upstream calls')
+    parser.add_argument('--endpoints', default='directions,predictions,vehicles,tts')
+    parser.add_argument('--duration', type=float, default=15)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--out')
+    parser.add_argument('--compare')
+    parser.add_argument('--threshold', type=float, default=0.10)
+    parser.add_argument('--label', default='')
+    args = parser.parse_args(argv)
+
+    available = scenarios(args.server, args.tts)
+    results = {
+        'meta': {
+            'label': args.label,
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'git_commit': _git_commit(),
+            'duration_s': args.duration,
+            'concurrency': args.concurrency,
+            'server': args.server,
+        },
+        'endpoints': {},
+    }
+
+    print(f"{'endpoint':<12} {'reqs':>7} {'err':>5} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8}  upstream/req")
+    for name in args.endpoints.split(','):
+        before = upstream_calls(args.upstream)
+        stats = run_endpoint(available[name], args.duration, args.concurrency)
+        after = upstream_calls(args.upstream)
+        if before is not None and stats['requests']:
+            stats['upstream_per_request'] = round((after - before) / stats['requests'], 3)
+        results['endpoints'][name] = stats
+        print(f"{name:<12} {stats['requests']:>7} {stats['errors']:>5} {stats['rps']:>8} "
+              f"{stats['p50_ms']:>8} {stats['p95_ms']:>8} {stats['p99_ms']:>8}  {stats.get('upstream_per_request', '-')}")
+
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"\nRegressed beyond {args.threshold:.0%}: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+def _round(value):
+    return round(value, 2) if value is not None else None
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""
+One-shot benchmark: fake upstream + backend + TTS service + load generator.
+
+    python -m bench.run --out bench/results/latest.json
+    python -m bench.run --asgi --latency-ms 120 --error-rate 0.02 --compare bench/results/baseline.json
+
+Starts bench/fake_upstream.py, then server.py (Flask, or asgi.py under
+uvicorn with --asgi) and textvoice.py, all pointed at the fake upstream.
+The TTS service gets a throwaway audio cache directory. The load generator
+then runs, and everything is shut down afterwards. Any option not listed
+here is passed straight to bench.loadgen.
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench import loadgen
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"nothing listening on port {port} after {timeout}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--asgi', action='store_true', help='serve the backend with uvicorn asgi:app')
+    parser.add_argument('--upstream-port', type=int, default=5900)
+    parser.add_argument('--server-port', type=int, default=5901)
+    parser.add_argument('--tts-port', type=int, default=5902)
+    parser.add_argument('--latency-ms', default='50')
+    parser.add_argument('--jitter-ms', default='10')
+    parser.add_argument('--error-rate', default='0')
+    parser.add_argument('--throttle-rate', default='0')
+    args, loadgen_args = parser.parse_known_args(argv)
+
+    upstream_url = f'http://127.0.0.1:{args.upstream_port}'
+    env = dict(
+        os.environ,
+        PYTHONPATH=REPO,
+        MBTA_BASE_URL=upstream_url,
+        GOOGLE_BASE_URL=f'{upstream_url}/maps/api/directions/json',
+        ELEVENLABS_BASE_URL=upstream_url,
+        ELEVENLABS_API_KEY='bench',
+        FAVORITES_PRECOMPUTE='0',   # no scheduler thread or favorites.db in the repo
+        PYTHONUNBUFFERED='1',
+    )
+    if args.asgi:
+        server_cmd = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', str(args.server_port),
+                      '--log-level', 'warning']
+    else:
+        server_cmd = [sys.executable, '-c',
+                      f'import server; server.app.run(port={args.server_port}, threaded=True)']
+    tts_cmd = [sys.executable, '-c', f'import textvoice; textvoice.app.run(port={args.tts_port}, threaded=True)']
+
+    logs = open(os.path.join(tempfile.gettempdir(), 'accessibus-bench.log'), 'w')
+    cache_dir = tempfile.TemporaryDirectory(prefix='accessibus-bench-')
+    procs = []
+    try:
+        procs.append(subprocess.Popen(
+            [sys.executable, '-m', 'bench.fake_upstream', '--port', str(args.upstream_port),
+             '--latency-ms', args.latency_ms, '--jitter-ms', args.jitter_ms,
+             '--error-rate', args.error_rate, '--throttle-rate', args.throttle_rate],
+            cwd=REPO, env=env, stdout=logs, stderr=subprocess.STDOUT))
+        procs.append(subprocess.Popen(server_cmd, cwd=REPO, env=env, stdout=logs, stderr=subprocess.STDOUT))
+        # textvoice keeps audio_cache/ in its working directory
+        procs.append(subprocess.Popen(tts_cmd, cwd=cache_dir.name, env=env, stdout=logs, stderr=subprocess.STDOUT))
+        for port in (args.upstream_port, args.server_port, args.tts_port):
+            wait_for_port(port)
+
+        label = 'asgi' if args.asgi else 'flask'
+        return loadgen.main([
+            '--server', f'http://127.0.0.1:{args.server_port}',
+            '--tts', f'http://127.0.0.1:{args.tts_port}',
+            '--upstream', upstream_url,
+            '--label', label,
+            *loadgen_args,
+        ])
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        cache_dir.cleanup()
+        logs.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
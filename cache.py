@@ -0,0 +1,215 @@
+"""
+In-process caches for upstream data.
+
+CachedResource wraps one upstream URL (e.g. MBTA /stops) with a TTL.
+Fresh copies are served straight from memory; once the TTL passes the
+stale copy keeps being served while a background thread revalidates it
+with If-None-Match / If-Modified-Since, so the MBTA API can answer with
+a cheap 304 instead of the full payload.
+
+LRUCache is a size-bounded key/value cache where every entry carries its
+own expiry time, used for responses that are keyed per request (Google
+Directions).
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import upstream
+from metrics import span
+from singleflight import flights, make_key
+
+
+class UpstreamError(Exception):
+    """Raised when an upstream call fails and no cached copy is available."""
+
+
+class CachedResource:
+    def __init__(self, name, url, parse, ttl, max_stale=None, params=None, headers=None, priority=None):
+        self.name = name
+        self.url = url
+        self.parse = parse            # raw JSON body -> whatever the endpoint serves
+        self.ttl = ttl                # seconds a copy counts as fresh
+        self.max_stale = max_stale if max_stale is not None else ttl * 10
+        self.params = params or {}
+        self.headers = headers or {}
+        self.priority = priority      # governor priority class for refreshes
+
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._data = None
+        self._etag = None
+        self._last_modified = None
+        self._fetched_at = 0.0
+        self.counters = {
+            'hits': 0,
+            'stale_hits': 0,
+            'misses': 0,
+            'not_modified': 0,
+            'refreshes': 0,
+            'errors': 0,
+        }
+
+    # --------------------------------------------
+    # Public API
+    # --------------------------------------------
+    def get(self):
+        """Returns the parsed data, fetching or revalidating as needed."""
+        with self._lock:
+            age = time.time() - self._fetched_at
+            has_data = self._fetched_at > 0
+            if has_data and age < self.ttl:
+                self.counters['hits'] += 1
+                return self._data
+            if has_data and age < self.ttl + self.max_stale:
+                self.counters['stale_hits'] += 1
+                if not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(target=self._background_refresh, daemon=True).start()
+                return self._data
+            self.counters['misses'] += 1
+
+        try:
+            # A cold cache under load would otherwise send one fetch per waiting client.
+            return flights.do(make_key(self.url, self.params), self.refresh)
+        except UpstreamError:
+            # Better an old list than an empty one.
+            with self._lock:
+                if has_data:
+                    return self._data
+            raise
+
+    @property
+    def warm(self):
+        """True if get() can answer without waiting on the upstream."""
+        with self._lock:
+            return self._fetched_at > 0 and time.time() - self._fetched_at < self.ttl + self.max_stale
+
+    @property
+    def fetched_at(self):
+        """When the current copy was fetched (0.0 if there is none)."""
+        with self._lock:
+            return self._fetched_at
+
+    def prime(self, data, fetched_at=None):
+        """Installs data fetched by another process (see snapshot.py), aged from fetched_at."""
+        with self._lock:
+            self._data = data
+            self._etag = None
+            self._last_modified = None
+            self._fetched_at = fetched_at or time.time()
+
+    def touch(self, fetched_at):
+        """Marks the current copy as re-confirmed at fetched_at (by another process)."""
+        with self._lock:
+            if self._data is not None:
+                self._fetched_at = max(self._fetched_at, fetched_at)
+
+    def refresh(self):
+        """Fetches from upstream now (conditionally, if we hold validators)."""
+        headers = dict(self.headers)
+        with self._lock:
+            if self._etag:
+                headers['If-None-Match'] = self._etag
+            if self._last_modified:
+                headers['If-Modified-Since'] = self._last_modified
+
+        try:
+            response = upstream.get(self.url, params=self.params, headers=headers, priority=self.priority)
+        except Exception as e:
+            self._count('errors')
+            raise UpstreamError(f"{self.name}: {e}")
+
+        if response.status_code == 304:
+            with self._lock:
+                self.counters['not_modified'] += 1
+                self._fetched_at = time.time()
+                return self._data
+
+        if response.status_code != 200:
+            self._count('errors')
+            raise UpstreamError(f"{self.name}: HTTP {response.status_code}")
+
+        with span('json_parse'):
+            data = self.parse(response.json())
+        with self._lock:
+            self._data = data
+            self._etag = response.headers.get('ETag')
+            self._last_modified = response.headers.get('Last-Modified')
+            self._fetched_at = time.time()
+        return data
+
+    def stats(self):
+        with self._lock:
+            out = dict(self.counters)
+            out['ttl'] = self.ttl
+            out['age'] = round(time.time() - self._fetched_at, 1) if self._fetched_at else None
+            total = out['hits'] + out['stale_hits'] + out['misses']
+            out['hit_ratio'] = round((out['hits'] + out['stale_hits']) / total, 3) if total else 0.0
+        return out
+
+    # --------------------------------------------
+    # Internals
+    # --------------------------------------------
+    def _background_refresh(self):
+        try:
+            self.refresh()
+            self._count('refreshes')
+        except UpstreamError as e:
+            print(f"Background refresh failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _count(self, key):
+        with self._lock:
+            self.counters[key] += 1
+
+
+class LRUCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (expires_at, value)
+        self.counters = {
+            'hits': 0,
+            'misses': 0,
+            'expired': 0,
+            'evictions': 0,
+        }
+
+    def get(self, key):
+        """Returns the cached value, or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.counters['misses'] += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                self.counters['expired'] += 1
+                self.counters['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.counters['hits'] += 1
+            return value
+
+    def set(self, key, value, ttl):
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    def stats(self):
+        with self._lock:
+            out = dict(self.counters)
+            out['size'] = len(self._entries)
+            out['maxsize'] = self.maxsize
+            total = out['hits'] + out['misses']
+            out['hit_ratio'] = round(out['hits'] / total, 3) if total else 0.0
+        return out
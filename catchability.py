@@ -0,0 +1,156 @@
+"""
+Vectorized catchability filter for Google Directions alternatives.
+
+A Google response is boiled down once into per-route arrays (metres walked
+before the first train, that train's departure, total trip duration).
+Catchability, the speed-adjusted arrival time and the ordering are then
+computed for every walking-speed profile at once as (profiles x routes)
+NumPy arrays, so comparing slow / normal / fast costs one upstream fetch
+and one pass instead of three requests.
+
+The arithmetic mirrors the original per-route loop exactly: integer walk
+seconds, a 60-second platform buffer, and Google's assumed 1.4 m/s pace
+as the baseline the duration is corrected from.
+"""
+from datetime import datetime
+
+import numpy as np
+
+import geometry
+from metrics import span
+
+PLATFORM_BUFFER = 60
+GOOGLE_WALK_SPEED = 1.4
+MAX_ROUTES = 3
+
+
+class RouteTable:
+    """Per-route numbers as arrays, plus the lazily built display parts."""
+
+    def __init__(self, res):
+        self.routes = res['routes']
+        n = len(self.routes)
+        self.walk_m = np.zeros(n)
+        self.depart_ts = np.zeros(n)
+        self.duration = np.zeros(n)
+        self.first_station = []
+        self._display = {}
+
+        for i, route in enumerate(self.routes):
+            leg = route['legs'][0]
+            first_station_name = "Destination"
+            # Only walking BEFORE the first train counts
+            for step in leg['steps']:
+                if step['travel_mode'] == 'WALKING':
+                    self.walk_m[i] += step['distance']['value']
+                elif step['travel_mode'] == 'TRANSIT':
+                    first_station_name = step['transit_details']['departure_stop']['name']
+                    self.depart_ts[i] = step['transit_details']['departure_time']['value']
+                    break
+            self.duration[i] = leg['duration']['value']
+            self.first_station.append(first_station_name)
+
+    def display(self, i):
+        """Summary and steps for route i (built once, shared by all profiles)."""
+        if i not in self._display:
+            with span('steps'):
+                self._display[i] = self._build_display(i)
+        return self._display[i]
+
+    def _build_display(self, i):
+        route = self.routes[i]
+        leg = route['legs'][0]
+        clean_steps = []
+        transit_lines = []
+        for step in leg['steps']:
+            if 'transit_details' in step:
+                transit = step['transit_details']
+                line_name = transit['line'].get('name', 'Transit')
+                depart_stop = transit['departure_stop']['name']
+                num_stops = transit.get('num_stops', 0)
+                if line_name not in transit_lines: transit_lines.append(line_name)
+                clean_steps.append({'instruction': f"Board <b>{line_name}</b> at {depart_stop}"})
+                clean_steps.append({'instruction': f"Ride {num_stops} stops"})
+            else:
+                clean_steps.append({'instruction': step['html_instructions']})
+
+        return {
+            'summary': "Via " + " & ".join(transit_lines) if transit_lines else "Walking Route",
+            'distance': leg['distance']['text'],
+            'steps': clean_steps,
+        }
+
+    def path(self, i, fmt='points', zoom=None):
+        """Route i's overview polyline in a responses.PATH_FORMATS format, simplified for `zoom`."""
+        route = self.routes[i]
+        if 'overview_polyline' not in route:
+            return '' if fmt == 'polyline' else []
+        return geometry.from_polyline(route['overview_polyline']['points']).path(fmt, zoom)
+
+
+def evaluate(table, speeds, now_ts):
+    """
+    Catchability for every (profile, route) pair.
+    speeds: walking speeds in m/s, one per profile.
+    Returns dict of (profiles x routes) arrays plus the per-profile ordering.
+    """
+    speeds = np.asarray(speeds, dtype=float)[:, None]
+    walk_s = np.trunc(table.walk_m[None, :] / speeds)
+    station_arrival = now_ts + walk_s
+
+    has_train = table.depart_ts > 0
+    catchable = ~has_train[None, :] | (station_arrival <= table.depart_ts[None, :] - PLATFORM_BUFFER)
+
+    delay_diff = walk_s - table.walk_m[None, :] / GOOGLE_WALK_SPEED
+    real_arrival = now_ts + table.duration[None, :] + delay_diff
+
+    # Earliest arrival first; uncatchable routes sink to the end and are cut.
+    sort_key = np.where(catchable, real_arrival, np.inf)
+    order = np.argsort(sort_key, axis=1, kind='stable')
+
+    return {
+        'walk_s': walk_s,
+        'station_arrival': station_arrival,
+        'catchable': catchable,
+        'real_arrival': real_arrival,
+        'real_duration_min': np.trunc((table.duration[None, :] + delay_diff) / 60),
+        'order': order,
+    }
+
+
+def routes_for_profile(table, result, p, now, path_format='points', zoom=None):
+    """Top catchable routes for profile row p, in the API's route shape."""
+    now_ts = now.timestamp()
+    routes = []
+    for i in result['order'][p]:
+        if len(routes) == MAX_ROUTES or not result['catchable'][p, i]:
+            break
+        i = int(i)
+        real_arrival_val = float(result['real_arrival'][p, i])
+        station_eta_text = datetime.fromtimestamp(float(result['station_arrival'][p, i])).strftime("%-I:%M %p")
+        diff_min = int((table.depart_ts[i] - now_ts) / 60)
+        display = table.display(i)
+        routes.append({
+            'id': i,
+            'sort_arrival': real_arrival_val, # We sort by when you get to the destination
+            'summary': display['summary'],
+            'distance': display['distance'],
+            'duration': f"{int(result['real_duration_min'][p, i])} min",
+            'time_range': f"Leave Now – {(datetime.fromtimestamp(real_arrival_val)).strftime('%-I:%M %p')}",
+            'countdown': f"Departs in {diff_min} min" if diff_min > 0 else "Now",
+            'station_eta': f"Reach {table.first_station[i]} by {station_eta_text}",
+            'steps': display['steps'],
+            'path': table.path(i, path_format, zoom)
+        })
+    return routes
+
+
+def catchable_routes_multi(res, speeds, now=None, path_format='points', zoom=None):
+    """Top routes for each speed in `speeds`, from a single Google response."""
+    now = now or datetime.now()
+    with span('filter'):
+        table = RouteTable(res)
+        if not table.routes:
+            return [[] for _ in speeds]
+        result = evaluate(table, speeds, now.timestamp())
+    return [routes_for_profile(table, result, p, now, path_format, zoom) for p in range(len(speeds))]
@@ -0,0 +1,310 @@
+"""
+Saved trips ("favorites") and the scheduler that keeps them ready.
+
+FavoritesStore keeps each user's saved origin/destination pairs in a
+local SQLite file, together with a walking-speed profile and the times
+of day they usually travel ("08:15", "17:40").
+
+Precomputer is a background thread that fetches the Google Directions
+answer for a favorite ahead of its travel times, from PRECOMPUTE_LEAD
+minutes before until TRAVEL_GRACE minutes after. It refetches every
+REFRESH_SECONDS inside that window. The raw answer is kept in memory for
+at most RESULT_TTL seconds, counted from when Google gave it (a fallback
+answer is already that old). GET /api/favorites only re-runs the
+catchability filter on it against the clock, so listing favorites never
+waits on an upstream call.
+Favorites without travel times have no window for the scheduler to use.
+They are queued for a background refresh when GET lists them with a
+stale (or no) answer, at most once per LISTED_REFRESH_SECONDS per user,
+so polling the list can't turn into a stream of Google calls.
+
+Fetches go out with the governor's 'background' priority, so they are
+the first thing dropped when the Google budget runs low. The same fetch
+fills the shared directions cache, so opening the trip in
+/api/directions is a cache hit as well.
+"""
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+from cache import UpstreamError
+
+MAX_FAVORITES_PER_USER = 20
+PRECOMPUTE_INTERVAL = int(os.getenv('PRECOMPUTE_INTERVAL', '60'))   # seconds between scheduler passes
+PRECOMPUTE_LEAD = int(os.getenv('PRECOMPUTE_LEAD_MIN', '30'))       # minutes before a travel time
+TRAVEL_GRACE = 15                                                  # minutes after it
+REFRESH_SECONDS = int(os.getenv('PRECOMPUTE_REFRESH', '300'))       # answer age that counts as stale
+RESULT_TTL = int(os.getenv('PRECOMPUTE_RESULT_TTL', '3600'))        # answer age after which it is dropped
+LISTED_REFRESH_SECONDS = int(os.getenv('PRECOMPUTE_LISTED_REFRESH', '300'))  # per user, see request_listed()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS favorites (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    name TEXT,
+    origin TEXT NOT NULL,              -- JSON: place name or {"lat", "lng"}
+    destination TEXT NOT NULL,         -- JSON, same shapes
+    walking_speed TEXT NOT NULL,       -- JSON: 'slow' / 'normal' / 'fast' or m/s
+    travel_times TEXT NOT NULL,        -- JSON list of local "HH:MM"
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS favorites_by_user ON favorites (user_id);
+"""
+
+
+class FavoriteError(ValueError):
+    """A favorite that can't be saved (missing field, bad time, too many)."""
+
+
+class FavoritesStore:
+    """SQLite-backed favorites, one connection shared behind a lock."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = None
+
+    def list(self, user_id):
+        rows = self._query("SELECT * FROM favorites WHERE user_id = ? ORDER BY id", (user_id,))
+        return [_favorite(row) for row in rows]
+
+    def all(self):
+        with self._lock:
+            if self._db is None and not os.path.exists(self.path):
+                return []   # nothing saved yet: don't create the file just to scan it
+        return [_favorite(row) for row in self._query("SELECT * FROM favorites ORDER BY id")]
+
+    def add(self, user_id, data):
+        """Validates and saves a favorite; returns it with its new id."""
+        if not data.get('origin') or not data.get('destination'):
+            raise FavoriteError('origin and destination are required')
+        origin, destination = _location(data['origin']), _location(data['destination'])
+        walking_speed = data.get('walking_speed', 'normal')
+        travel_times = [_parse_hhmm(t) for t in data.get('travel_times') or []]
+
+        with self._lock:
+            db = self._connect()
+            (count,) = db.execute("SELECT COUNT(*) FROM favorites WHERE user_id = ?", (user_id,)).fetchone()
+            if count >= MAX_FAVORITES_PER_USER:
+                raise FavoriteError(f"at most {MAX_FAVORITES_PER_USER} favorites per user")
+            cursor = db.execute(
+                "INSERT INTO favorites (user_id, name, origin, destination, walking_speed, travel_times, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (user_id, data.get('name'), json.dumps(origin), json.dumps(destination),
+                 json.dumps(walking_speed), json.dumps(travel_times), time.time()))
+            db.commit()
+            row = db.execute("SELECT * FROM favorites WHERE id = ?", (cursor.lastrowid,)).fetchone()
+        return _favorite(row)
+
+    def delete(self, user_id, favorite_id):
+        """True if the user had that favorite."""
+        with self._lock:
+            db = self._connect()
+            cursor = db.execute("DELETE FROM favorites WHERE id = ? AND user_id = ?", (favorite_id, user_id))
+            db.commit()
+        return cursor.rowcount > 0
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._connect().execute(sql, params).fetchall()
+
+    def _connect(self):
+        """Opens the database on first use (caller holds the lock)."""
+        if self._db is None:
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+            self._db = db
+        return self._db
+
+
+class Precomputer:
+    """
+    Background refresher of favorites' directions.
+    plan: favorite -> raw Google Directions response (may raise UpstreamError).
+    """
+
+    def __init__(self, store, plan, interval=PRECOMPUTE_INTERVAL):
+        self.store = store
+        self.plan = plan
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._results = {}      # favorite id -> (raw response, computed_at)
+        self._requested = {}    # favorite id -> favorite, refresh asap
+        self._listed = {}       # user id -> when a GET last queued refreshes
+        self._wake = threading.Event()
+        self._thread = None
+        self.counters = {'runs': 0, 'refreshes': 0, 'errors': 0}
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='favorites-precompute', daemon=True)
+                self._thread.start()
+
+    def result(self, favorite_id):
+        """(raw response, computed_at) or None if nothing was computed yet (or it expired)."""
+        with self._lock:
+            entry = self._results.get(favorite_id)
+            if entry is not None and time.time() - entry[1] >= RESULT_TTL:
+                del self._results[favorite_id]
+                return None
+            return entry
+
+    def is_stale(self, favorite_id, now=None):
+        entry = self.result(favorite_id)
+        return entry is None or (now or time.time()) - entry[1] >= REFRESH_SECONDS
+
+    def request(self, favorite):
+        """Asks for a refresh of `favorite` on the next pass, which starts right away."""
+        with self._lock:
+            self._requested[favorite['id']] = favorite
+        self._wake.set()
+
+    def request_listed(self, user_id, saved, now=None):
+        """
+        Queues the stale favorites without travel times that a GET just
+        listed, at most once per LISTED_REFRESH_SECONDS per user. Returns
+        how many were queued.
+        """
+        now = now or time.time()
+        stale = [f for f in saved if not f['travel_times'] and self.is_stale(f['id'], now)]
+        if not stale:
+            return 0
+        with self._lock:
+            if now - self._listed.get(user_id, 0.0) < LISTED_REFRESH_SECONDS:
+                return 0
+            self._listed[user_id] = now
+            for favorite in stale:
+                self._requested[favorite['id']] = favorite
+        self._wake.set()
+        return len(stale)
+
+    def forget(self, favorite_id):
+        with self._lock:
+            self._results.pop(favorite_id, None)
+            self._requested.pop(favorite_id, None)
+
+    def due(self, favorite, now):
+        """True when a favorite is inside one of its travel windows and its answer is stale."""
+        if not self.is_stale(favorite['id'], now.timestamp()):
+            return False
+        return any(_in_window(t, now) for t in favorite['travel_times'])
+
+    def stats(self):
+        with self._lock:
+            out = dict(self.counters)
+            out['ready'] = len(self._results)
+            out['queued'] = len(self._requested)
+        out['running'] = self._thread is not None
+        return out
+
+    # --------------------------------------------
+    # Internals
+    # --------------------------------------------
+    def _loop(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Favorites precompute failed: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def run_once(self, now=None):
+        """One scheduler pass: requested favorites first, then those in a travel window."""
+        now = now or datetime.now()
+        with self._lock:
+            requested, self._requested = self._requested, {}
+        due = dict(requested)
+        for favorite in self.store.all():
+            if favorite['id'] not in due and self.due(favorite, now):
+                due[favorite['id']] = favorite
+        with self._lock:
+            self.counters['runs'] += 1
+        for favorite in due.values():
+            try:
+                self._refresh(favorite)
+            except Exception as e:
+                # One bad favorite must not hold up everyone else's.
+                with self._lock:
+                    self.counters['errors'] += 1
+                print(f"Favorite {favorite['id']} not refreshed: {e}")
+        self._expire()
+
+    def _expire(self):
+        cutoff = time.time() - RESULT_TTL
+        with self._lock:
+            for favorite_id in [i for i, (_, at) in self._results.items() if at < cutoff]:
+                del self._results[favorite_id]
+            listed_cutoff = time.time() - LISTED_REFRESH_SECONDS
+            for user_id in [u for u, at in self._listed.items() if at < listed_cutoff]:
+                del self._listed[user_id]
+
+    def _refresh(self, favorite):
+        try:
+            res = self.plan(favorite)
+        except UpstreamError as e:
+            # Throttled or Google down: try again on a later pass.
+            with self._lock:
+                self.counters['errors'] += 1
+            print(f"Favorite {favorite['id']} not refreshed: {e}")
+            return
+        if res.get('status') != 'OK':
+            with self._lock:
+                self.counters['errors'] += 1
+            return
+        # A fallback answer (Google unavailable) is as old as its stale_s says.
+        computed_at = time.time() - res.get('stale_s', 0)
+        with self._lock:
+            self._results[favorite['id']] = (res, computed_at)
+            self.counters['refreshes'] += 1
+
+
+def _favorite(row):
+    return {
+        'id': row['id'],
+        'name': row['name'],
+        'origin': json.loads(row['origin']),
+        'destination': json.loads(row['destination']),
+        'walking_speed': json.loads(row['walking_speed']),
+        'travel_times': json.loads(row['travel_times']),
+        'created_at': row['created_at'],
+    }
+
+
+def _location(value):
+    """A place name, or {"lat", "lng"} with finite numbers (normalized to floats)."""
+    if isinstance(value, dict):
+        try:
+            lat, lng = float(value['lat']), float(value['lng'])
+        except (KeyError, TypeError, ValueError):
+            raise FavoriteError('coordinates need numeric lat and lng')
+        if not (math.isfinite(lat) and math.isfinite(lng)) or abs(lat) > 90 or abs(lng) > 180:
+            raise FavoriteError('coordinates are out of range')
+        return {'lat': lat, 'lng': lng}
+    if isinstance(value, str) and value.strip():
+        return value.strip()
+    raise FavoriteError('origin and destination must be a place name or {"lat", "lng"}')
+
+
+def _parse_hhmm(value):
+    try:
+        return datetime.strptime(str(value), '%H:%M').strftime('%H:%M')
+    except ValueError:
+        raise FavoriteError(f"travel time {value!r} is not HH:MM")
+
+
+def _in_window(hhmm, now):
+    """now falls within [hhmm - PRECOMPUTE_LEAD, hhmm + TRAVEL_GRACE] (checks yesterday/tomorrow for midnight)."""
+    t = datetime.strptime(hhmm, '%H:%M').time()
+    for day in (-1, 0, 1):
+        at = datetime.combine(now.date() + timedelta(days=day), t)
+        if at - timedelta(minutes=PRECOMPUTE_LEAD) <= now <= at + timedelta(minutes=TRAVEL_GRACE):
+            return True
+    return False
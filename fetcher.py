@@ -0,0 +1,37 @@
+"""
+Snapshot writer for multi-worker deployments.
+
+Runs the only upstream fetchers of the deployment: stations, alerts,
+vehicles and predictions (from the MBTA stream with MBTA_STREAMING=1,
+polled otherwise) are written to SNAPSHOT_PATH every SNAPSHOT_INTERVAL
+seconds. Start the web workers with SNAPSHOT_MODE=reader next to it:
+
+    python fetcher.py &
+    SNAPSHOT_MODE=reader gunicorn -w 4 -b :5001 server:app
+
+The last snapshot is written once more on Ctrl-C / SIGTERM, and read
+back on the next start.
+"""
+import os
+import signal
+import sys
+import threading
+
+os.environ['SNAPSHOT_MODE'] = 'writer'
+os.environ.setdefault('FAVORITES_PRECOMPUTE', '0')  # favorites are served by the workers
+
+import server  # noqa: E402  (reads SNAPSHOT_MODE on import)
+
+
+def main():
+    # SystemExit runs the atexit hook that persists the final snapshot.
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print(f"📸 Writing live MBTA snapshot to {server.SNAPSHOT_PATH} every {server.snapshot.SNAPSHOT_INTERVAL:g}s")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""
+Route geometry: decoded polylines, simplified per map zoom level.
+
+Google's overview polylines for the same corridors (Red Line Alewife to
+Park Street, the Green Line trunk) come back on request after request.
+Each distinct encoded string is decoded once, with NumPy instead of a
+per-character Python loop, into an (n, 2) float array. The result is
+kept in an LRU keyed on the encoded string.
+
+The first time a simplified copy is asked for, the line is ranked once
+with Douglas-Peucker: every point gets the largest tolerance (in metres)
+at which it would still be kept. Requests without a zoom never pay for
+this. Simplifying for a zoom level is then a mask over that ranking. The
+tolerance is PIXEL_TOLERANCE screen pixels at the zoom, and the result
+is computed once for each level in ZOOM_LEVELS. A request for zoom=z
+gets the first precomputed level at or above z, so it is never coarser
+than asked. Zooms past the last level get the full line.
+
+Formatted paths (points / flat / polyline, see responses.PATH_FORMATS)
+are cached per level as well, so they are shared between requests and
+must not be modified.
+"""
+import math
+import os
+import threading
+
+import numpy as np
+
+from cache import LRUCache
+from metrics import span
+
+PRECISION = 5                       # Google encodes 5 decimal places
+ZOOM_LEVELS = (11, 13, 15, 17)      # city-wide ... street level
+PIXEL_TOLERANCE = float(os.getenv('GEOMETRY_PIXEL_TOLERANCE', '1.0'))
+GEOMETRY_CACHE_SIZE = int(os.getenv('GEOMETRY_CACHE_SIZE', '500'))
+GEOMETRY_TTL = 86400                # corridors don't move; the LRU bound is what matters
+
+EARTH_M_PER_DEG = 111320.0
+WEB_MERCATOR_M_PER_PX = 156543.03   # metres per pixel at zoom 0 on the equator
+
+
+def decode(encoded):
+    """Google encoded polyline -> (n, 2) array of (lat, lng)."""
+    if not encoded:
+        return np.zeros((0, 2))
+    chunks = np.frombuffer(encoded.encode('ascii'), dtype=np.uint8).astype(np.int64) - 63
+    last = chunks < 0x20                        # final 5-bit chunk of each value
+    ends = np.flatnonzero(last)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    # Position of every chunk within its value -> its bit shift.
+    value_of_chunk = np.repeat(np.arange(len(ends)), ends - starts + 1)
+    shifts = 5 * (np.arange(len(chunks)) - starts[value_of_chunk])
+    values = np.add.reduceat((chunks & 0x1f) << shifts, starts)
+    deltas = np.where(values & 1, ~(values >> 1), values >> 1)
+    coords = np.cumsum(deltas.reshape(-1, 2), axis=0)
+    return coords / float(10 ** PRECISION)
+
+
+def encode(coords):
+    """(n, 2) array of (lat, lng) -> Google encoded polyline."""
+    if len(coords) == 0:
+        return ''
+    import polyline
+    return polyline.encode([(float(lat), float(lng)) for lat, lng in coords], PRECISION)
+
+
+def tolerance_m(zoom, lat):
+    """Metres covered by PIXEL_TOLERANCE pixels at this zoom and latitude."""
+    return PIXEL_TOLERANCE * WEB_MERCATOR_M_PER_PX * math.cos(math.radians(lat)) / 2 ** zoom
+
+
+def importance(coords):
+    """
+    Douglas-Peucker ranking: the largest tolerance (metres) at which each
+    point survives. The end points are always kept (inf).
+    """
+    n = len(coords)
+    ranks = np.full(n, np.inf)
+    if n < 3:
+        return ranks
+    # Local equirectangular metres; fine at city scale.
+    scale = np.array([EARTH_M_PER_DEG, EARTH_M_PER_DEG * math.cos(math.radians(coords[:, 0].mean()))])
+    xy = coords * scale
+    stack = [(0, n - 1, np.inf)]
+    while stack:
+        a, b, parent = stack.pop()
+        if b - a < 2:
+            continue
+        inner = xy[a + 1:b]
+        start, seg = xy[a], xy[b] - xy[a]
+        length = math.hypot(seg[0], seg[1])
+        if length == 0:
+            dist = np.hypot(inner[:, 0] - start[0], inner[:, 1] - start[1])
+        else:
+            dist = np.abs(seg[0] * (inner[:, 1] - start[1]) - seg[1] * (inner[:, 0] - start[0])) / length
+        k = int(np.argmax(dist))
+        # A point never outlives the split that made its segment.
+        rank = min(float(dist[k]), parent)
+        ranks[a + 1 + k] = rank
+        stack.append((a, a + 1 + k, rank))
+        stack.append((a + 1 + k, b, rank))
+    return ranks
+
+
+def zoom_level(zoom):
+    """The precomputed level serving `zoom` (None = full resolution)."""
+    if zoom is None:
+        return None
+    for level in ZOOM_LEVELS:
+        if zoom <= level:
+            return level
+    return None
+
+
+class Geometry:
+    """One line: full coordinates, simplified copies per zoom level, formatted paths."""
+
+    def __init__(self, coords, encoded=None):
+        self.coords = coords
+        self.encoded = encoded
+        self._lock = threading.Lock()
+        self._formatted = {}
+        self._levels = None
+
+    @property
+    def levels(self):
+        """Simplified copies per ZOOM_LEVELS entry, ranked on first use (full-resolution callers never pay for it)."""
+        with self._lock:
+            if self._levels is None:
+                ranks = importance(self.coords)
+                lat = float(self.coords[:, 0].mean()) if len(self.coords) else 0.0
+                self._levels = {level: self.coords[ranks >= tolerance_m(level, lat)] for level in ZOOM_LEVELS}
+            return self._levels
+
+    def at_zoom(self, zoom=None):
+        level = zoom_level(zoom)
+        return self.coords if level is None else self.levels[level]
+
+    def path(self, fmt='points', zoom=None):
+        """The line in a responses.PATH_FORMATS format, simplified for `zoom` (shared, read-only)."""
+        key = (fmt, zoom_level(zoom))
+        with self._lock:
+            if key in self._formatted:
+                return self._formatted[key]
+        coords = self.at_zoom(zoom)
+        if fmt == 'polyline':
+            path = self.encoded if key[1] is None and self.encoded is not None else encode(coords)
+        elif fmt == 'flat':
+            path = coords.ravel().tolist()
+        else:
+            path = [{'lat': lat, 'lng': lng} for lat, lng in coords.tolist()]
+        with self._lock:
+            self._formatted[key] = path
+        return path
+
+
+_cache = LRUCache(GEOMETRY_CACHE_SIZE)
+
+
+def from_polyline(encoded):
+    """The (cached) Geometry for a Google encoded polyline."""
+    geometry = _cache.get(encoded)
+    if geometry is None:
+        with span('polyline'):
+            geometry = Geometry(decode(encoded), encoded)
+        _cache.set(encoded, geometry, GEOMETRY_TTL)
+    return geometry
+
+
+def from_points(points):
+    """Geometry for a path of {'lat','lng'} dicts or (lat, lng) pairs (not cached)."""
+    coords = np.array([(p['lat'], p['lng']) if isinstance(p, dict) else (p[0], p[1]) for p in points],
+                      dtype=float).reshape(-1, 2)
+    return Geometry(coords)
+
+
+def stats():
+    return _cache.stats()
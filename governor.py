@@ -0,0 +1,286 @@
+"""
+Upstream quota governor and circuit breaker.
+
+The MBTA key has a per-minute request budget and every Google Directions
+call is billed, so each (host, API key) pair gets a token bucket refilled
+at its per-minute rate. Calls are tagged with a priority class, and each
+class may only spend tokens down to a reserve. As the budget runs low,
+alerts and station refreshes are refused first, then live predictions and
+vehicles. Directions can spend the last token.
+
+Each host also has a circuit breaker. After BREAKER_FAILURES consecutive
+failures (network errors, 5xx), or at once on a 429, calls to that host
+are refused outright for a cooldown (Retry-After when the upstream sent
+one). Callers then serve their
+last-known-good data instead of waiting on a failing upstream. After the
+cooldown, one probe request is let through; its success closes the
+circuit again.
+
+Refused calls raise Throttled or CircuitOpen (both Rejected) before
+anything goes on the wire. upstream.request() calls acquire() and
+report() around every request.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import deque
+
+# Requests per minute per (host, key); hosts not listed are not budgeted.
+RATE_LIMITS = {
+    'api-v3.mbta.com': int(os.getenv('MBTA_RATE_PER_MIN', '1000')),
+    'maps.googleapis.com': int(os.getenv('GOOGLE_RATE_PER_MIN', '100')),
+}
+BURST_SECONDS = 15          # bucket capacity, in seconds' worth of the rate
+
+# Share of the bucket each class must leave untouched, and how long it may
+# wait for a token before giving up (seconds).
+PRIORITIES = {
+    'directions': (0.0, 2.0),
+    'predictions': (0.1, 0.5),
+    'vehicles': (0.1, 0.5),
+    'alerts': (0.25, 0.0),
+    'stations': (0.25, 0.0),
+    'background': (0.5, 0.0),
+}
+DEFAULT_PRIORITY = 'alerts'
+
+BREAKER_FAILURES = int(os.getenv('BREAKER_FAILURES', '5'))
+BREAKER_COOLDOWN = float(os.getenv('BREAKER_COOLDOWN', '30'))
+
+
+class Rejected(Exception):
+    """The governor refused the call; nothing was sent upstream."""
+
+
+class Throttled(Rejected):
+    pass
+
+
+class CircuitOpen(Rejected):
+    pass
+
+
+class Budget:
+    """Token bucket for one (host, key), with per-priority reserves and usage metrics."""
+
+    def __init__(self, rate_per_min):
+        self.rate_per_min = rate_per_min
+        self.rate = rate_per_min / 60.0
+        self.capacity = max(1.0, self.rate * BURST_SECONDS)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._recent = deque()      # grant times within the last minute
+        self.granted = {}
+        self.throttled = {}
+        self.waited_s = 0.0
+
+    def reserve(self, priority):
+        """
+        Takes a token for `priority` if its reserve allows. Returns 0.0 on
+        success, otherwise the seconds until one would be available.
+        """
+        floor, _ = PRIORITIES.get(priority, PRIORITIES[DEFAULT_PRIORITY])
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            needed = 1.0 + floor * self.capacity
+            if self.tokens >= needed:
+                self.tokens -= 1.0
+                self.granted[priority] = self.granted.get(priority, 0) + 1
+                self._recent.append(now)
+                return 0.0
+            return (needed - self.tokens) / self.rate
+
+    def refuse(self, priority):
+        with self._lock:
+            self.throttled[priority] = self.throttled.get(priority, 0) + 1
+
+    def add_wait(self, seconds):
+        with self._lock:
+            self.waited_s += seconds
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            while self._recent and self._recent[0] < now - 60:
+                self._recent.popleft()
+            tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+            used = len(self._recent)
+            return {
+                'rate_per_min': self.rate_per_min,
+                'capacity': round(self.capacity, 1),
+                'tokens': round(tokens, 1),
+                'used_last_min': used,
+                'utilization': round(used / self.rate_per_min, 3) if self.rate_per_min else 0.0,
+                'granted': dict(self.granted),
+                'throttled': dict(self.throttled),
+                'waited_s': round(self.waited_s, 2),
+            }
+
+
+class CircuitBreaker:
+    """closed -> open (refuse everything) -> half_open (one probe) -> closed."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.state = 'closed'
+        self.failures = 0
+        self.open_until = 0.0
+        self.probing = False
+        self.counters = {'opened': 0, 'rejected': 0}
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() >= self.open_until:
+                self.state = 'half_open'
+            if self.state == 'half_open' and not self.probing:
+                self.probing = True
+                return True
+            self.counters['rejected'] += 1
+            return False
+
+    def release(self):
+        """Gives back an unused probe slot (the call was throttled before being sent)."""
+        with self._lock:
+            self.probing = False
+
+    def success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self.probing = False
+
+    def failure(self, cooldown=None):
+        """Counts a failure; opens at once if cooldown is given (e.g. Retry-After)."""
+        with self._lock:
+            self.failures += 1
+            self.probing = False
+            if cooldown is not None or self.state == 'half_open' or self.failures >= BREAKER_FAILURES:
+                if self.state != 'open':
+                    self.counters['opened'] += 1
+                self.state = 'open'
+                self.open_until = time.monotonic() + (cooldown if cooldown is not None else BREAKER_COOLDOWN)
+
+    def stats(self):
+        with self._lock:
+            out = dict(self.counters)
+            out['state'] = self.state
+            out['failures'] = self.failures
+            if self.state == 'open':
+                out['retry_in_s'] = round(max(0.0, self.open_until - time.monotonic()), 1)
+        return out
+
+
+_lock = threading.Lock()
+_budgets = {}
+_breakers = {}
+
+
+def _budget(host, key):
+    rate = RATE_LIMITS.get(host)
+    if not rate:
+        return None
+    # Hashed so distinct keys never share a bucket and stats don't leak them.
+    name = f"{host}:{hashlib.sha256(key.encode()).hexdigest()[:12]}" if key else host
+    with _lock:
+        if name not in _budgets:
+            _budgets[name] = Budget(rate)
+        return _budgets[name]
+
+
+def breaker(host):
+    with _lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker()
+        return _breakers[host]
+
+
+def check(host, key=None, priority=None):
+    """
+    Non-blocking admission check. Returns 0.0 when the call may go ahead,
+    the seconds to wait before asking again, or raises Rejected.
+    """
+    priority = priority or DEFAULT_PRIORITY
+    b = breaker(host)
+    if not b.allow():
+        raise CircuitOpen(f"{host}: circuit open")
+    budget = _budget(host, key)
+    if budget is not None:
+        wait = budget.reserve(priority)
+        if wait > 0:
+            b.release()
+            return wait
+    return 0.0
+
+
+def acquire(host, key=None, priority=None):
+    """Blocking admission: waits up to the priority's max wait for a token."""
+    priority = priority or DEFAULT_PRIORITY
+    _, max_wait = PRIORITIES.get(priority, PRIORITIES[DEFAULT_PRIORITY])
+    deadline = time.monotonic() + max_wait
+    while True:
+        wait = check(host, key, priority)
+        if wait == 0:
+            return
+        if time.monotonic() + wait > deadline:
+            throttle(host, key, priority)
+        waited(host, key, wait)
+        time.sleep(wait)
+
+
+def throttle(host, key, priority):
+    """Records a refusal and raises Throttled."""
+    budget = _budget(host, key)
+    if budget is not None:
+        budget.refuse(priority or DEFAULT_PRIORITY)
+    raise Throttled(f"{host}: {priority or DEFAULT_PRIORITY} budget exhausted")
+
+
+def report(host, status_code=None, retry_after=None):
+    """Feeds a request's outcome to the host's breaker (status_code None = no response)."""
+    b = breaker(host)
+    if status_code == 429:
+        b.failure(cooldown=_seconds(retry_after) or BREAKER_COOLDOWN)
+    elif status_code is None or status_code >= 500:
+        b.failure()
+    else:
+        b.success()
+
+
+def release(host):
+    """The admitted call never completed (cancelled); frees a half-open probe slot."""
+    breaker(host).release()
+
+
+def trip(host, cooldown=None):
+    """Opens a host's breaker from outside (e.g. Google's OVER_QUERY_LIMIT in a 200 body)."""
+    breaker(host).failure(cooldown=cooldown or BREAKER_COOLDOWN)
+
+
+def stats():
+    """Budget consumption per (host, key) and breaker state per host."""
+    with _lock:
+        budgets = dict(_budgets)
+        breakers = dict(_breakers)
+    return {
+        'budgets': {name: b.stats() for name, b in budgets.items()},
+        'breakers': {host: b.stats() for host, b in breakers.items()},
+    }
+
+
+def waited(host, key, seconds):
+    budget = _budget(host, key)
+    if budget is not None:
+        budget.add_wait(seconds)
+
+
+def _seconds(retry_after):
+    try:
+        return float(retry_after)
+    except (TypeError, ValueError):
+        return None
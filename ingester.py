@@ -0,0 +1,261 @@
+"""
+Background MBTA streaming ingester.
+
+The MBTA V3 API can push resources as a text/event-stream instead of being
+polled. Each stream sends one `reset` event with the full current set, then
+`add` / `update` / `remove` events as things change. We keep one streaming
+connection per resource (vehicles, predictions), apply those events to an
+in-memory LiveStore, and the Flask endpoints read from the store instead of
+calling the API once per client.
+
+For tests and offline development, FixtureSource replays a recorded
+event-stream file through the exact same code path. A file that starts
+with a `: recorded_at <ISO time>` comment has its arrival/departure
+times moved forward by (now - recorded_at), so predictions replayed
+later still look current.
+"""
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import upstream
+
+
+class LiveStore:
+    """JSON:API resources from one stream, keyed by (type, id)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._resources = {}
+        self.ready = False          # True once the first reset has arrived
+        self.updated_at = 0.0
+        self.version = 0
+        self.listeners = []         # called with (event, resources) after each change
+        self.counters = {'reset': 0, 'add': 0, 'update': 0, 'remove': 0}
+
+    def apply(self, event, data):
+        """Applies one decoded event-stream message."""
+        if event not in self.counters:
+            return
+        items = data if isinstance(data, list) else [data]
+        with self._lock:
+            if event == 'reset':
+                self._resources = {(r['type'], r['id']): r for r in items}
+                self.ready = True
+            elif event in ('add', 'update'):
+                for r in items:
+                    self._resources[(r['type'], r['id'])] = r
+            else:
+                for r in items:
+                    self._resources.pop((r['type'], r['id']), None)
+            self.counters[event] += 1
+            self.updated_at = time.time()
+            self.version += 1
+        for listener in self.listeners:
+            listener(event, items)
+
+    def all(self, resource_type):
+        with self._lock:
+            return [r for (t, _), r in self._resources.items() if t == resource_type]
+
+    def get(self, resource_type, resource_id):
+        with self._lock:
+            return self._resources.get((resource_type, resource_id))
+
+    def stats(self):
+        with self._lock:
+            out = dict(self.counters)
+            out['ready'] = self.ready
+            out['resources'] = len(self._resources)
+            out['age'] = round(time.time() - self.updated_at, 1) if self.updated_at else None
+        return out
+
+
+def parse_events(lines):
+    """Turns raw event-stream lines into (event, decoded_data) pairs."""
+    event = None
+    data_lines = []
+    for raw in lines:
+        line = raw.decode('utf-8') if isinstance(raw, bytes) else raw
+        line = line.rstrip('\r\n')
+        if not line:
+            if event and data_lines:
+                yield event, json.loads('\n'.join(data_lines))
+            event = None
+            data_lines = []
+        elif line.startswith(':'):
+            continue  # keep-alive comment
+        elif line.startswith('event:'):
+            event = line[6:].strip()
+        elif line.startswith('data:'):
+            data_lines.append(line[5:].lstrip())
+    if event and data_lines:
+        yield event, json.loads('\n'.join(data_lines))
+
+
+class HTTPSource:
+    """A live text/event-stream connection to the MBTA API."""
+
+    def __init__(self, url, params=None, headers=None, read_timeout=60):
+        self.url = url
+        self.params = params or {}
+        self.headers = dict(headers or {})
+        self.headers['Accept'] = 'text/event-stream'
+        self.read_timeout = read_timeout
+
+    def lines(self):
+        response = upstream.get(
+            self.url,
+            params=self.params,
+            headers=self.headers,
+            stream=True,
+            timeout=(upstream.CONNECT_TIMEOUT, self.read_timeout),
+            priority='predictions',  # one connection replaces a stream of polls
+        )
+        if response.status_code != 200:
+            response.close()
+            raise ConnectionError(f"HTTP {response.status_code} from {self.url}")
+        try:
+            yield from response.iter_lines()
+        finally:
+            response.close()
+
+
+class FixtureSource:
+    """Replays a recorded event-stream file. `delay` spaces out events (seconds)."""
+
+    RECORDED_AT = ': recorded_at '
+
+    def __init__(self, path, delay=0.0, now=None):
+        self.path = path
+        self.delay = delay
+        self.now = now          # replay clock (epoch seconds); time.time() when None
+
+    def lines(self):
+        shift = 0.0
+        with open(self.path) as f:
+            for line in f:
+                if line.startswith(self.RECORDED_AT):
+                    recorded_at = datetime.fromisoformat(line[len(self.RECORDED_AT):].strip()).timestamp()
+                    shift = (self.now if self.now is not None else time.time()) - recorded_at
+                elif shift and line.startswith('data:'):
+                    line = 'data: ' + json.dumps(_shift_times(json.loads(line[5:]), shift)) + '\n'
+                yield line
+                if self.delay and not line.strip():
+                    time.sleep(self.delay)
+
+
+def _shift_times(obj, delta):
+    """Moves every ISO arrival_time/departure_time in a JSON:API document forward by delta seconds."""
+    if isinstance(obj, list):
+        return [_shift_times(item, delta) for item in obj]
+    if not isinstance(obj, dict):
+        return obj
+    out = {}
+    for key, value in obj.items():
+        if key in ('arrival_time', 'departure_time') and isinstance(value, str):
+            moved = datetime.fromisoformat(value).timestamp() + delta
+            out[key] = datetime.fromtimestamp(moved).astimezone().isoformat()
+        else:
+            out[key] = _shift_times(value, delta)
+    return out
+
+
+class StreamIngester:
+    """Keeps one source flowing into one LiveStore, reconnecting on failure."""
+
+    def __init__(self, name, source, store, reconnect=True):
+        self.name = name
+        self.source = source
+        self.store = store
+        self.reconnect = reconnect
+        self.connects = 0
+        self.errors = 0
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f'ingest-{self.name}', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def run_once(self):
+        """Consumes the source until it ends. Used directly by fixture replays."""
+        self.connects += 1
+        for event, data in parse_events(self.source.lines()):
+            if self._stop.is_set():
+                return
+            self.store.apply(event, data)
+
+    def _run(self):
+        backoff = 1
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+                backoff = 1
+            except Exception as e:
+                self.errors += 1
+                print(f"📡 Stream {self.name} dropped: {e}")
+            if not self.reconnect:
+                return
+            # Until the next reset arrives the store may be missing events;
+            # endpoints fall back to polling in the meantime.
+            self.store.ready = False
+            self._stop.wait(backoff)
+            backoff = min(backoff * 2, 60)
+
+    def stats(self):
+        out = self.store.stats()
+        out['connects'] = self.connects
+        out['errors'] = self.errors
+        return out
+
+
+# ============================================
+# Process-wide live state
+# ============================================
+SUBWAY_ROUTES = "Red,Orange,Blue,Green-B,Green-C,Green-D,Green-E"
+
+vehicles = LiveStore()
+predictions = LiveStore()
+ingesters = {}
+
+
+def start(base_url, api_key, fixtures_dir=None):
+    """
+    Starts the vehicles and predictions streams. With `fixtures_dir`, replays
+    vehicles.sse / predictions.sse from that directory instead of the API.
+    """
+    if ingesters:
+        return ingesters
+    if fixtures_dir:
+        sources = {
+            'vehicles': FixtureSource(os.path.join(fixtures_dir, 'vehicles.sse')),
+            'predictions': FixtureSource(os.path.join(fixtures_dir, 'predictions.sse')),
+        }
+    else:
+        headers = {'x-api-key': api_key}
+        sources = {
+            'vehicles': HTTPSource(f'{base_url}/vehicles', {
+                'filter[route]': SUBWAY_ROUTES,
+                'include': 'route'
+            }, headers),
+            'predictions': HTTPSource(f'{base_url}/predictions', {
+                'filter[route]': SUBWAY_ROUTES,
+                'include': 'stop'
+            }, headers),
+        }
+    stores = {'vehicles': vehicles, 'predictions': predictions}
+    for name, source in sources.items():
+        ingesters[name] = StreamIngester(name, source, stores[name], reconnect=not fixtures_dir).start()
+    return ingesters
+
+
+def stats():
+    return {name: ing.stats() for name, ing in ingesters.items()}
@@ -0,0 +1,221 @@
+"""
+Per-request timing and Prometheus-style metrics.
+
+Every request gets a trace. Hot-path code wraps its phases in
+span('upstream'), span('json_parse'), span('filter'), span('serialize'),
+and so on. The time spent in each phase is added to the trace of the
+request it runs for (code running outside a request records nothing).
+When the request finishes:
+
+- its total time goes into the request_seconds histogram, labelled by
+  endpoint, method and status;
+- each phase's share goes into span_seconds, labelled by endpoint and
+  span;
+- the breakdown is returned to the client in a Server-Timing header,
+  which browser dev tools show next to the request;
+- requests slower than SLOW_REQUEST_MS are printed with their breakdown.
+
+upstream.py also records every upstream call in upstream_seconds, per
+host and status. render() writes all of it in the Prometheus text
+format, plus whatever gauges the app collects from its caches at scrape
+time. server.py and textvoice.py expose that at /metrics.
+"""
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+PREFIX = 'accessibus_'
+# Latency buckets in seconds, from a cache hit to a slow Google call.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOW_REQUEST_MS = float(os.getenv('SLOW_REQUEST_MS', '1000'))
+
+HELP = {
+    'request_seconds': 'Time to answer a request (to the first byte for streamed responses).',
+    'span_seconds': 'Time a request spent in each phase (upstream, json_parse, filter, serialize, ...).',
+    'upstream_seconds': 'Upstream HTTP calls by host and status ("error" when no response came back).',
+}
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram (thread-safe)."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.sum += value
+            self.count += 1
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+
+    def snapshot(self):
+        """(cumulative bucket counts, sum, count)."""
+        with self._lock:
+            counts, total, n = list(self.counts), self.sum, self.count
+        cumulative, running = [], 0
+        for c in counts:
+            running += c
+            cumulative.append(running)
+        return cumulative, total, n
+
+
+class Trace:
+    """The phases of one request: span name -> [seconds, calls]."""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.spans = {}
+
+    def add(self, name, seconds):
+        entry = self.spans.get(name)
+        if entry is None:
+            self.spans[name] = [seconds, 1]
+        else:
+            entry[0] += seconds
+            entry[1] += 1
+
+    def server_timing(self, total):
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, (seconds, _) in self.spans.items()]
+        parts.append(f"total;dur={total * 1000:.1f}")
+        return ', '.join(parts)
+
+    def breakdown(self):
+        return ' '.join(f"{name}={seconds * 1000:.0f}ms" + (f"/{calls}" if calls > 1 else '')
+                        for name, (seconds, calls) in self.spans.items())
+
+
+_current = contextvars.ContextVar('metrics_trace', default=None)
+_lock = threading.Lock()
+_histograms = {}    # (name, sorted label items) -> Histogram
+
+
+def observe(name, seconds, **labels):
+    """Adds one observation to the `name` histogram for these labels."""
+    key = (name, tuple(sorted(labels.items())))
+    histogram = _histograms.get(key)
+    if histogram is None:
+        with _lock:
+            histogram = _histograms.setdefault(key, Histogram())
+    histogram.observe(seconds)
+
+
+@contextmanager
+def span(name):
+    """Times the block as phase `name` of the current request (no-op outside one)."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, time.perf_counter() - start)
+
+
+def begin(endpoint):
+    """Starts the trace for a request; returns the token to pass to finish()."""
+    return _current.set(Trace(endpoint or 'unmatched'))
+
+
+def finish(token, method, status, path=None):
+    """Records the request's metrics; returns its Server-Timing header value."""
+    trace = token.var.get()
+    _current.reset(token)
+    if trace is None:
+        return None
+    total = time.perf_counter() - trace.started
+    observe('request_seconds', total, endpoint=trace.endpoint, method=method, status=str(status))
+    for name, (seconds, _) in trace.spans.items():
+        observe('span_seconds', seconds, endpoint=trace.endpoint, span=name)
+    if total * 1000 >= SLOW_REQUEST_MS:
+        print(f"Slow request: {method} {path or trace.endpoint} {status} {total * 1000:.0f}ms {trace.breakdown()}")
+    return trace.server_timing(total)
+
+
+def instrument(app):
+    """Traces every request of a Flask app and adds the Server-Timing header."""
+    from flask import g, request
+
+    @app.before_request
+    def _begin_trace():
+        g.metrics_token = begin(request.endpoint)
+
+    # Registered first, so Flask runs it after the app's own after_request hooks
+    # (compression included).
+    @app.after_request
+    def _finish_trace(response):
+        token = g.pop('metrics_token', None)
+        if token is not None:
+            timing = finish(token, request.method, response.status_code, request.path)
+            if timing:
+                response.headers['Server-Timing'] = timing
+        return response
+
+    return app
+
+
+# ============================================
+# Prometheus text format
+# ============================================
+
+def render(families=()):
+    """
+    Every histogram, plus `families` of gauges/counters collected by the
+    caller: (name, 'gauge' or 'counter', help, [(labels dict, value), ...]).
+    """
+    with _lock:
+        items = sorted(_histograms.items())
+    lines = []
+    last = None
+    for (name, labels), histogram in items:
+        full = PREFIX + name
+        if name != last:
+            lines.append(f"# HELP {full} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {full} histogram")
+            last = name
+        cumulative, total, n = histogram.snapshot()
+        for bound, count in zip(histogram.buckets, cumulative):
+            lines.append(f"{full}_bucket{_labels(labels, le=_number(bound))} {count}")
+        lines.append(f"{full}_bucket{_labels(labels, le='+Inf')} {n}")
+        lines.append(f"{full}_sum{_labels(labels)} {_number(total)}")
+        lines.append(f"{full}_count{_labels(labels)} {n}")
+
+    for name, kind, help_text, samples in families:
+        full = PREFIX + name
+        lines.append(f"# HELP {full} {help_text}")
+        lines.append(f"# TYPE {full} {kind}")
+        for labels, value in samples:
+            if value is None:
+                continue
+            lines.append(f"{full}{_labels(sorted(labels.items()))} {_number(value)}")
+    return '\n'.join(lines) + '\n'
+
+
+def _labels(items, **extra):
+    pairs = list(items) + list(extra.items())
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int):
+        return str(value)
+    return repr(round(float(value), 6))
@@ -0,0 +1,204 @@
+"""
+Indexed in-memory store of MBTA predictions.
+
+Each prediction is parsed once when it arrives (ISO timestamp -> epoch
+seconds) and filed under its stop, its parent station, and every
+(stop, route, direction) combination, each list kept sorted by time.
+Answering "next N trains at these stops" is then a dict lookup and a
+slice, with only the minutes-until countdown computed per request.
+"""
+import bisect
+import threading
+import time
+from datetime import datetime
+
+# Predictions this far in the past are no longer listed (matters when the
+# store is serving last-known-good data while the MBTA can't be reached).
+DEPARTED_GRACE = 60
+
+
+class Prediction:
+    __slots__ = ('id', 'stop_id', 'route', 'direction_id', 'epoch', 'status')
+
+    def __init__(self, id, stop_id, route, direction_id, epoch, status):
+        self.id = id
+        self.stop_id = stop_id
+        self.route = route
+        self.direction_id = direction_id
+        self.epoch = epoch
+        self.status = status
+
+    def __lt__(self, other):
+        return (self.epoch, self.id) < (other.epoch, other.id)
+
+    def to_dict(self, now):
+        return {
+            'id': self.id,
+            'route': self.route,
+            'destination': "Outbound" if self.direction_id == 0 else "Inbound",
+            'minutes': max(0, int((self.epoch - now) / 60)),
+            'status': self.status
+        }
+
+
+def from_resource(pred):
+    """Builds a Prediction from a JSON:API prediction resource (None if untimed)."""
+    attrs = pred['attributes']
+    target_time = attrs.get('arrival_time') or attrs.get('departure_time')
+    if not target_time:
+        return None
+    rels = pred.get('relationships', {})
+    route_id = "Subway"
+    if 'route' in rels and rels['route'].get('data'):
+        route_id = rels['route']['data']['id']
+    stop_id = rels['stop']['data']['id'] if rels.get('stop', {}).get('data') else None
+    epoch = datetime.fromisoformat(target_time.replace('Z', '+00:00')).timestamp()
+    return Prediction(pred['id'], stop_id, route_id, attrs['direction_id'], epoch,
+                      attrs.get('status', 'On Time'))
+
+
+def parent_of(stop):
+    """Parent station id of a JSON:API stop resource, if it has one."""
+    data = (stop.get('relationships', {}).get('parent_station') or {}).get('data')
+    return data['id'] if data else None
+
+
+class PredictionStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_id = {}
+        self._index = {}        # (stop, route|None, direction|None) -> sorted [Prediction]
+        self._parents = {}      # child stop id -> parent station id
+        self._fresh = {}        # stop id -> time it was last loaded by polling
+
+    # --------------------------------------------
+    # Writes
+    # --------------------------------------------
+    def set_parent(self, stop_id, parent_id):
+        with self._lock:
+            if not parent_id or self._parents.get(stop_id) == parent_id:
+                return
+            # Re-file anything already indexed under the old parent (or none).
+            moved = [p for p in self._by_id.values() if p.stop_id == stop_id]
+            for p in moved:
+                self._unindex(p)
+            self._parents[stop_id] = parent_id
+            for p in moved:
+                self._insert(p)
+
+    def upsert(self, prediction):
+        with self._lock:
+            old = self._by_id.get(prediction.id)
+            if old is not None:
+                self._unindex(old)
+            self._by_id[prediction.id] = prediction
+            self._insert(prediction)
+
+    def remove(self, prediction_id):
+        with self._lock:
+            old = self._by_id.pop(prediction_id, None)
+            if old is not None:
+                self._unindex(old)
+
+    def reset(self, predictions):
+        with self._lock:
+            self._by_id = {}
+            self._index = {}
+            self._fresh = {}
+            for p in predictions:
+                self._by_id[p.id] = p
+                self._insert(p)
+
+    def replace_stops(self, stop_ids, predictions):
+        """Swaps in a fresh polled result for `stop_ids` (REST fallback mode)."""
+        now = time.time()
+        with self._lock:
+            for stop_id in stop_ids:
+                for p in list(self._index.get((stop_id, None, None), [])):
+                    self._by_id.pop(p.id, None)
+                    self._unindex(p)
+                self._fresh[stop_id] = now
+            for p in predictions:
+                old = self._by_id.get(p.id)
+                if old is not None:
+                    self._unindex(old)
+                self._by_id[p.id] = p
+                self._insert(p)
+
+    # --------------------------------------------
+    # Reads
+    # --------------------------------------------
+    def stale_stops(self, stop_ids, max_age):
+        """Which of `stop_ids` were not polled within the last `max_age` seconds."""
+        cutoff = time.time() - max_age
+        with self._lock:
+            return [s for s in stop_ids if self._fresh.get(s, 0) < cutoff]
+
+    def next_departures(self, stop_id, limit=5, route=None, direction_id=None, now=None):
+        now = now or time.time()
+        with self._lock:
+            found = self._index.get((stop_id, route, direction_id), [])
+            start = bisect.bisect_left(found, now - DEPARTED_GRACE, key=lambda p: p.epoch)
+            found = found[start:start + max(0, limit)]
+        return [p.to_dict(now) for p in found]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'predictions': len(self._by_id),
+                'index_keys': len(self._index),
+                'stops': len({k[0] for k in self._index}),
+            }
+
+    # --------------------------------------------
+    # Index maintenance (caller holds the lock)
+    # --------------------------------------------
+    def _keys(self, p):
+        stops = [p.stop_id]
+        parent = self._parents.get(p.stop_id)
+        if parent:
+            stops.append(parent)
+        for stop in stops:
+            yield (stop, None, None)
+            yield (stop, p.route, None)
+            yield (stop, None, p.direction_id)
+            yield (stop, p.route, p.direction_id)
+
+    def _insert(self, p):
+        for key in self._keys(p):
+            bisect.insort(self._index.setdefault(key, []), p)
+
+    def _unindex(self, p):
+        for key in self._keys(p):
+            bucket = self._index.get(key)
+            if not bucket:
+                continue
+            i = bisect.bisect_left(bucket, p)
+            if i < len(bucket) and bucket[i] is p:
+                del bucket[i]
+            elif p in bucket:
+                bucket.remove(p)
+            if not bucket:
+                del self._index[key]
+
+
+def apply_stream_event(store, event, items):
+    """Mirrors one MBTA stream event (see ingester.LiveStore) into a PredictionStore."""
+    if event == 'reset':
+        for r in items:
+            if r['type'] == 'stop':
+                store.set_parent(r['id'], parent_of(r))
+        store.reset([p for p in (from_resource(r) for r in items if r['type'] == 'prediction') if p])
+        return
+    for r in items:
+        if r['type'] == 'stop' and event != 'remove':
+            store.set_parent(r['id'], parent_of(r))
+        elif r['type'] == 'prediction':
+            if event == 'remove':
+                store.remove(r['id'])
+            else:
+                p = from_resource(r)
+                if p is None:
+                    store.remove(r['id'])
+                else:
+                    store.upsert(p)
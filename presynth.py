@@ -0,0 +1,183 @@
+"""
+Pre-synthesis for predictable announcements.
+
+Almost everything the frontend reads aloud is formulaic: station names,
+"Board Red Line at Park Street", "Departs in 4 min", alert headers. This
+module knows those shapes:
+
+- TEMPLATES describe sentences that can be stitched together from
+  separately cached segments ("<line> arriving at <station>").
+- collect_phrases() enumerates every segment and common sentence from
+  the AccessiBus station list and current alerts.
+- WarmupJob synthesizes whatever isn't cached yet through a small worker
+  pool, rate limited so a cold start doesn't burst through the
+  ElevenLabs quota.
+
+textvoice.py wires this to its cache (POST /tts-warmup, TTS_PRESYNTH=1).
+"""
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import upstream
+
+SERVER_URL = os.getenv("ACCESSIBUS_URL", "http://localhost:5001")
+WORKERS = int(os.getenv("PRESYNTH_WORKERS", "3"))
+RATE_PER_SEC = float(os.getenv("PRESYNTH_RATE", "2"))
+MAX_MINUTES = 30
+
+LINES = ["Red Line", "Orange Line", "Blue Line", "Green Line"]
+
+
+class Template:
+    """A sentence with {slots}; each slot and each fixed piece is one cached segment."""
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.parts = [p for p in re.split(r'(\{\w+\})', pattern) if p.strip()]
+        regex = ''.join(
+            f'(?P<{p[1:-1]}>.+?)' if p.startswith('{') else re.escape(p)
+            for p in re.split(r'(\{\w+\})', pattern)
+        )
+        self.regex = re.compile(f'^{regex}$')
+
+    def literals(self):
+        return [p.strip() for p in self.parts if not p.startswith('{')]
+
+    def segments(self, text):
+        """The segment texts for `text`, or None if it doesn't fit this template."""
+        match = self.regex.match(text.strip().rstrip('.'))
+        if not match:
+            return None
+        return [match.group(p[1:-1]).strip() if p.startswith('{') else p.strip() for p in self.parts]
+
+
+TEMPLATES = [
+    Template("{line} arriving at {station}"),
+    Template("Board {line} at {station}"),
+    Template("Departs in {minutes} min"),
+]
+
+
+def collect_phrases(stations=None, alerts=None):
+    """Every phrase worth having cached, most reusable first, without duplicates."""
+    if stations is None:
+        stations = _fetch('/api/mbta/stations')
+    if alerts is None:
+        alerts = _fetch('/api/mbta/alerts')
+
+    names = sorted({s['name'] for s in stations})
+    phrases = []
+    # Segments the stitching templates are built from
+    for template in TEMPLATES:
+        phrases += template.literals()
+    phrases += LINES
+    phrases += names
+    phrases += [str(n) for n in range(1, MAX_MINUTES + 1)]
+    # Whole sentences the directions screen reads for every trip
+    for station in stations:
+        for route in station['routes']:
+            phrases.append(f"Board {route} Line at {station['name']}")
+    phrases += [a['header'] for a in alerts if a.get('header')]
+    return list(dict.fromkeys(phrases))
+
+
+def _fetch(path):
+    try:
+        response = upstream.get(f"{SERVER_URL}{path}")
+        body = response.json()
+    except Exception as e:
+        print(f"Pre-synthesis: couldn't load {path}: {e}")
+        return []
+    return body.get('data', []) if body.get('success') else []
+
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across all threads."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class WarmupJob:
+    """
+    Synthesizes uncached phrases in the background.
+    is_cached(text) -> bool; synthesize(text) -> bool (blocks until stored).
+    """
+
+    def __init__(self, is_cached, synthesize, workers=WORKERS, rate=RATE_PER_SEC):
+        self.is_cached = is_cached
+        self.synthesize = synthesize
+        self.workers = workers
+        self.limiter = RateLimiter(rate)
+        self._lock = threading.Lock()
+        self.running = False
+        self.counters = {'runs': 0, 'phrases': 0, 'already_cached': 0, 'synthesized': 0, 'failed': 0}
+        self.last_run_s = None
+
+    def start(self, phrases=None):
+        """Runs the job on a background thread. False if one is already running."""
+        with self._lock:
+            if self.running:
+                return False
+            self.running = True
+        threading.Thread(target=self._run, args=(phrases,), daemon=True).start()
+        return True
+
+    def run(self, phrases=None):
+        with self._lock:
+            if self.running:
+                return False
+            self.running = True
+        self._run(phrases)
+        return True
+
+    def stats(self):
+        with self._lock:
+            out = dict(self.counters)
+            out['running'] = self.running
+            out['last_run_s'] = self.last_run_s
+        return out
+
+    def _run(self, phrases):
+        started = time.monotonic()
+        try:
+            if phrases is None:
+                phrases = collect_phrases()
+            todo = [p for p in phrases if not self.is_cached(p)]
+            with self._lock:
+                self.counters['runs'] += 1
+                self.counters['phrases'] += len(phrases)
+                self.counters['already_cached'] += len(phrases) - len(todo)
+            print(f"Pre-synthesis: {len(todo)} of {len(phrases)} phrases to synthesize")
+
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                for ok in pool.map(self._one, todo):
+                    with self._lock:
+                        self.counters['synthesized' if ok else 'failed'] += 1
+        except Exception as e:
+            print(f"Pre-synthesis failed: {e}")
+        finally:
+            with self._lock:
+                self.running = False
+                self.last_run_s = round(time.monotonic() - started, 1)
+
+    def _one(self, text):
+        self.limiter.wait()
+        try:
+            return bool(self.synthesize(text))
+        except Exception as e:
+            print(f"Pre-synthesis of {text!r} failed: {e}")
+            return False
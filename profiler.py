@@ -0,0 +1,174 @@
+"""
+Sampling profiler that can be switched on and off in a running server.
+
+While it runs, a daemon thread wakes every interval and records the
+Python stack of every other thread (sys._current_frames()). Nothing is
+hooked into the code being profiled, so the overhead is one stack walk
+per thread per sample, and none at all while it is off.
+
+Samples are counted as collapsed stacks ("outer;inner;leaf count"), the
+input format of flamegraph.pl and speedscope. Threads parked in a lock,
+condition or selector wait are left out by default, so idle workers
+don't drown out the requests doing work.
+
+    POST /api/debug/profiler {"action": "start", "seconds": 30}
+    GET  /api/debug/profiler          -> collapsed stacks, hottest first
+"""
+import math
+import os
+import sys
+import threading
+import time
+
+INTERVAL_MS = float(os.getenv('PROFILER_INTERVAL_MS', '10'))
+MIN_INTERVAL_MS, MAX_INTERVAL_MS = 1.0, 1000.0
+DEFAULT_SECONDS = 30
+MAX_SECONDS = 300           # longest run the HTTP endpoint may ask for
+MAX_STACKS = 10000          # distinct stacks kept; rarer ones beyond this are dropped
+MAX_DEPTH = 64
+
+# Leaf frames that mean "this thread is waiting, not working".
+IDLE_LEAVES = {
+    ('threading.py', 'wait'),
+    ('threading.py', '_wait_for_tstate_lock'),
+    ('selectors.py', 'select'),
+    ('socketserver.py', 'serve_forever'),
+    ('queue.py', 'get'),
+}
+
+
+def clamp_request(seconds=None, interval_ms=None):
+    """
+    (seconds, interval_ms) for a remotely requested run, coerced to numbers
+    and clamped to sane bounds. Raises ValueError on non-numeric input.
+    """
+    seconds = _bounded(DEFAULT_SECONDS if seconds is None else seconds, 1, MAX_SECONDS)
+    interval_ms = _bounded(INTERVAL_MS if interval_ms is None else interval_ms, MIN_INTERVAL_MS, MAX_INTERVAL_MS)
+    return seconds, interval_ms
+
+
+def _bounded(raw, low, high):
+    if isinstance(raw, bool):
+        raise ValueError(f'{raw!r} is not a number')
+    value = float(raw)
+    if math.isnan(value):
+        raise ValueError(f'{raw!r} is not a number')
+    return min(max(value, low), high)
+
+
+class SamplingProfiler:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.stacks = {}
+        self.samples = 0
+        self.dropped = 0
+        self.started_at = None
+        self.stopped_at = None
+        self.interval = INTERVAL_MS / 1000
+        self.include_idle = False
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds=None, interval_ms=None, include_idle=False):
+        """
+        Clears old samples and starts sampling, for `seconds` if given.
+        Returns False if it was already running.
+        """
+        with self._lock:
+            if self.running:
+                return False
+            self.stacks = {}
+            self.samples = 0
+            self.dropped = 0
+            self.interval = (interval_ms or INTERVAL_MS) / 1000
+            self.include_idle = include_idle
+            self.started_at = time.time()
+            self.stopped_at = None
+            self._stop.clear()
+            deadline = time.monotonic() + seconds if seconds else None
+            self._thread = threading.Thread(target=self._run, args=(deadline,), daemon=True)
+            self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def collapsed(self, limit=None):
+        """Collapsed-stack text, most sampled first."""
+        with self._lock:
+            stacks = sorted(self.stacks.items(), key=lambda kv: kv[1], reverse=True)
+        if limit:
+            stacks = stacks[:limit]
+        return ''.join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def stats(self):
+        with self._lock:
+            end = self.stopped_at or time.time()
+            return {
+                'running': self.running,
+                'samples': self.samples,
+                'stacks': len(self.stacks),
+                'dropped': self.dropped,
+                'interval_ms': round(self.interval * 1000, 2),
+                'include_idle': self.include_idle,
+                'duration_s': round(end - self.started_at, 1) if self.started_at else None,
+            }
+
+    # --------------------------------------------
+    # Internals
+    # --------------------------------------------
+    def _run(self, deadline):
+        me = threading.get_ident()
+        try:
+            while not self._stop.wait(self.interval):
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+                self._sample(me)
+        finally:
+            with self._lock:
+                self.stopped_at = time.time()
+
+    def _sample(self, me):
+        frames = sys._current_frames()
+        collected = []
+        for ident, frame in frames.items():
+            if ident == me:
+                continue
+            if not self.include_idle and _is_idle(frame):
+                continue
+            collected.append(_collapse(frame))
+        del frames
+        with self._lock:
+            self.samples += 1
+            for stack in collected:
+                if stack in self.stacks:
+                    self.stacks[stack] += 1
+                elif len(self.stacks) < MAX_STACKS:
+                    self.stacks[stack] = 1
+                else:
+                    self.dropped += 1
+
+
+def _is_idle(frame):
+    code = frame.f_code
+    return (os.path.basename(code.co_filename), code.co_name) in IDLE_LEAVES
+
+
+def _collapse(frame):
+    names = []
+    while frame is not None and len(names) < MAX_DEPTH:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+# Process-wide profiler behind the /api/debug/profiler endpoint
+profiler = SamplingProfiler()
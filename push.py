@@ -0,0 +1,284 @@
+"""
+Push channel for live vehicle positions.
+
+Instead of every client polling /api/mbta/vehicles for the whole fleet,
+clients subscribe once (Server-Sent Events at /api/mbta/vehicles/stream,
+or a WebSocket at /api/mbta/vehicles/ws in async mode). Each gets a
+snapshot, then deltas carrying only the vehicles whose position, bearing
+or status changed, plus removals.
+
+The hub is fed by the MBTA vehicle stream when streaming is on. Otherwise
+one background poller refreshes the fleet for all subscribers, and only
+while anyone is subscribed.
+
+Backpressure: a subscriber holds at most one pending entry per vehicle.
+A newer change overwrites the older unsent one. A slow client therefore
+catches up to the latest state in its next message instead of working
+through a backlog, and its memory use is bounded by the fleet size.
+"""
+import threading
+import time
+
+from responses import dumps
+
+POLL_INTERVAL = 5           # seconds between upstream polls when not streaming
+MIN_INTERVAL = 1.0          # coalescing window: at most one message per client per second
+HEARTBEAT = 15              # seconds of silence before a keepalive
+COORD_PRECISION = 5         # ~1 m; smaller GPS jitter isn't sent
+
+
+def _signature(vehicle):
+    """The fields whose change is worth pushing."""
+    lat, lng = vehicle['lat'], vehicle['lng']
+    return (
+        round(lat, COORD_PRECISION) if lat is not None else None,
+        round(lng, COORD_PRECISION) if lng is not None else None,
+        vehicle['bearing'],
+        vehicle['status'],
+        vehicle['route'],
+    )
+
+
+class Subscriber:
+    """One connected client: its pending changes, coalesced per vehicle."""
+
+    def __init__(self, hub, fields=None):
+        self.hub = hub
+        self.fields = fields
+        self.cond = threading.Condition()
+        self.pending = {}       # vehicle id -> latest vehicle, or None when removed
+        self.resync = True      # next message is a full snapshot
+        self.closed = False
+        self.last_sent = 0.0
+
+    def push(self, changed, removed):
+        """Merges a change set into the pending one (called by the hub). Returns how many entries it overwrote."""
+        coalesced = 0
+        with self.cond:
+            if not self.resync:
+                for vid, vehicle in changed.items():
+                    coalesced += vid in self.pending
+                    self.pending[vid] = vehicle
+                for vid in removed:
+                    coalesced += vid in self.pending
+                    self.pending[vid] = None
+            self.cond.notify_all()
+        return coalesced
+
+    def has_message(self):
+        return (self.resync and self.hub.ready) or bool(self.pending)
+
+    def wait(self, timeout):
+        """Blocks until there is something to send (True) or timeout (False)."""
+        with self.cond:
+            return self.cond.wait_for(lambda: self.closed or self.has_message(), timeout)
+
+    def take(self):
+        """The message to send now (a snapshot or a delta), or None if nothing changed."""
+        with self.cond:
+            if self.resync:
+                if not self.hub.ready:
+                    return None
+                self.resync = False
+                self.pending.clear()
+                snapshot = True
+            else:
+                if not self.pending:
+                    return None
+                pending, self.pending = self.pending, {}
+                snapshot = False
+
+        if snapshot:
+            vehicles, version = self.hub.snapshot()
+            message = {'type': 'snapshot', 'version': version, 'vehicles': self._project(vehicles)}
+            self.hub._count('snapshots')
+        else:
+            message = {
+                'type': 'delta',
+                'version': self.hub.version,
+                'changed': self._project([v for v in pending.values() if v is not None]),
+                'removed': [vid for vid, v in pending.items() if v is None],
+            }
+        self.hub._count('messages')
+        self.last_sent = time.monotonic()
+        return message
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.hub.unsubscribe(self)
+
+    def _project(self, vehicles):
+        if not self.fields:
+            return vehicles
+        keys = ['id'] + [f for f in self.fields if f != 'id']
+        return [{k: v[k] for k in keys if k in v} for v in vehicles]
+
+
+class VehicleHub:
+    """
+    Current fleet state plus the set of subscribers it fans changes out to.
+    parse: server._parse_vehicles (MBTA JSON:API payload -> vehicle dicts).
+    poll: returns the current vehicle list, or None while the live stream
+    is feeding the hub.
+    """
+
+    def __init__(self, parse, poll=None, poll_interval=POLL_INTERVAL):
+        self.parse = parse
+        self.poll = poll
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._vehicles = {}
+        self._signatures = {}
+        self._subscribers = set()
+        self._poller = None
+        self.ready = False
+        self.version = 0
+        self.counters = {
+            'publishes': 0,
+            'changed': 0,
+            'removed': 0,
+            'messages': 0,
+            'snapshots': 0,
+            'coalesced': 0,
+        }
+
+    # --------------------------------------------
+    # Feeding the hub
+    # --------------------------------------------
+    def on_stream_event(self, event, items):
+        """LiveStore listener for the vehicles stream."""
+        if event == 'remove':
+            self.publish_removals([r['id'] for r in items if r.get('type') == 'vehicle'])
+            return
+        vehicles = self.parse({'data': [r for r in items if r.get('type') == 'vehicle']})
+        self.publish(vehicles, full=(event == 'reset'))
+
+    def publish(self, vehicles, full=False):
+        """
+        Records new vehicle states and fans out the ones that changed.
+        full=True means `vehicles` is the whole fleet: anything missing
+        from it has left service.
+        """
+        with self._lock:
+            changed = {}
+            seen = set()
+            for vehicle in vehicles:
+                vid = vehicle['id']
+                seen.add(vid)
+                signature = _signature(vehicle)
+                if self._signatures.get(vid) != signature:
+                    self._signatures[vid] = signature
+                    changed[vid] = vehicle
+                self._vehicles[vid] = vehicle
+            removed = [vid for vid in self._vehicles if vid not in seen] if full else []
+            self._drop(removed)
+            became_ready = full and not self.ready
+            if full:
+                self.ready = True
+            self._fan_out(changed, removed, force=became_ready)
+
+    def publish_removals(self, vehicle_ids):
+        with self._lock:
+            removed = [vid for vid in vehicle_ids if vid in self._vehicles]
+            self._drop(removed)
+            self._fan_out({}, removed)
+
+    def snapshot(self):
+        with self._lock:
+            return list(self._vehicles.values()), self.version
+
+    # --------------------------------------------
+    # Subscribers
+    # --------------------------------------------
+    def subscribe(self, fields=None):
+        subscriber = Subscriber(self, fields)
+        with self._lock:
+            self._subscribers.add(subscriber)
+            if self.poll is not None and self._poller is None:
+                self._poller = threading.Thread(target=self._poll_loop, daemon=True)
+                self._poller.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def stats(self):
+        with self._lock:
+            out = dict(self.counters)
+            out['subscribers'] = len(self._subscribers)
+            out['vehicles'] = len(self._vehicles)
+            out['version'] = self.version
+            out['ready'] = self.ready
+            out['polling'] = self._poller is not None
+        return out
+
+    # --------------------------------------------
+    # Internals
+    # --------------------------------------------
+    def _drop(self, vehicle_ids):
+        for vid in vehicle_ids:
+            del self._vehicles[vid]
+            del self._signatures[vid]
+
+    def _fan_out(self, changed, removed, force=False):
+        """Hands a change set to every subscriber (caller holds the lock, so sets arrive in order)."""
+        if not changed and not removed and not force:
+            return
+        self.version += 1
+        self.counters['publishes'] += 1
+        self.counters['changed'] += len(changed)
+        self.counters['removed'] += len(removed)
+        for subscriber in self._subscribers:
+            self.counters['coalesced'] += subscriber.push(changed, removed)
+
+    def _count(self, key):
+        with self._lock:
+            self.counters[key] += 1
+
+    def _poll_loop(self):
+        """One upstream poll for every subscriber, while there are any."""
+        fed = False     # the fleet state came from this poller (not the live stream)
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    self._poller = None
+                    if fed:
+                        # Nobody keeps it current from here on: the next
+                        # subscriber waits for a fresh poll, not this state.
+                        self._vehicles.clear()
+                        self._signatures.clear()
+                        self.ready = False
+                    return
+            try:
+                vehicles = self.poll()
+                fed = vehicles is not None
+                if fed:
+                    self.publish(vehicles, full=True)
+            except Exception as e:
+                print(f"Vehicle push poll failed: {e}")
+            time.sleep(self.poll_interval)
+
+
+def sse_message(message):
+    """One Server-Sent Events frame for a snapshot/delta message."""
+    return f"event: {message['type']}\ndata: {dumps(message).decode()}\n\n"
+
+
+def sse_events(subscriber):
+    """Blocking SSE generator for the Flask endpoint; unsubscribes when the client goes away."""
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            message = subscriber.take()
+            if message is None:
+                if not subscriber.wait(HEARTBEAT):
+                    yield ": keepalive\n\n"
+                continue
+            yield sse_message(message)
+            # Coalescing window: changes arriving meanwhile merge into the next delta.
+            time.sleep(MIN_INTERVAL)
+    finally:
+        subscriber.close()
@@ -0,0 +1,198 @@
+"""
+Wire-format helpers shared by server.py and asgi.py.
+
+- JSON goes through orjson when it is installed (several times faster
+  than the stdlib encoder on the vehicle and directions payloads).
+- fields= projection trims each record down to the keys a client asked
+  for before it is serialized.
+- Route paths can be sent as {'lat','lng'} points (default), a flat
+  [lat, lng, lat, lng, ...] array, or Google's encoded polyline string,
+  optionally simplified for a map zoom level (see geometry.py).
+- Bodies above COMPRESS_MIN_BYTES are brotli- or gzip-compressed,
+  whichever the client accepts (brotli only if the module is installed).
+"""
+import dataclasses
+import gzip
+import json
+import os
+import uuid
+from datetime import date, time
+from decimal import Decimal
+
+from flask.json.provider import JSONProvider
+
+import geometry
+from metrics import span
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # dynamic content: much faster than the default 11, nearly as small
+
+PATH_FORMATS = ('points', 'flat', 'polyline')
+MAX_ZOOM = 22
+
+
+# ============================================
+# JSON
+# ============================================
+
+def default(obj):
+    """
+    Encodes what JSON has no type for. Dates and times become ISO 8601
+    (as orjson writes them natively), so both encoders agree.
+    """
+    if isinstance(obj, (date, time)):
+        return obj.isoformat()
+    if isinstance(obj, (Decimal, uuid.UUID)):
+        return str(obj)
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj):
+    """Serializes obj to UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=default, separators=(',', ':')).encode()
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
+
+
+class FastJSONProvider(JSONProvider):
+    """Flask JSON provider backed by dumps(); makes every jsonify() use orjson."""
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        with span('serialize'):
+            body = dumps(obj)
+        return self._app.response_class(body, mimetype='application/json')
+
+
+# ============================================
+# PROJECTION
+# ============================================
+
+def parse_fields(raw):
+    """'id,lat,lng' (or a list) -> ['id', 'lat', 'lng']; None when absent."""
+    if not raw:
+        return None
+    if isinstance(raw, str):
+        raw = raw.split(',')
+    fields = [str(f).strip() for f in raw if str(f).strip()]
+    return fields or None
+
+
+def project(records, fields):
+    """Keeps only `fields` of each record in a list (everything when fields is None)."""
+    if not fields:
+        return records
+    return [{k: record[k] for k in fields if k in record} for record in records]
+
+
+# ============================================
+# ROUTE PATHS
+# ============================================
+
+def parse_path_format(raw):
+    fmt = raw or 'points'
+    if fmt not in PATH_FORMATS:
+        raise ValueError(f"path_format must be one of {', '.join(PATH_FORMATS)}")
+    return fmt
+
+
+def parse_zoom(raw):
+    """Map zoom level for path simplification; None (full detail) when absent."""
+    if raw in (None, ''):
+        return None
+    try:
+        zoom = int(raw)
+    except (TypeError, ValueError):
+        raise ValueError(f"zoom must be a whole number between 0 and {MAX_ZOOM}")
+    if not 0 <= zoom <= MAX_ZOOM:
+        raise ValueError(f"zoom must be between 0 and {MAX_ZOOM}")
+    return zoom
+
+
+def reformat_paths(routes, fmt, zoom=None):
+    """Converts the 'path' of already built routes (default points format) in place."""
+    if fmt != 'points' or zoom is not None:
+        for route in routes:
+            route['path'] = geometry.from_points(route['path']).path(fmt, zoom)
+    return routes
+
+
+# ============================================
+# COMPRESSION
+# ============================================
+
+def choose_encoding(accept_encoding):
+    """'br', 'gzip' or None for an Accept-Encoding header value."""
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        q = 1.0
+        if params.strip().startswith('q='):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.strip().lower()] = q
+    if brotli is not None and accepted.get('br', 0) > 0:
+        return 'br'
+    if accepted.get('gzip', 0) > 0:
+        return 'gzip'
+    return None
+
+
+def compress(body, accept_encoding):
+    """(body, content_encoding) — compressed when it's worth it and the client accepts it."""
+    if len(body) < COMPRESS_MIN_BYTES:
+        return body, None
+    encoding = choose_encoding(accept_encoding)
+    if encoding == 'br':
+        with span('compress'):
+            return brotli.compress(body, quality=BROTLI_QUALITY), 'br'
+    if encoding == 'gzip':
+        with span('compress'):
+            return gzip.compress(body, compresslevel=GZIP_LEVEL), 'gzip'
+    return body, None
+
+
+def compress_response(response, accept_encoding):
+    """Flask after_request hook body: compresses a buffered JSON response in place."""
+    if (response.direct_passthrough or response.is_streamed
+            or response.mimetype != 'application/json'
+            or 'Content-Encoding' in response.headers):
+        return response
+    body, encoding = compress(response.get_data(), accept_encoding)
+    response.headers.add('Vary', 'Accept-Encoding')
+    if encoding:
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+    return response
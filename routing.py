@@ -0,0 +1,450 @@
+"""
+Local routing engine over the MBTA GTFS static feed.
+
+Loads the subway and light-rail part of a GTFS feed (zip file or unpacked
+directory) into flat array-backed tables and answers earliest-arrival
+queries with the Connection Scan Algorithm (CSA): every timetabled hop
+("connection") is sorted by departure time once, and a query is a single
+forward scan over that array.
+
+The walking profile is part of the search, not a filter applied after it:
+walks to the first platform, between platforms and to the destination are
+timed at the user's speed from SPEED_MAP, and a train can only be boarded
+if the user reaches the platform BOARDING_BUFFER seconds before it leaves
+(the same 60-second rule the Google-based catchability filter uses).
+
+Limitations: only today's service is searched (trips that started the
+previous service day and run past midnight are not), and walking
+distances are straight-line times a detour factor, not a street network.
+"""
+import bisect
+import csv
+import io
+import os
+import threading
+import time
+import zipfile
+from array import array
+from datetime import datetime
+
+from spatial import GridIndex, haversine_m
+
+BOARDING_BUFFER = 60        # seconds on the platform before the train leaves
+WALK_DETOUR = 1.25          # street distance / straight-line distance
+MAX_ACCESS_WALK_M = 1200    # furthest we look for a first / last station
+FOOTPATH_M = 250            # platforms this close count as a walkable transfer
+SUBWAY_ROUTE_TYPES = ('0', '1')
+INF = float('inf')
+
+
+def _parse_gtfs_time(value):
+    h, m, s = value.split(':')
+    return int(h) * 3600 + int(m) * 60 + int(s)
+
+
+class _Feed:
+    """Reads GTFS .txt tables out of a zip archive or a directory."""
+
+    def __init__(self, path):
+        self.path = path
+        self.zip = zipfile.ZipFile(path) if zipfile.is_zipfile(path) else None
+
+    def has(self, name):
+        if self.zip is not None:
+            return name in self.zip.namelist()
+        return os.path.exists(os.path.join(self.path, name))
+
+    def rows(self, name):
+        if self.zip is not None:
+            with self.zip.open(name) as raw:
+                yield from csv.DictReader(io.TextIOWrapper(raw, encoding='utf-8-sig'))
+        else:
+            with open(os.path.join(self.path, name), encoding='utf-8-sig', newline='') as f:
+                yield from csv.DictReader(f)
+
+
+class Timetable:
+    """Compact, read-only subway timetable built from a GTFS feed."""
+
+    def __init__(self, path):
+        started = time.time()
+        feed = _Feed(path)
+
+        # --- Routes & trips (subway / light rail only) ---
+        route_names = {}
+        for row in feed.rows('routes.txt'):
+            if row.get('route_type') in SUBWAY_ROUTE_TYPES:
+                route_names[row['route_id']] = row.get('route_long_name') or row.get('route_short_name') or row['route_id']
+
+        self.service_ids = []
+        service_index = {}
+        trip_index = {}
+        self.trip_route = []        # display name, e.g. "Red Line"
+        self.trip_service = array('i')
+        for row in feed.rows('trips.txt'):
+            if row['route_id'] not in route_names:
+                continue
+            sid = row['service_id']
+            if sid not in service_index:
+                service_index[sid] = len(self.service_ids)
+                self.service_ids.append(sid)
+            trip_index[row['trip_id']] = len(self.trip_route)
+            self.trip_route.append(route_names[row['route_id']])
+            self.trip_service.append(service_index[sid])
+
+        # --- Stop times -> per-trip stop sequences ---
+        per_trip = {}
+        for row in feed.rows('stop_times.txt'):
+            t = trip_index.get(row['trip_id'])
+            if t is None:
+                continue
+            per_trip.setdefault(t, []).append((
+                int(row['stop_sequence']),
+                row['stop_id'],
+                _parse_gtfs_time(row['arrival_time'] or row['departure_time']),
+                _parse_gtfs_time(row['departure_time'] or row['arrival_time']),
+            ))
+
+        # --- Stops actually served, plus their parent stations for names ---
+        used = {stop_id for rows in per_trip.values() for _, stop_id, _, _ in rows}
+        stop_rows = {row['stop_id']: row for row in feed.rows('stops.txt')}
+        self.stop_ids = sorted(used)
+        self.stop_index = {sid: i for i, sid in enumerate(self.stop_ids)}
+        self.stop_lat = array('d')
+        self.stop_lng = array('d')
+        self.stop_name = []
+        self.stop_parent = []
+        for sid in self.stop_ids:
+            row = stop_rows.get(sid, {})
+            parent = row.get('parent_station') or sid
+            parent_row = stop_rows.get(parent, row)
+            self.stop_lat.append(float(row.get('stop_lat') or parent_row.get('stop_lat') or 0))
+            self.stop_lng.append(float(row.get('stop_lon') or parent_row.get('stop_lon') or 0))
+            self.stop_name.append(parent_row.get('stop_name') or row.get('stop_name') or sid)
+            self.stop_parent.append(parent)
+
+        # --- Connections, sorted by departure ---
+        self.trip_stops = [array('i') for _ in self.trip_route]
+        dep_stop, arr_stop, dep, arr, trip, seq = [], [], [], [], [], []
+        for t, rows in per_trip.items():
+            rows.sort()
+            stops = self.trip_stops[t]
+            for _, stop_id, _, _ in rows:
+                stops.append(self.stop_index[stop_id])
+            for pos in range(len(rows) - 1):
+                dep_stop.append(self.stop_index[rows[pos][1]])
+                arr_stop.append(self.stop_index[rows[pos + 1][1]])
+                dep.append(rows[pos][3])
+                arr.append(rows[pos + 1][2])
+                trip.append(t)
+                seq.append(pos)
+        order = sorted(range(len(dep)), key=lambda c: (dep[c], arr[c]))
+        self.conn_dep_stop = array('i', (dep_stop[c] for c in order))
+        self.conn_arr_stop = array('i', (arr_stop[c] for c in order))
+        self.conn_dep = array('i', (dep[c] for c in order))
+        self.conn_arr = array('i', (arr[c] for c in order))
+        self.conn_trip = array('i', (trip[c] for c in order))
+        self.conn_seq = array('i', (seq[c] for c in order))
+
+        # --- Spatial index & walkable transfers between platforms ---
+        self.grid = GridIndex(
+            [{'lat': self.stop_lat[i], 'lng': self.stop_lng[i], 'idx': i} for i in range(len(self.stop_ids))]
+        )
+        siblings = {}
+        for i, parent in enumerate(self.stop_parent):
+            siblings.setdefault(parent, []).append(i)
+        self.footpaths = []
+        for i in range(len(self.stop_ids)):
+            near = self.grid.within_radius(self.stop_lat[i], self.stop_lng[i], FOOTPATH_M)
+            paths = [(item['idx'], d) for d, item in near if item['idx'] != i]
+            # Platforms of the same station are always connected.
+            linked = {j for j, _ in paths}
+            for j in siblings[self.stop_parent[i]]:
+                if j != i and j not in linked:
+                    paths.append((j, haversine_m(self.stop_lat[i], self.stop_lng[i],
+                                                 self.stop_lat[j], self.stop_lng[j])))
+            self.footpaths.append(paths)
+
+        # --- Service calendar ---
+        self.calendar = {}
+        if feed.has('calendar.txt'):
+            days = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+            for row in feed.rows('calendar.txt'):
+                self.calendar[row['service_id']] = (
+                    tuple(row[d] == '1' for d in days), row['start_date'], row['end_date']
+                )
+        self.exceptions = {}
+        if feed.has('calendar_dates.txt'):
+            for row in feed.rows('calendar_dates.txt'):
+                self.exceptions[(row['service_id'], row['date'])] = row['exception_type']
+
+        self._active_cache = {}
+        self.load_seconds = round(time.time() - started, 2)
+
+    # --------------------------------------------
+    # Queries
+    # --------------------------------------------
+    def active_trips(self, day):
+        """bytearray flag per trip: does it run on `day`?"""
+        key = day.strftime('%Y%m%d')
+        cached = self._active_cache.get(key)
+        if cached is not None:
+            return cached
+        active_service = bytearray(len(self.service_ids))
+        for i, sid in enumerate(self.service_ids):
+            runs = False
+            cal = self.calendar.get(sid)
+            if cal is not None:
+                weekdays, start, end = cal
+                runs = weekdays[day.weekday()] and start <= key <= end
+            exception = self.exceptions.get((sid, key))
+            if exception == '1':
+                runs = True
+            elif exception == '2':
+                runs = False
+            active_service[i] = runs
+        active = bytearray(active_service[s] for s in self.trip_service)
+        self._active_cache = {key: active}
+        return active
+
+    def earliest_arrival(self, origin, destination, speed, depart_at, first_board_after=0):
+        """
+        CSA earliest-arrival search.
+        origin/destination: (lat, lng). speed: walking m/s. depart_at: datetime.
+        first_board_after: seconds-since-midnight; the first train must leave
+        at or after this (used to enumerate later alternatives).
+        Returns a journey dict or None.
+        """
+        midnight = datetime.combine(depart_at.date(), datetime.min.time())
+        now = int((depart_at - midnight).total_seconds())
+        active = self.active_trips(depart_at.date())
+        n = len(self.stop_ids)
+
+        earliest = [INF] * n
+        legs = [0] * n              # trains taken to reach each stop
+        enter = [-1] * n            # boarding connection of the leg that reached the stop
+        exit_ = [-1] * n            # alighting connection of that leg
+        foot_from = [-1] * n        # stop we walked from (platform transfer)
+        origin_walk = {}
+
+        for d, item in self.grid.within_radius(origin[0], origin[1], MAX_ACCESS_WALK_M):
+            s = item['idx']
+            earliest[s] = now + d * WALK_DETOUR / speed
+            origin_walk[s] = d
+        # Platforms reachable by walking on from those stops (e.g. the other
+        # side of a station whose nearest entrance is across the street).
+        for s in list(origin_walk):
+            for nb, meters in self.footpaths[s]:
+                ft = earliest[s] + meters * WALK_DETOUR / speed
+                if ft < earliest[nb]:
+                    earliest[nb] = ft
+                    foot_from[nb] = s
+
+        egress = {item['idx']: d for d, item in self.grid.within_radius(destination[0], destination[1], MAX_ACCESS_WALK_M)}
+        direct_m = haversine_m(origin[0], origin[1], destination[0], destination[1])
+        best = now + direct_m * WALK_DETOUR / speed
+        best_stop = None
+
+        boarded = {}
+        conn_dep = self.conn_dep
+        start = bisect.bisect_left(conn_dep, now)
+        for c in range(start, len(conn_dep)):
+            dep = conn_dep[c]
+            if dep >= best:
+                break
+            t = self.conn_trip[c]
+            if not active[t]:
+                continue
+            if t not in boarded:
+                s = self.conn_dep_stop[c]
+                if earliest[s] + BOARDING_BUFFER > dep:
+                    continue
+                if legs[s] == 0 and dep < first_board_after:
+                    continue
+                boarded[t] = c
+            a = self.conn_arr_stop[c]
+            arr = self.conn_arr[c]
+            if arr >= earliest[a]:
+                continue
+            board = boarded[t]
+            earliest[a] = arr
+            enter[a] = board
+            exit_[a] = c
+            foot_from[a] = -1
+            legs[a] = legs[self.conn_dep_stop[board]] + 1
+            if a in egress and arr + egress[a] * WALK_DETOUR / speed < best:
+                best = arr + egress[a] * WALK_DETOUR / speed
+                best_stop = a
+            for nb, meters in self.footpaths[a]:
+                ft = arr + meters * WALK_DETOUR / speed
+                if ft < earliest[nb]:
+                    earliest[nb] = ft
+                    enter[nb] = exit_[nb] = -1
+                    foot_from[nb] = a
+                    legs[nb] = legs[a]
+                    if nb in egress and ft + egress[nb] * WALK_DETOUR / speed < best:
+                        best = ft + egress[nb] * WALK_DETOUR / speed
+                        best_stop = nb
+
+        if best_stop is None:
+            return None
+
+        # --- Walk back from the last stop to rebuild the legs ---
+        parts = [('walk', best_stop, None, egress[best_stop])]
+        s = best_stop
+        while True:
+            if enter[s] != -1:
+                parts.append(('ride', enter[s], exit_[s], None))
+                s = self.conn_dep_stop[enter[s]]
+            elif foot_from[s] != -1:
+                prev = foot_from[s]
+                parts.append(('transfer', prev, s, None))
+                s = prev
+            else:
+                parts.append(('walk', None, s, origin_walk[s]))
+                break
+        parts.reverse()
+
+        return {
+            'midnight': midnight.timestamp(),
+            'depart': now,
+            'arrive': best,
+            'speed': speed,
+            'parts': parts,
+        }
+
+    def plan(self, origin, destination, speed, depart_at=None, alternatives=3):
+        """Up to `alternatives` journeys, each boarding a later first train than the last."""
+        depart_at = depart_at or datetime.now()
+        journeys = []
+        first_board_after = 0
+        for _ in range(alternatives):
+            journey = self.earliest_arrival(origin, destination, speed, depart_at, first_board_after)
+            if journey is None:
+                break
+            rides = [p for p in journey['parts'] if p[0] == 'ride']
+            if not rides:
+                break
+            journeys.append(journey)
+            first_board_after = self.conn_dep[rides[0][1]] + 1
+        return journeys
+
+    # --------------------------------------------
+    # Formatting (same shape as server.catchable_routes)
+    # --------------------------------------------
+    def to_route(self, journey, route_id, origin, destination):
+        midnight = journey['midnight']
+        now_ts = midnight + journey['depart']
+        arrival_ts = midnight + journey['arrive']
+        speed = journey['speed']
+
+        steps = []
+        transit_lines = []
+        path = [{'lat': origin[0], 'lng': origin[1]}]
+        distance_m = 0.0
+        first_station = None
+        first_departure = None
+        station_arrival = None
+
+        for kind, a, b, meters in journey['parts']:
+            if kind == 'walk' and a is None:
+                name = self.stop_name[b]
+                steps.append({'instruction': f"Walk to {name}"})
+                distance_m += meters * WALK_DETOUR
+                station_arrival = now_ts + meters * WALK_DETOUR / speed
+            elif kind == 'walk':
+                steps.append({'instruction': "Walk to destination"})
+                distance_m += meters * WALK_DETOUR
+                path.append({'lat': destination[0], 'lng': destination[1]})
+            elif kind == 'transfer':
+                steps.append({'instruction': f"Transfer to {self.stop_name[b]}"})
+                meters = haversine_m(self.stop_lat[a], self.stop_lng[a], self.stop_lat[b], self.stop_lng[b])
+                distance_m += meters * WALK_DETOUR
+                if first_station is None:
+                    station_arrival += meters * WALK_DETOUR / speed
+            else:
+                t = self.conn_trip[a]
+                line_name = self.trip_route[t]
+                depart_stop = self.stop_name[self.conn_dep_stop[a]]
+                num_stops = self.conn_seq[b] - self.conn_seq[a] + 1
+                if line_name not in transit_lines:
+                    transit_lines.append(line_name)
+                if first_station is None:
+                    first_station = depart_stop
+                    first_departure = midnight + self.conn_dep[a]
+                steps.append({'instruction': f"Board <b>{line_name}</b> at {depart_stop}"})
+                steps.append({'instruction': f"Ride {num_stops} stops"})
+                stops = self.trip_stops[t][self.conn_seq[a]:self.conn_seq[b] + 2]
+                for prev, cur in zip(stops, stops[1:]):
+                    distance_m += haversine_m(self.stop_lat[prev], self.stop_lng[prev],
+                                              self.stop_lat[cur], self.stop_lng[cur])
+                path.extend({'lat': self.stop_lat[s], 'lng': self.stop_lng[s]} for s in stops)
+
+        diff_min = int((first_departure - now_ts) / 60)
+        return {
+            'id': route_id,
+            'sort_arrival': arrival_ts,
+            'summary': "Via " + " & ".join(transit_lines),
+            'distance': f"{distance_m / 1609.34:.1f} mi",
+            'duration': f"{int((arrival_ts - now_ts) / 60)} min",
+            'time_range': f"Leave Now – {datetime.fromtimestamp(arrival_ts).strftime('%-I:%M %p')}",
+            'countdown': f"Departs in {diff_min} min" if diff_min > 0 else "Now",
+            'station_eta': f"Reach {first_station} by {datetime.fromtimestamp(station_arrival).strftime('%-I:%M %p')}",
+            'steps': steps,
+            'path': path
+        }
+
+    def boarding_station(self, journey):
+        """Parent station id (e.g. place-pktrm) where the journey's first train is boarded."""
+        for kind, a, _, _ in journey['parts']:
+            if kind == 'ride':
+                return self.stop_parent[self.conn_dep_stop[a]]
+        return None
+
+    def find_stop(self, name):
+        """(lat, lng) of a station by exact (case-insensitive) name, or None."""
+        wanted = ' '.join(str(name).split()).lower()
+        for i, stop_name in enumerate(self.stop_name):
+            if stop_name.lower() == wanted:
+                return self.stop_lat[i], self.stop_lng[i]
+        return None
+
+    def stats(self):
+        return {
+            'stops': len(self.stop_ids),
+            'trips': len(self.trip_route),
+            'connections': len(self.conn_dep),
+            'load_seconds': self.load_seconds,
+        }
+
+
+# ============================================
+# Process-wide engine (loaded in the background)
+# ============================================
+_engine = None
+_load_error = None
+
+
+def engine():
+    """The loaded Timetable, or None while loading / if no feed is configured."""
+    return _engine
+
+
+def load_async(path):
+    """Starts loading the GTFS feed at `path` on a background thread."""
+    def run():
+        global _engine, _load_error
+        try:
+            print(f"🗺️  Loading GTFS feed from {path}...")
+            _engine = Timetable(path)
+            print(f"🗺️  GTFS loaded: {_engine.stats()}")
+        except Exception as e:
+            _load_error = str(e)
+            print(f"GTFS load failed: {e}")
+    threading.Thread(target=run, name='gtfs-load', daemon=True).start()
+
+
+def stats():
+    if _engine is not None:
+        return dict(_engine.stats(), ready=True)
+    return {'ready': False, 'error': _load_error}
@@ -0,0 +1,129 @@
+"""
+Request coalescing for upstream fetches.
+
+When many clients ask for the same thing at once (everyone polling
+/api/mbta/vehicles, or a crowd refreshing one station's predictions),
+only the first caller actually hits the upstream. Everyone else who
+arrives while that fetch is in flight waits for it and gets the same
+parsed result.
+"""
+import threading
+
+import anyio
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.callers = 1
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.counters = {
+            'fetches': 0,       # upstream calls actually made
+            'callers': 0,       # requests served by those calls
+            'max_callers': 0,   # biggest crowd a single fetch fed
+        }
+        # How many callers each fetch fed: 1, 2-5, 6-20, 21+
+        self.fanout = {'1': 0, '2-5': 0, '6-20': 0, '21+': 0}
+
+    def do(self, key, fn):
+        """Runs fn() once per key at a time; concurrent callers share its result."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.callers += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+        finally:
+            with self._lock:
+                del self._calls[key]
+                self._record(call.callers)
+            call.done.set()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            out = dict(self.counters)
+            out['in_flight'] = len(self._calls)
+            out['avg_callers'] = round(out['callers'] / out['fetches'], 2) if out['fetches'] else 0.0
+            out['fanout'] = dict(self.fanout)
+        return out
+
+    def _record(self, callers):
+        self.counters['fetches'] += 1
+        self.counters['callers'] += callers
+        self.counters['max_callers'] = max(self.counters['max_callers'], callers)
+        if callers == 1:
+            self.fanout['1'] += 1
+        elif callers <= 5:
+            self.fanout['2-5'] += 1
+        elif callers <= 20:
+            self.fanout['6-20'] += 1
+        else:
+            self.fanout['21+'] += 1
+
+
+class AsyncSingleFlight(SingleFlight):
+    """Same as SingleFlight, for coroutines running on one event loop (asgi.py)."""
+
+    async def do(self, key, fn):
+        """Awaits fn() once per key at a time; concurrent callers share its result."""
+        call = self._calls.get(key)
+        if call is not None:
+            call.callers += 1
+            await call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        call = _Call()
+        call.event = anyio.Event()
+        self._calls[key] = call
+        try:
+            call.result = await fn()
+        except Exception as e:
+            call.error = e
+        finally:
+            del self._calls[key]
+            with self._lock:
+                self._record(call.callers)
+            call.event.set()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+
+def make_key(url, params=None):
+    """Stable key for an upstream URL + query params."""
+    if not params:
+        return url
+    return url + '?' + '&'.join(f'{k}={params[k]}' for k in sorted(params))
+
+
+# Shared by every upstream fetch in the process.
+flights = SingleFlight()
+async_flights = AsyncSingleFlight()
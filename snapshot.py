@@ -0,0 +1,327 @@
+"""
+Versioned on-disk snapshot of live transit state, shared between processes.
+
+Running several server processes would normally multiply upstream calls,
+one set per worker. Instead, one writer process (fetcher.py, or a server
+started with SNAPSHOT_MODE=writer) fetches stations, alerts, vehicles and
+predictions every SNAPSHOT_INTERVAL seconds and writes them to one file.
+Workers started with SNAPSHOT_MODE=reader memory-map that file and answer
+from it. The whole fleet then behaves like a single upstream client.
+
+File layout (little-endian):
+
+    header    magic b'ABSN' | format u16 | reserved u16 | sequence u64
+              | written_at f64 | section count u32
+    sections  name 16s | offset u64 | length u64 | version u64 | updated_at f64
+    payloads  one JSON document per section
+
+A section's version only changes when its content does. updated_at is
+when its data was last confirmed upstream, which is how readers tell a
+stalled writer from a quiet feed.
+
+The writer builds each new snapshot in a temp file and os.replace()s it
+over the old one. A reader therefore always maps a complete file, and no
+locking is needed. Readers check the file identity (inode, mtime) and
+parse only the sections whose version moved; headers and payloads are
+read straight out of the mapping.
+
+The file is also the persisted copy. It is rewritten on shutdown, and
+any process reads it back on startup, so a restart comes up with warm
+caches in a few milliseconds.
+"""
+import atexit
+import mmap
+import os
+import struct
+import threading
+import time
+
+from responses import dumps, loads
+
+MAGIC = b'ABSN'
+FORMAT = 1
+HEADER = struct.Struct('<4sHHQdI')
+SECTION = struct.Struct('<16sQQQd')
+
+SNAPSHOT_INTERVAL = float(os.getenv('SNAPSHOT_INTERVAL', '5'))
+SNAPSHOT_POLL = float(os.getenv('SNAPSHOT_POLL', '0.5'))
+
+
+class SnapshotError(Exception):
+    """The file is missing, truncated or not a snapshot."""
+
+
+class Section:
+    __slots__ = ('name', 'payload', 'version', 'updated_at')
+
+    def __init__(self, name, payload, version, updated_at):
+        self.name = name
+        self.payload = payload      # JSON bytes (writer) or a memoryview into the mapping (reader)
+        self.version = version
+        self.updated_at = updated_at
+
+    def data(self):
+        return loads(self.payload)
+
+
+def write_file(path, sections, sequence, fsync=False):
+    """Writes `sections` (name -> Section with bytes payloads) atomically to `path`."""
+    table_end = HEADER.size + SECTION.size * len(sections)
+    entries, offset = [], table_end
+    for section in sections.values():
+        entries.append(SECTION.pack(section.name.encode()[:16], offset, len(section.payload),
+                                    section.version, section.updated_at))
+        offset += len(section.payload)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT, 0, sequence, time.time(), len(sections)))
+        f.writelines(entries)
+        f.writelines(section.payload for section in sections.values())
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_header(buf):
+    """(sequence, written_at, {name: Section}) with payloads as views into buf."""
+    if len(buf) < HEADER.size:
+        raise SnapshotError('truncated header')
+    magic, fmt, _, sequence, written_at, count = HEADER.unpack_from(buf, 0)
+    if magic != MAGIC or fmt != FORMAT:
+        raise SnapshotError(f'not a format {FORMAT} snapshot')
+    view = memoryview(buf)
+    sections = {}
+    for i in range(count):
+        raw_name, offset, length, version, updated_at = SECTION.unpack_from(buf, HEADER.size + i * SECTION.size)
+        if offset + length > len(buf):
+            raise SnapshotError('truncated section')
+        name = raw_name.rstrip(b'\0').decode()
+        sections[name] = Section(name, view[offset:offset + length], version, updated_at)
+    return sequence, written_at, sections
+
+
+class SnapshotWriter:
+    """
+    Fetches every source on a timer and publishes them as one snapshot.
+    sources: name -> function returning (data, updated_at); raising keeps
+    the section's previous content (readers see its age grow).
+    """
+
+    def __init__(self, path, sources, interval=SNAPSHOT_INTERVAL):
+        self.path = path
+        self.sources = sources
+        self.interval = interval
+        self.sequence = 0
+        self.sections = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.counters = {'writes': 0, 'changed_sections': 0, 'errors': 0}
+
+    def load(self):
+        """
+        Adopts the sections of an existing snapshot file (warm start).
+        Returns them (name -> Section) so the caller can prime its caches.
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                sequence, _, sections = read_header(f.read())
+        except (OSError, SnapshotError) as e:
+            print(f"No snapshot to warm start from: {e}")
+            return {}
+        with self._lock:
+            self.sequence = sequence
+            self.sections = {name: Section(name, _view_bytes(s.payload), s.version, s.updated_at)
+                             for name, s in sections.items()}
+            return dict(self.sections)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='snapshot-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+        return self
+
+    def stop(self):
+        """Stops the timer and writes the current state durably (shutdown)."""
+        self._stop.set()
+        with self._lock:
+            if self.sections:
+                write_file(self.path, self.sections, self.sequence, fsync=True)
+
+    def run_once(self):
+        """Fetches every source and writes a new snapshot if anything changed or was refreshed."""
+        collected = {}
+        for name, source in self.sources.items():
+            try:
+                collected[name] = source()
+            except Exception as e:
+                self.counters['errors'] += 1
+                print(f"Snapshot source {name} failed: {e}")
+
+        with self._lock:
+            for name, (data, updated_at) in collected.items():
+                payload = dumps(data)
+                old = self.sections.get(name)
+                if old is not None and old.payload == payload:
+                    old.updated_at = updated_at
+                    continue
+                self.sections[name] = Section(name, payload, (old.version + 1) if old else 1, updated_at)
+                self.counters['changed_sections'] += 1
+            if not collected:
+                return
+            self.sequence += 1
+            write_file(self.path, self.sections, self.sequence)
+            self.counters['writes'] += 1
+
+    def stats(self):
+        with self._lock:
+            out = dict(self.counters)
+            out['sequence'] = self.sequence
+            out['sections'] = {name: {'version': s.version, 'bytes': len(s.payload),
+                                      'age': round(time.time() - s.updated_at, 1)}
+                               for name, s in self.sections.items()}
+        return out
+
+    def _loop(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Snapshot write failed: {e}")
+            self._stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+
+class SnapshotReader:
+    """
+    Follows the snapshot file. apply(name, data, updated_at) is called for
+    each section whose version changed; touch(name, updated_at) when only
+    its updated_at moved (the writer re-confirmed the same content);
+    on_stale(name) once a section is older than max_age (the writer
+    stopped refreshing it).
+    """
+
+    def __init__(self, path, apply, touch=None, on_stale=None, max_age=None, poll=SNAPSHOT_POLL):
+        self.path = path
+        self.apply = apply
+        self.touch = touch
+        self.on_stale = on_stale
+        self.max_age = max_age or {}
+        self.poll = poll
+        self._lock = threading.Lock()
+        self._identity = None
+        self._map = None
+        self._sections = {}
+        self._applied = {}      # name -> version applied
+        self._confirmed = {}    # name -> updated_at applied or touched
+        self._stale = set()
+        self._thread = None
+        self._pid = None
+        self.sequence = None
+        self.counters = {'reloads': 0, 'applied': 0, 'touched': 0, 'errors': 0, 'stale': 0}
+
+    def ensure_started(self):
+        """Starts the follower thread (again, after a fork: threads don't survive one)."""
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    self._thread = threading.Thread(target=self._loop, name='snapshot-reader', daemon=True)
+                    self._thread.start()
+
+    def refresh(self):
+        """Maps a new file if there is one and applies changed sections. True if anything was applied or touched."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        identity = (st.st_ino, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            if identity != self._identity:
+                self._remap(identity)
+            # New versions, plus stale sections the writer has refreshed since
+            # (on_stale may have switched their consumer to another source).
+            now = time.time()
+            changed = [s for name, s in self._sections.items()
+                       if self._applied.get(name) != s.version
+                       or (name in self._stale and not self._too_old(s, now))]
+            for section in changed:
+                self.apply(section.name, section.data(), section.updated_at)
+                self._applied[section.name] = section.version
+                self._confirmed[section.name] = section.updated_at
+                self._stale.discard(section.name)
+                self.counters['applied'] += 1
+            # Same content, newer confirmation: consumers only need the new age.
+            touched = [s for name, s in self._sections.items()
+                       if s not in changed and s.updated_at > self._confirmed.get(name, 0.0)]
+            for section in touched:
+                if self.touch is not None:
+                    self.touch(section.name, section.updated_at)
+                self._confirmed[section.name] = section.updated_at
+                self.counters['touched'] += 1
+            self._check_stale()
+        return bool(changed or touched)
+
+    def stats(self):
+        with self._lock:
+            out = dict(self.counters)
+            out['sequence'] = self.sequence
+            out['sections'] = {name: {'version': s.version, 'age': round(time.time() - s.updated_at, 1),
+                                      'stale': name in self._stale}
+                               for name, s in self._sections.items()}
+        return out
+
+    # --------------------------------------------
+    # Internals (caller holds the lock)
+    # --------------------------------------------
+    def _remap(self, identity):
+        with open(self.path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            sequence, _, sections = read_header(mapped)
+        except SnapshotError:
+            self.counters['errors'] += 1
+            mapped.close()
+            raise
+        old = self._map
+        self._map, self._sections, self._identity, self.sequence = mapped, sections, identity, sequence
+        self.counters['reloads'] += 1
+        if old is not None:
+            _close_quietly(old)
+
+    def _too_old(self, section, now):
+        limit = self.max_age.get(section.name)
+        return bool(limit) and now - section.updated_at > limit
+
+    def _check_stale(self):
+        now = time.time()
+        for name, section in self._sections.items():
+            if name not in self._stale and self._too_old(section, now):
+                self._stale.add(name)
+                self.counters['stale'] += 1
+                if self.on_stale is not None:
+                    self.on_stale(name)
+
+    def _loop(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Snapshot read failed: {e}")
+            time.sleep(self.poll)
+
+
+def _view_bytes(view):
+    return view.tobytes() if isinstance(view, memoryview) else bytes(view)
+
+
+def _close_quietly(mapped):
+    # Views handed out for the old file may still be alive somewhere;
+    # the mapping is then freed with them instead.
+    try:
+        mapped.close()
+    except BufferError:
+        pass
@@ -0,0 +1,143 @@
+"""
+Grid-based spatial index for stations and vehicles.
+
+Points are bucketed into fixed lat/lng cells (~1 km at Boston's latitude
+by default). Nearest-k searches walk outward ring by ring from the query
+cell and stop once no unvisited cell can hold anything closer; radius and
+bounding-box queries only touch the cells they overlap. The cost of a
+query is bounded by the number of occupied cells: a far-away point or an
+oversized box scans the occupied cells instead of walking empty ones.
+"""
+import heapq
+import math
+
+EARTH_RADIUS_M = 6371000.0
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+class GridIndex:
+    def __init__(self, items, cell_deg=0.01):
+        """`items` are dicts with 'lat' and 'lng' keys (stations, vehicles)."""
+        self.cell_deg = cell_deg
+        self.cells = {}
+        self.size = 0
+        max_abs_lat = 0.0
+        for item in items:
+            if item.get('lat') is None or item.get('lng') is None:
+                continue
+            self.cells.setdefault(self._cell(item['lat'], item['lng']), []).append(item)
+            self.size += 1
+            max_abs_lat = max(max_abs_lat, abs(item['lat']))
+        # Smallest ground distance one cell step can cover (longitude shrinks with latitude).
+        self._min_step_m = cell_deg * 111320.0 * math.cos(math.radians(min(max_abs_lat + 1, 89)))
+
+    def _cell(self, lat, lng):
+        return (int(math.floor(lat / self.cell_deg)), int(math.floor(lng / self.cell_deg)))
+
+    def nearest(self, lat, lng, k=1):
+        """Returns up to k (distance_m, item) pairs, closest first."""
+        if self.size == 0 or k <= 0:
+            return []
+        ci, cj = self._cell(lat, lng)
+        heap = []   # max-heap of the best k so far: (-distance, tiebreak, item)
+        ring = 0
+        visited = 0
+        max_ring = max(max(abs(i - ci), abs(j - cj)) for i, j in self.cells)
+        while ring <= max_ring:
+            visited += 8 * ring or 1
+            if visited > len(self.cells):
+                # Mostly empty rings so far (query far from the data):
+                # looking at every occupied cell is cheaper.
+                return self._scan_nearest(lat, lng, k)
+            for cell in self._ring(ci, cj, ring):
+                for item in self.cells.get(cell, ()):
+                    d = haversine_m(lat, lng, item['lat'], item['lng'])
+                    if len(heap) < k:
+                        heapq.heappush(heap, (-d, id(item), item))
+                    elif d < -heap[0][0]:
+                        heapq.heapreplace(heap, (-d, id(item), item))
+            # Anything in ring+1 is at least `ring` full cells away.
+            if len(heap) == k and ring * self._min_step_m > -heap[0][0]:
+                break
+            ring += 1
+        return sorted(((-nd, item) for nd, _, item in heap), key=lambda pair: pair[0])
+
+    def within_radius(self, lat, lng, radius_m):
+        """All (distance_m, item) pairs within radius_m, closest first."""
+        if self.size == 0 or radius_m < 0:
+            return []
+        reach = int(math.ceil(radius_m / self._min_step_m))
+        ci, cj = self._cell(lat, lng)
+        found = []
+        for item in self._items_in(ci - reach, cj - reach, ci + reach, cj + reach):
+            d = haversine_m(lat, lng, item['lat'], item['lng'])
+            if d <= radius_m:
+                found.append((d, item))
+        found.sort(key=lambda pair: pair[0])
+        return found
+
+    def within_bbox(self, south, west, north, east):
+        """All items inside the lat/lng box."""
+        i0, j0 = self._cell(south, west)
+        i1, j1 = self._cell(north, east)
+        return [item for item in self._items_in(i0, j0, i1, j1)
+                if south <= item['lat'] <= north and west <= item['lng'] <= east]
+
+    def _items_in(self, i0, j0, i1, j1):
+        """Items of the cells in [i0, i1] x [j0, j1], by whichever is smaller: the range or the occupied cells."""
+        if i1 < i0 or j1 < j0:
+            return
+        if (i1 - i0 + 1) * (j1 - j0 + 1) > len(self.cells):
+            for (i, j), items in self.cells.items():
+                if i0 <= i <= i1 and j0 <= j <= j1:
+                    yield from items
+            return
+        for i in range(i0, i1 + 1):
+            for j in range(j0, j1 + 1):
+                yield from self.cells.get((i, j), ())
+
+    def _scan_nearest(self, lat, lng, k):
+        pairs = ((haversine_m(lat, lng, item['lat'], item['lng']), item)
+                 for items in self.cells.values() for item in items)
+        return heapq.nsmallest(k, pairs, key=lambda pair: pair[0])
+
+    @staticmethod
+    def _ring(ci, cj, r):
+        if r == 0:
+            yield (ci, cj)
+            return
+        for j in range(cj - r, cj + r + 1):
+            yield (ci - r, j)
+            yield (ci + r, j)
+        for i in range(ci - r + 1, ci + r):
+            yield (i, cj - r)
+            yield (i, cj + r)
+
+
+class IndexHolder:
+    """Rebuilds a GridIndex only when the source list it was built from changes."""
+
+    def __init__(self, cell_deg=0.01):
+        self.cell_deg = cell_deg
+        self._source = None
+        self._version = None
+        self._index = None
+
+    def get(self, items, version=None):
+        """`version` (e.g. a LiveStore counter) overrides the identity check on `items`."""
+        if version is not None:
+            stale = self._index is None or self._version != version
+        else:
+            stale = self._index is None or self._source is not items
+        if stale:
+            self._index = GridIndex(items, self.cell_deg)
+            self._source = items
+            self._version = version
+        return self._index
@@ -1,7 +1,8 @@
 import requests
 import json
+import os
 
-BASE_URL = "http://localhost:5001"
+BASE_URL = os.getenv("ACCESSIBUS_URL", "http://localhost:5001")
 
 def test_health():
     """Test if the server is up"""
@@ -37,7 +38,8 @@ def test_google_directions():
     
     response = requests.post(f"{BASE_URL}/api/directions", json=payload, headers=headers)
     
-    if response.status_code == 200 and 'routes' in response.json()['data']:
+    # data is the list of catchable routes
+    if response.status_code == 200 and response.json()['success'] and len(response.json()['data']) > 0:
         print("✅ PASSED")
     else:
         print(f"❌ FAILED (Response: {response.text})")
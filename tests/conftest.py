@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The modules live at the repository root, not in a package.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Importing server must not start the favorites scheduler (or create favorites.db).
+os.environ.setdefault('FAVORITES_PRECOMPUTE', '0')
@@ -0,0 +1,108 @@
+import hashlib
+import os
+import time
+
+from audio_cache import LEGACY_PREFIX, AudioCache, cache_key
+
+KEY_A = cache_key('Park Street', 'voice', 'model', {'stability': 0.5})
+
+
+def store(cache, key, size):
+    path = cache.path_for(key)
+    with open(path, 'wb') as f:
+        f.write(b'\xff' * size)
+    cache.add(key, path)
+    return path
+
+
+def key(n):
+    return hashlib.md5(str(n).encode()).hexdigest()
+
+
+def test_keys_cover_voice_model_and_settings():
+    assert KEY_A != cache_key('Park Street', 'other-voice', 'model', {'stability': 0.5})
+    assert KEY_A != cache_key('Park Street', 'voice', 'model', {'stability': 0.6})
+    assert KEY_A == cache_key('Park Street', 'voice', 'model', {'stability': 0.5})
+
+
+def test_files_are_sharded_by_key_prefix(tmp_path):
+    cache = AudioCache(str(tmp_path), max_bytes=10_000)
+    path = cache.path_for(KEY_A)
+    assert path == os.path.join(str(tmp_path), KEY_A[:2], KEY_A[2:4], f'{KEY_A}.mp3')
+    assert os.path.isdir(os.path.dirname(path))
+
+
+def test_lookup_goes_from_miss_to_disk_to_hot(tmp_path):
+    cache = AudioCache(str(tmp_path), max_bytes=10_000, hot_after_hits=2)
+    assert cache.lookup(KEY_A) is None
+    path = store(cache, KEY_A, 100)
+    assert cache.lookup(KEY_A) == ('disk', path)
+    assert cache.lookup(KEY_A) == ('disk', path)       # second hit promotes it
+    assert cache.lookup(KEY_A) == ('hot', b'\xff' * 100)
+    stats = cache.stats()
+    assert (stats['misses'], stats['disk_hits'], stats['hot_hits']) == (1, 2, 1)
+
+
+def test_least_recently_used_is_evicted_over_the_byte_cap(tmp_path):
+    cache = AudioCache(str(tmp_path), max_bytes=250)
+    paths = [store(cache, key(i), 100) for i in range(2)]
+    cache.lookup(key(0))                                # key(1) is now the oldest
+    store(cache, key(2), 100)
+    assert cache.lookup(key(1)) is None
+    assert not os.path.exists(paths[1])
+    assert cache.lookup(key(0)) is not None
+    assert cache.stats()['bytes'] == 200
+    assert cache.stats()['evicted_bytes'] == 100
+
+
+def test_restart_rescans_the_shards(tmp_path):
+    cache = AudioCache(str(tmp_path), max_bytes=10_000)
+    for i in range(3):
+        store(cache, key(i), 100)
+    stale_part = cache.path_for(key(0)) + '.abc.part'
+    fresh_part = cache.path_for(key(1)) + '.def.part'
+    for part in (stale_part, fresh_part):
+        open(part, 'wb').close()
+    os.utime(stale_part, (time.time() - 7200, time.time() - 7200))
+
+    restarted = AudioCache(str(tmp_path), max_bytes=10_000)
+    assert restarted.stats()['entries'] == 3
+    assert restarted.stats()['bytes'] == 300
+    assert restarted.lookup(key(2)) is not None
+    assert not os.path.exists(stale_part)
+    assert os.path.exists(fresh_part)               # may still be streaming
+
+
+def test_restart_evicts_oldest_accessed_first_when_over_the_cap(tmp_path):
+    cache = AudioCache(str(tmp_path), max_bytes=10_000)
+    paths = [store(cache, key(i), 100) for i in range(3)]
+    for i, path in enumerate(paths):
+        os.utime(path, (1000 + i, 1000 + i))
+    restarted = AudioCache(str(tmp_path), max_bytes=200)
+    assert restarted.lookup(key(0)) is None and not os.path.exists(paths[0])
+    assert restarted.lookup(key(2)) is not None
+
+
+def test_legacy_flat_files_are_indexed_and_adopted(tmp_path):
+    legacy = hashlib.md5('Doors closing'.encode()).hexdigest()
+    flat = tmp_path / f'{legacy}.mp3'
+    flat.write_bytes(b'\xff' * 50)
+    cache = AudioCache(str(tmp_path), max_bytes=10_000)
+    assert cache.stats()['bytes'] == 50             # counts against the cap
+    assert cache.lookup(legacy) is None             # not reachable under a new-style key
+
+    assert cache.adopt_legacy(legacy, KEY_A)
+    assert not flat.exists()
+    assert cache.lookup(KEY_A) == ('disk', cache.path_for(KEY_A))
+    assert cache.stats()['bytes'] == 50
+    assert not cache.adopt_legacy(legacy, KEY_A)
+
+
+def test_legacy_files_age_out_under_the_cap(tmp_path):
+    legacy = tmp_path / f'{key("old")}.mp3'
+    legacy.write_bytes(b'\xff' * 100)
+    os.utime(legacy, (1000, 1000))
+    cache = AudioCache(str(tmp_path), max_bytes=150)
+    store(cache, KEY_A, 100)
+    assert not legacy.exists()
+    assert LEGACY_PREFIX + key('old') not in cache._index
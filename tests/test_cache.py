@@ -0,0 +1,47 @@
+import pytest
+
+import cache
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache, 'time', clock)
+    return clock
+
+
+def test_lru_expires_entries_after_their_ttl(clock):
+    lru = cache.LRUCache(10)
+    lru.set('a', 1, ttl=30)
+    clock.now += 29
+    assert lru.get('a') == 1
+    clock.now += 1
+    assert lru.get('a') is None
+    assert lru.stats()['expired'] == 1
+    assert lru.stats()['size'] == 0
+
+
+def test_lru_evicts_least_recently_used(clock):
+    lru = cache.LRUCache(2)
+    lru.set('a', 1, ttl=60)
+    lru.set('b', 2, ttl=60)
+    lru.get('a')                # 'b' is now the oldest
+    lru.set('c', 3, ttl=60)
+    assert lru.get('b') is None
+    assert lru.get('a') == 1
+    assert lru.get('c') == 3
+    assert lru.stats()['evictions'] == 1
+
+
+def test_lru_ignores_non_positive_ttl(clock):
+    lru = cache.LRUCache(2)
+    lru.set('a', 1, ttl=0)
+    assert lru.get('a') is None
@@ -0,0 +1,126 @@
+import random
+from datetime import datetime, timedelta
+
+import polyline
+import pytest
+
+from catchability import catchable_routes_multi
+
+NOW = datetime(2026, 6, 4, 8, 0)
+
+
+def reference(res, user_speed, now):
+    """The per-route loop catchable_routes_multi replaced, kept as the spec."""
+    valid_routes = []
+    for i, route in enumerate(res['routes']):
+        leg = route['legs'][0]
+        total_walk_meters = 0
+        first_station_name = "Destination"
+        train_depart_timestamp = 0
+        for step in leg['steps']:
+            if step['travel_mode'] == 'WALKING':
+                if train_depart_timestamp == 0:
+                    total_walk_meters += step['distance']['value']
+            elif step['travel_mode'] == 'TRANSIT':
+                first_station_name = step['transit_details']['departure_stop']['name']
+                train_depart_timestamp = step['transit_details']['departure_time']['value']
+                break
+        user_walk_seconds = int(total_walk_meters / user_speed)
+        user_arrival_at_station_dt = now + timedelta(seconds=user_walk_seconds)
+        if train_depart_timestamp > 0 and user_arrival_at_station_dt.timestamp() > train_depart_timestamp - 60:
+            continue
+        original_duration = leg['duration']['value']
+        delay_diff = user_walk_seconds - total_walk_meters / 1.4
+        real_arrival_val = now.timestamp() + original_duration + delay_diff
+        diff_min = int((datetime.fromtimestamp(train_depart_timestamp) - now).total_seconds() / 60)
+
+        clean_steps, transit_lines = [], []
+        for step in leg['steps']:
+            if 'transit_details' in step:
+                transit = step['transit_details']
+                line_name = transit['line'].get('name', 'Transit')
+                if line_name not in transit_lines:
+                    transit_lines.append(line_name)
+                clean_steps.append({'instruction': f"Board <b>{line_name}</b> at {transit['departure_stop']['name']}"})
+                clean_steps.append({'instruction': f"Ride {transit.get('num_stops', 0)} stops"})
+            else:
+                clean_steps.append({'instruction': step['html_instructions']})
+        path_points = []
+        if 'overview_polyline' in route:
+            path_points = [{'lat': p[0], 'lng': p[1]} for p in polyline.decode(route['overview_polyline']['points'])]
+
+        valid_routes.append({
+            'id': i,
+            'sort_arrival': real_arrival_val,
+            'summary': "Via " + " & ".join(transit_lines) if transit_lines else "Walking Route",
+            'distance': leg['distance']['text'],
+            'duration': f"{int((original_duration + delay_diff) / 60)} min",
+            'time_range': f"Leave Now – {(datetime.fromtimestamp(real_arrival_val)).strftime('%-I:%M %p')}",
+            'countdown': f"Departs in {diff_min} min" if diff_min > 0 else "Now",
+            'station_eta': f"Reach {first_station_name} by {user_arrival_at_station_dt.strftime('%-I:%M %p')}",
+            'steps': clean_steps,
+            'path': path_points,
+        })
+    valid_routes.sort(key=lambda x: x['sort_arrival'])
+    return valid_routes[:3]
+
+
+def walk(meters):
+    return {'travel_mode': 'WALKING', 'distance': {'value': meters}, 'html_instructions': f'Walk {meters} m'}
+
+
+def ride(line, stop, depart_ts, num_stops=3):
+    return {'travel_mode': 'TRANSIT', 'html_instructions': f'{line} train',
+            'transit_details': {'line': {'name': line}, 'departure_stop': {'name': stop},
+                                'departure_time': {'value': depart_ts}, 'num_stops': num_stops}}
+
+
+def random_response(rng):
+    routes = []
+    for _ in range(rng.randint(1, 6)):
+        steps = [walk(rng.randint(0, 1500)) for _ in range(rng.randint(0, 2))]
+        if rng.random() < 0.85:
+            depart = int(NOW.timestamp()) + rng.randint(-300, 1800)
+            steps.append(ride(rng.choice(['Red Line', 'Orange Line', 'Green Line B']), rng.choice(['Park Street', 'Kendall/MIT']), depart))
+            steps += [walk(rng.randint(0, 800)) for _ in range(rng.randint(0, 2))]
+        route = {'legs': [{'steps': steps, 'duration': {'value': rng.randint(300, 4000)},
+                           'distance': {'text': f'{rng.uniform(0.2, 9):.1f} mi'}}]}
+        if rng.random() < 0.7:
+            coords = [(42.35 + rng.uniform(-0.05, 0.05), -71.06 + rng.uniform(-0.05, 0.05)) for _ in range(rng.randint(2, 6))]
+            route['overview_polyline'] = {'points': polyline.encode(coords)}
+        routes.append(route)
+    return {'status': 'OK', 'routes': routes}
+
+
+def test_matches_reference_loop_on_random_responses():
+    rng = random.Random(2024)
+    for _ in range(400):
+        res = random_response(rng)
+        speeds = [0.9, 1.4, 1.8, rng.uniform(0.3, 3.0)]
+        now = NOW + timedelta(seconds=rng.randint(-600, 600))
+        got = catchable_routes_multi(res, speeds, now)
+        assert got == [reference(res, speed, now) for speed in speeds]
+
+
+def test_empty_response():
+    assert catchable_routes_multi({'routes': []}, [0.9, 1.4], NOW) == [[], []]
+
+
+def test_nothing_catchable():
+    soon = int(NOW.timestamp()) + 90
+    res = {'routes': [
+        {'legs': [{'steps': [walk(400), ride('Red Line', 'Park Street', soon)],
+                   'duration': {'value': 900}, 'distance': {'text': '1.0 mi'}}]},
+        {'legs': [{'steps': [walk(1200), ride('Orange Line', 'State', soon + 60)],
+                   'duration': {'value': 1200}, 'distance': {'text': '2.0 mi'}}]},
+    ]}
+    assert catchable_routes_multi(res, [0.9, 1.4, 1.8], NOW) == [[], [], []]
+    assert reference(res, 1.8, NOW) == []
+
+
+@pytest.mark.parametrize('speed', [0.5, 1.4, 2.5])
+def test_walking_only_routes_are_always_catchable(speed):
+    res = {'routes': [{'legs': [{'steps': [walk(700)], 'duration': {'value': 500}, 'distance': {'text': '0.4 mi'}}]}]}
+    (routes,) = catchable_routes_multi(res, [speed], NOW)
+    assert routes == reference(res, speed, NOW)
+    assert routes[0]['summary'] == 'Walking Route'
@@ -0,0 +1,83 @@
+import math
+from datetime import datetime
+
+import pytest
+
+from favorites import LISTED_REFRESH_SECONDS, MAX_FAVORITES_PER_USER, FavoriteError, FavoritesStore, Precomputer
+
+
+@pytest.fixture
+def store(tmp_path):
+    return FavoritesStore(str(tmp_path / 'favorites.db'))
+
+
+def test_add_normalizes_and_lists(store):
+    saved = store.add('u1', {'origin': ' Park Street ', 'destination': {'lat': '42.37', 'lng': -71.12},
+                             'walking_speed': 'slow', 'travel_times': ['8:05']})
+    assert saved['origin'] == 'Park Street'
+    assert saved['destination'] == {'lat': 42.37, 'lng': -71.12}
+    assert saved['travel_times'] == ['08:05']
+    assert store.list('u1') == [saved]
+    assert store.list('u2') == []
+
+
+@pytest.mark.parametrize('destination', [
+    {'lat': 'north', 'lng': -71.0},
+    {'lat': 42.3},
+    {'lat': math.nan, 'lng': -71.0},
+    {'lat': 42.3, 'lng': math.inf},
+    {'lat': 91, 'lng': -71.0},
+    {'lat': 42.3, 'lng': -181},
+    '   ',
+    ['42.3', '-71.0'],
+])
+def test_rejects_bad_locations(store, destination):
+    with pytest.raises(FavoriteError):
+        store.add('u1', {'origin': 'Park Street', 'destination': destination})
+
+
+def test_rejects_missing_fields_and_bad_times(store):
+    with pytest.raises(FavoriteError):
+        store.add('u1', {'origin': 'Park Street'})
+    with pytest.raises(FavoriteError):
+        store.add('u1', {'origin': 'Park Street', 'destination': 'Harvard', 'travel_times': ['25:00']})
+    assert store.list('u1') == []
+
+
+def test_limit_per_user(store):
+    for i in range(MAX_FAVORITES_PER_USER):
+        store.add('u1', {'origin': f'A{i}', 'destination': 'B'})
+    with pytest.raises(FavoriteError):
+        store.add('u1', {'origin': 'A', 'destination': 'B'})
+    store.add('u2', {'origin': 'A', 'destination': 'B'})
+
+
+def test_delete_only_own_favorites(store):
+    saved = store.add('u1', {'origin': 'A', 'destination': 'B'})
+    assert not store.delete('u2', saved['id'])
+    assert store.delete('u1', saved['id'])
+    assert store.list('u1') == []
+
+
+def test_all_does_not_create_the_database(tmp_path):
+    path = tmp_path / 'favorites.db'
+    assert FavoritesStore(str(path)).all() == []
+    assert not path.exists()
+
+
+def test_listing_queues_refreshes_once_per_user_window(store):
+    planned = []
+    precomputer = Precomputer(store, lambda favorite: planned.append(favorite['id']) or {'status': 'OK'})
+    anytime = store.add('u1', {'origin': 'A', 'destination': 'B'})
+    commute = store.add('u1', {'origin': 'A', 'destination': 'C', 'travel_times': ['03:00']})
+    saved = store.list('u1')
+
+    # Only the favorite without travel times is the listing's business.
+    assert precomputer.request_listed('u1', saved, now=1000.0) == 1
+    assert precomputer.request_listed('u1', saved, now=1000.0 + LISTED_REFRESH_SECONDS - 1) == 0
+    assert precomputer.request_listed('u2', store.list('u2'), now=1001.0) == 0
+    precomputer.run_once(now=datetime(2025, 6, 4, 12, 0))
+    assert planned == [anytime['id']]
+    assert commute['id'] not in planned
+    # Fresh now: listing again after the window queues nothing.
+    assert precomputer.request_listed('u1', store.list('u1')) == 0
@@ -0,0 +1,62 @@
+import math
+
+import numpy as np
+import polyline
+
+import geometry
+
+# Google's example line.
+ENCODED = '_p~iF~ps|U_ulLnnqC_mqNvxq`@'
+
+
+def test_decode_matches_polyline_library():
+    assert geometry.decode(ENCODED).tolist() == [list(p) for p in polyline.decode(ENCODED)]
+
+
+def test_decode_roundtrips_through_encode():
+    coords = np.array([(42.35212, -71.05524), (42.35641, -71.06242), (42.36632, -71.06199)])
+    assert np.allclose(geometry.decode(geometry.encode(coords)), coords)
+
+
+def test_decode_empty():
+    assert geometry.decode('').shape == (0, 2)
+    assert geometry.encode(np.zeros((0, 2))) == ''
+
+
+def test_importance_keeps_end_points_and_ranks_the_corner():
+    coords = np.array([(42.0, -71.0), (42.0, -70.99), (42.0, -70.98), (42.01, -70.98)])
+    ranks = geometry.importance(coords)
+    assert math.isinf(ranks[0]) and math.isinf(ranks[-1])
+    assert ranks[1] < 1e-6                    # on the straight run
+    assert ranks[2] > 500                     # the corner, ~800 m off the chord
+
+
+def test_importance_never_outranks_its_parent_split():
+    rng = np.random.default_rng(3)
+    coords = np.column_stack((np.linspace(42.0, 42.1, 200), -71.0 + rng.normal(0, 0.002, 200)))
+    ranks = geometry.importance(coords)
+    # Simplifying at any tolerance keeps a subset of any finer tolerance.
+    coarse, fine = ranks >= 100, ranks >= 10
+    assert np.all(fine[coarse])
+
+
+def test_levels_are_computed_lazily_and_coarsen_with_zoom():
+    coords = np.column_stack((np.linspace(42.0, 42.1, 500), -71.0 + 0.01 * np.sin(np.linspace(0, 20, 500))))
+    line = geometry.Geometry(coords)
+    assert line.at_zoom(None) is coords
+    assert line._levels is None
+    sizes = [len(line.at_zoom(z)) for z in geometry.ZOOM_LEVELS]
+    assert sizes == sorted(sizes) and sizes[-1] <= len(coords)
+    assert line.at_zoom(geometry.ZOOM_LEVELS[-1] + 1) is coords
+    for z in geometry.ZOOM_LEVELS:
+        simplified = line.at_zoom(z)
+        assert simplified[0].tolist() == coords[0].tolist()
+        assert simplified[-1].tolist() == coords[-1].tolist()
+
+
+def test_path_formats():
+    line = geometry.from_polyline(ENCODED)
+    assert line.path('polyline') == ENCODED
+    assert line.path('flat') == line.coords.ravel().tolist()
+    assert line.path('points')[0] == {'lat': 38.5, 'lng': -120.2}
+    assert geometry.from_polyline(ENCODED) is line
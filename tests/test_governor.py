@@ -0,0 +1,219 @@
+import pytest
+
+import governor
+import upstream
+from cache import CachedResource, UpstreamError
+
+HOST = 'api.test'
+
+
+class Clock:
+    """Stands in for the time module inside governor: monotonic() only moves on sleep()/advance()."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    advance = sleep
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(governor, 'time', clock)
+    monkeypatch.setattr(governor, '_budgets', {})
+    monkeypatch.setattr(governor, '_breakers', {})
+    monkeypatch.setattr(governor, 'RATE_LIMITS', {HOST: 60})     # 1 token/s, 15 in the bucket
+    return clock
+
+
+def drain(budget, priority):
+    granted = 0
+    while budget.reserve(priority) == 0.0:
+        granted += 1
+    return granted
+
+
+def test_bucket_refills_at_its_rate(clock):
+    budget = governor.Budget(60)
+    assert budget.capacity == 15
+    assert drain(budget, 'directions') == 15
+    assert budget.reserve('directions') == pytest.approx(1.0)
+    clock.advance(2.5)
+    assert drain(budget, 'directions') == 2
+    clock.advance(3600)
+    assert drain(budget, 'directions') == 15       # never refills past capacity
+
+
+@pytest.mark.parametrize('priority, granted', [
+    ('background', 7),          # must leave half the bucket
+    ('alerts', 11),
+    ('stations', 11),
+    ('predictions', 13),
+    ('vehicles', 13),
+    ('directions', 15),         # may spend the last token
+    ('unknown', 11),            # treated as DEFAULT_PRIORITY
+])
+def test_priority_reserves(clock, priority, granted):
+    assert drain(governor.Budget(60), priority) == granted
+
+
+def test_low_priority_is_shed_first(clock):
+    for _ in range(8):
+        governor.acquire(HOST, priority='directions')
+    # 7 tokens left: below the background reserve, above everyone else's.
+    with pytest.raises(governor.Throttled):
+        governor.acquire(HOST, priority='background')
+    governor.acquire(HOST, priority='alerts')
+    governor.acquire(HOST, priority='predictions')
+    stats = governor.stats()['budgets'][HOST]
+    assert stats['throttled'] == {'background': 1}
+    assert stats['granted'] == {'directions': 8, 'alerts': 1, 'predictions': 1}
+
+
+def test_acquire_waits_up_to_the_priority_max_wait(clock):
+    budget = governor._budget(HOST, None)
+    drain(budget, 'directions')
+    start = clock.now
+    governor.acquire(HOST, priority='directions')       # waits 1s of its 2s
+    assert clock.now - start == pytest.approx(1.0)
+    assert governor.stats()['budgets'][HOST]['waited_s'] == pytest.approx(1.0)
+    drain(budget, 'directions')
+    with pytest.raises(governor.Throttled):
+        governor.acquire(HOST, priority='predictions')  # would need 3.5s, may wait 0.5s
+
+
+def test_api_keys_get_separate_buckets(clock):
+    drain(governor._budget(HOST, 'key-a'), 'directions')
+    governor.acquire(HOST, 'key-b', priority='background')
+    names = list(governor.stats()['budgets'])
+    assert len(names) == 2
+    assert not any('key-a' in name or 'key-b' in name for name in names)   # hashed, not leaked
+
+
+def test_unbudgeted_host_is_never_throttled(clock):
+    for _ in range(100):
+        assert governor.check('example.org', priority='background') == 0.0
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    for _ in range(governor.BREAKER_FAILURES - 1):
+        governor.report(HOST, 503)
+    governor.acquire(HOST)
+    governor.report(HOST, 200)                       # a success resets the count
+    for _ in range(governor.BREAKER_FAILURES - 1):
+        governor.report(HOST, None)
+    assert governor.breaker(HOST).state == 'closed'
+    governor.report(HOST, 502)
+    assert governor.breaker(HOST).state == 'open'
+    with pytest.raises(governor.CircuitOpen):
+        governor.acquire(HOST, priority='directions')
+
+
+def test_429_opens_at_once_for_retry_after(clock):
+    governor.report(HOST, 429, retry_after='7')
+    assert governor.stats()['breakers'][HOST]['retry_in_s'] == 7.0
+    clock.advance(6.9)
+    with pytest.raises(governor.CircuitOpen):
+        governor.check(HOST)
+    clock.advance(0.1)
+    assert governor.check(HOST) == 0.0
+
+
+def test_half_open_lets_one_probe_through_then_closes(clock):
+    governor.trip(HOST)
+    clock.advance(governor.BREAKER_COOLDOWN)
+    governor.acquire(HOST)                                   # the probe
+    assert governor.breaker(HOST).state == 'half_open'
+    with pytest.raises(governor.CircuitOpen):
+        governor.acquire(HOST)                               # one probe at a time
+    governor.report(HOST, 200)
+    assert governor.breaker(HOST).state == 'closed'
+    governor.acquire(HOST)
+    governor.acquire(HOST)
+    assert governor.stats()['breakers'][HOST] == {'opened': 1, 'rejected': 1, 'state': 'closed', 'failures': 0}
+
+
+def test_failed_probe_reopens(clock):
+    governor.trip(HOST)
+    clock.advance(governor.BREAKER_COOLDOWN)
+    governor.acquire(HOST)
+    governor.report(HOST, 500)
+    assert governor.breaker(HOST).state == 'open'
+    with pytest.raises(governor.CircuitOpen):
+        governor.check(HOST)
+
+
+def test_throttled_probe_gives_its_slot_back(clock):
+    governor.trip(HOST)
+    clock.advance(governor.BREAKER_COOLDOWN)
+    budget = governor._budget(HOST, None)
+    drain(budget, 'directions')
+    with pytest.raises(governor.Throttled):
+        governor.acquire(HOST, priority='background')
+    governor.release(HOST)
+    clock.advance(1)
+    governor.acquire(HOST, priority='directions')            # still allowed to probe
+
+
+class Response:
+    raw = None
+    headers = {}
+
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.body = body
+
+    def json(self):
+        return self.body
+
+
+@pytest.fixture
+def upstream_answers(monkeypatch):
+    """Scripted responses for every upstream call to HOST; returns (responses to hand out, urls called)."""
+    answers, calls = [], []
+    session = upstream.session_for(f'https://{HOST}/')
+
+    def fake_request(method, url, **kwargs):
+        calls.append(url)
+        return answers.pop(0)
+
+    monkeypatch.setattr(session, 'request', fake_request)
+    return answers, calls
+
+
+def test_open_circuit_serves_last_known_good(clock, upstream_answers):
+    answers, calls = upstream_answers
+    resource = CachedResource('stops', f'https://{HOST}/stops', parse=lambda body: body['data'], ttl=10, max_stale=0)
+    answers.append(Response(200, {'data': ['place-pktrm']}))
+    assert resource.refresh() == ['place-pktrm']
+    resource.prime(['place-pktrm'], fetched_at=resource.fetched_at - 60)    # past ttl + max_stale
+
+    for _ in range(governor.BREAKER_FAILURES):
+        answers.append(Response(503))
+        with pytest.raises(UpstreamError):
+            resource.refresh()
+    assert governor.breaker(HOST).state == 'open'
+
+    # Refused before anything is sent, and the old copy is served instead.
+    sent = len(calls)
+    assert resource.get() == ['place-pktrm']
+    assert len(calls) == sent
+
+    clock.advance(governor.BREAKER_COOLDOWN)
+    answers.append(Response(200, {'data': ['place-pktrm', 'place-dwnxg']}))
+    assert resource.get() == ['place-pktrm', 'place-dwnxg']
+    assert governor.breaker(HOST).state == 'closed'
+
+
+def test_open_circuit_without_a_copy_is_an_error(clock, upstream_answers):
+    resource = CachedResource('alerts', f'https://{HOST}/alerts', parse=lambda body: body, ttl=10)
+    governor.trip(HOST)
+    with pytest.raises(UpstreamError, match='circuit open'):
+        resource.get()
+    assert upstream_answers[1] == []
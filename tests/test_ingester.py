@@ -0,0 +1,73 @@
+import os
+import time
+from datetime import datetime
+
+import pytest
+
+from ingester import FixtureSource, LiveStore, StreamIngester, parse_events
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fixtures')
+RECORDED_AT = datetime.fromisoformat('2026-10-17T08:00:00-04:00').timestamp()
+
+
+def replay(name, now=None):
+    store = LiveStore()
+    events = []
+    store.listeners.append(lambda event, items: events.append((event, [r['id'] for r in items])))
+    StreamIngester(name, FixtureSource(os.path.join(FIXTURES, f'{name}.sse'), now=now), store,
+                   reconnect=False).run_once()
+    return store, events
+
+
+@pytest.mark.parametrize('lines, expected', [
+    (['event: reset', 'data: []', ''], [('reset', [])]),
+    ([b'event: add\r\n', b'data: {"id": 1}\r\n', b'\r\n'], [('add', {'id': 1})]),
+    (['event: update', 'data: {"id":', 'data:  2}', ''], [('update', {'id': 2})]),
+    ([': keep-alive', '', 'event: remove', 'data: {"id": 3}'], [('remove', {'id': 3})]),
+    (['data: {"id": 4}', ''], []),
+])
+def test_parse_events(lines, expected):
+    assert list(parse_events(lines)) == expected
+
+
+def test_store_applies_reset_add_update_remove():
+    store = LiveStore()
+    assert not store.ready
+    store.apply('reset', [{'type': 'vehicle', 'id': 'a', 'v': 1}, {'type': 'vehicle', 'id': 'b'}])
+    assert store.ready and store.version == 1
+    store.apply('add', {'type': 'vehicle', 'id': 'c'})
+    store.apply('update', {'type': 'vehicle', 'id': 'a', 'v': 2})
+    store.apply('remove', {'type': 'vehicle', 'id': 'b'})
+    store.apply('bogus', {'type': 'vehicle', 'id': 'x'})
+    assert sorted(r['id'] for r in store.all('vehicle')) == ['a', 'c']
+    assert store.get('vehicle', 'a')['v'] == 2
+    assert store.version == 4
+    assert {k: store.stats()[k] for k in ('reset', 'add', 'update', 'remove')} == \
+        {'reset': 1, 'add': 1, 'update': 1, 'remove': 1}
+
+
+def test_vehicles_fixture_replay():
+    store, events = replay('vehicles')
+    assert store.ready
+    assert [event for event, _ in events] == ['reset', 'update', 'add', 'remove']
+    assert store.get('vehicle', 'R-5477B8D2') is not None
+    assert store.get('vehicle', 'G-10081') is None
+
+
+def test_predictions_fixture_replay_is_shifted_to_now():
+    now = time.time()
+    store, events = replay('predictions', now=now)
+    assert [event for event, _ in events] == ['reset', 'update', 'add', 'remove']
+    assert store.get('prediction', 'prediction-B1-70077') is None
+    assert store.get('prediction', 'prediction-A4-70076') is not None
+    updated = store.get('prediction', 'prediction-A1-70075')['attributes']
+    assert updated['status'] == 'Delayed'
+    # Recorded as 08:04 with the recording made at 08:00: four minutes from now.
+    arrival = datetime.fromisoformat(updated['arrival_time']).timestamp()
+    assert arrival - now == pytest.approx(4 * 60, abs=1)
+
+
+def test_predictions_fixture_keeps_recorded_times_when_replayed_at_recording():
+    store, _ = replay('predictions', now=RECORDED_AT)
+    attrs = store.get('prediction', 'prediction-A1-70075')['attributes']
+    assert datetime.fromisoformat(attrs['arrival_time']).timestamp() == RECORDED_AT + 4 * 60
@@ -0,0 +1,106 @@
+import re
+
+import pytest
+from flask import Flask
+
+import metrics
+import server
+
+TIMING = re.compile(r'^(\w+;dur=\d+\.\d, )*total;dur=\d+\.\d$')
+
+
+@pytest.fixture
+def client():
+    return server.app.test_client()
+
+
+def sample(text, line_prefix):
+    """The value of the exposition line starting with line_prefix (0 if absent)."""
+    for line in text.splitlines():
+        if line.startswith(line_prefix + ' '):
+            return float(line.rsplit(' ', 1)[1])
+    return 0
+
+
+def test_server_timing_header(client):
+    response = client.get('/api/upstream/stats')
+    timing = response.headers['Server-Timing']
+    assert TIMING.match(timing)
+    assert timing.startswith('serialize;dur=')
+    # Error responses are traced as well.
+    assert TIMING.match(client.get('/api/mbta/predictions?stop=place-pktrm&limit=x').headers['Server-Timing'])
+
+
+def test_metrics_exposition(client):
+    labels = 'endpoint="get_predictions_batch",method="GET",status="400"'
+    before = sample(client.get('/metrics').get_data(as_text=True), f'accessibus_request_seconds_count{{{labels}}}')
+    client.get('/api/mbta/predictions?stop=place-pktrm&limit=x')
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+    text = response.get_data(as_text=True)
+
+    assert '# TYPE accessibus_request_seconds histogram' in text
+    assert sample(text, f'accessibus_request_seconds_count{{{labels}}}') == before + 1
+    assert sample(text, f'accessibus_request_seconds_bucket{{{labels},le="+Inf"}}') == before + 1
+    assert f'accessibus_request_seconds_sum{{{labels}}} ' in text
+    buckets = [sample(text, f'accessibus_request_seconds_bucket{{{labels},le="{metrics._number(b)}"}}')
+               for b in metrics.BUCKETS]
+    assert buckets == sorted(buckets)           # cumulative
+    assert '# TYPE accessibus_span_seconds histogram' in text
+    assert 'accessibus_span_seconds_count{endpoint="get_predictions_batch",span="serialize"} ' in text
+
+    for name in ('cache_hits_total', 'cache_misses_total', 'coalesced_fetches_total'):
+        assert f'# TYPE accessibus_{name} counter' in text
+    assert '# TYPE accessibus_cache_hit_ratio gauge' in text
+    assert re.search(r'^accessibus_cache_hits_total\{cache="stations"\} \d+$', text, re.M)
+    assert re.search(r'^accessibus_push_subscribers \d+$', text, re.M)
+
+
+def test_spans_are_broken_down_per_request():
+    app = Flask(__name__)
+    metrics.instrument(app)
+
+    @app.route('/work')
+    def work():
+        with metrics.span('upstream'):
+            pass
+        with metrics.span('upstream'):
+            pass
+        with metrics.span('filter'):
+            pass
+        return 'ok'
+
+    timing = app.test_client().get('/work').headers['Server-Timing']
+    assert [part.split(';')[0] for part in timing.split(', ')] == ['upstream', 'filter', 'total']
+    text = metrics.render()
+    assert sample(text, 'accessibus_span_seconds_count{endpoint="work",span="upstream"}') >= 1
+    assert 'accessibus_request_seconds_count{endpoint="work",method="GET",status="200"}' in text
+
+
+def test_span_outside_a_request_records_nothing():
+    with metrics.span('upstream'):
+        pass
+    assert metrics._current.get() is None
+
+
+def test_render_families():
+    text = metrics.render([
+        ('things_total', 'counter', 'Things.', [({'kind': 'a "quoted"\nname'}, 3), ({}, None)]),
+        ('up', 'gauge', 'Up.', [({}, True), ({'host': 'x'}, 0.25)]),
+    ])
+    assert '# HELP accessibus_things_total Things.\n# TYPE accessibus_things_total counter\n' in text
+    assert 'accessibus_things_total{kind="a \\"quoted\\"\\nname"} 3\n' in text
+    assert not re.search(r'^accessibus_things_total ', text, re.M)    # None samples are skipped
+    assert 'accessibus_up 1\n' in text
+    assert 'accessibus_up{host="x"} 0.25\n' in text
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        histogram.observe(value)
+    counts, total, n = histogram.snapshot()
+    assert counts == [1, 3]
+    assert n == 4 and total == pytest.approx(4.25)
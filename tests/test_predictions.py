@@ -0,0 +1,97 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from predictions import DEPARTED_GRACE, Prediction, PredictionStore, apply_stream_event, from_resource
+
+NOW = 1_800_000_000.0
+
+
+def make(id, stop='70075', route='Red', direction=0, minutes=5):
+    return Prediction(id, stop, route, direction, NOW + minutes * 60, None)
+
+
+@pytest.fixture
+def store():
+    store = PredictionStore()
+    store.set_parent('70075', 'place-pktrm')
+    store.set_parent('70076', 'place-pktrm')
+    store.reset([
+        make('a', minutes=9),
+        make('b', minutes=2),
+        make('c', stop='70076', direction=1, minutes=4),
+        make('d', route='Green-B', minutes=6),
+    ])
+    return store
+
+
+def ids(rows):
+    return [row['id'] for row in rows]
+
+
+def test_indexed_by_stop_and_parent_in_time_order(store):
+    assert ids(store.next_departures('70075', now=NOW)) == ['b', 'd', 'a']
+    assert ids(store.next_departures('place-pktrm', now=NOW)) == ['b', 'c', 'd', 'a']
+    assert store.next_departures('place-nowhere', now=NOW) == []
+
+
+@pytest.mark.parametrize('route, direction, expected', [
+    ('Red', None, ['b', 'c', 'a']),
+    (None, 1, ['c']),
+    ('Red', 0, ['b', 'a']),
+    ('Green-B', 1, []),
+])
+def test_route_and_direction_filters(store, route, direction, expected):
+    assert ids(store.next_departures('place-pktrm', route=route, direction_id=direction, now=NOW)) == expected
+
+
+def test_limit(store):
+    assert ids(store.next_departures('place-pktrm', limit=2, now=NOW)) == ['b', 'c']
+    assert store.next_departures('place-pktrm', limit=-2, now=NOW) == []
+
+
+def test_departed_trains_drop_out_after_the_grace(store):
+    later = NOW + 2 * 60 + DEPARTED_GRACE - 1
+    assert ids(store.next_departures('70075', now=later))[0] == 'b'
+    assert store.next_departures('70075', now=later)[0]['minutes'] == 0
+    assert ids(store.next_departures('70075', now=later + 2)) == ['d', 'a']
+
+
+def test_upsert_moves_and_remove_unindexes(store):
+    store.upsert(make('a', minutes=1))
+    assert ids(store.next_departures('70075', now=NOW)) == ['a', 'b', 'd']
+    store.remove('b')
+    store.remove('missing')
+    assert ids(store.next_departures('place-pktrm', route='Red', now=NOW)) == ['a', 'c']
+    assert store.stats()['predictions'] == 3
+
+
+def test_parent_learned_later_refiles_predictions():
+    store = PredictionStore()
+    store.upsert(make('x', stop='70077'))
+    assert store.next_departures('place-dwnxg', now=NOW) == []
+    store.set_parent('70077', 'place-dwnxg')
+    assert ids(store.next_departures('place-dwnxg', now=NOW)) == ['x']
+
+
+def test_stream_events_mirror_into_the_store():
+    def resource(id, minutes, stop='70075'):
+        return {'type': 'prediction', 'id': id,
+                'attributes': {'arrival_time': None, 'departure_time': _iso(minutes), 'direction_id': 0},
+                'relationships': {'route': {'data': {'id': 'Red'}}, 'stop': {'data': {'id': stop}}}}
+
+    store = PredictionStore()
+    stop = {'type': 'stop', 'id': '70075', 'relationships': {'parent_station': {'data': {'id': 'place-pktrm'}}}}
+    apply_stream_event(store, 'reset', [stop, resource('p1', 3), resource('p2', 8)])
+    apply_stream_event(store, 'add', [resource('p3', 1)])
+    apply_stream_event(store, 'remove', [{'type': 'prediction', 'id': 'p2'}])
+    assert ids(store.next_departures('place-pktrm', now=NOW)) == ['p3', 'p1']
+    untimed = resource('p1', 0)
+    untimed['attributes']['departure_time'] = None
+    apply_stream_event(store, 'update', [untimed])
+    assert from_resource(untimed) is None
+    assert ids(store.next_departures('place-pktrm', now=NOW)) == ['p3']
+
+
+def _iso(minutes):
+    return datetime.fromtimestamp(NOW + minutes * 60, timezone.utc).isoformat()
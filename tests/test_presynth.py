@@ -0,0 +1,109 @@
+import pytest
+
+import presynth
+from presynth import Template
+
+ARRIVING, BOARD, DEPARTS = (t.pattern for t in presynth.TEMPLATES)
+
+
+@pytest.mark.parametrize('pattern, text, segments', [
+    (ARRIVING, 'Red Line arriving at Park Street', ['Red Line', 'arriving at', 'Park Street']),
+    (ARRIVING, 'Red Line arriving at Park Street.', ['Red Line', 'arriving at', 'Park Street']),
+    (ARRIVING, '  Blue Line arriving at Maverick  ', ['Blue Line', 'arriving at', 'Maverick']),
+    (ARRIVING, 'Green Line arriving at Arlington arriving at Boylston',
+     ['Green Line', 'arriving at', 'Arlington arriving at Boylston']),     # slots match lazily, left to right
+    (ARRIVING, 'Red Line departing Park Street', None),
+    (ARRIVING, 'Board Red Line at Park Street', None),
+    (ARRIVING, 'red line Arriving At park street', None),                   # literals are case-sensitive
+    (BOARD, 'Board Orange Line at Downtown Crossing', ['Board', 'Orange Line', 'at', 'Downtown Crossing']),
+    (BOARD, 'Board Red Line at', None),
+    (BOARD, 'Please board Red Line at Park Street', None),                 # anchored at the start
+    (DEPARTS, 'Departs in 4 min', ['Departs in', '4', 'min']),
+    (DEPARTS, 'Departs in 12 min.', ['Departs in', '12', 'min']),
+    (DEPARTS, 'Departs in 4 minutes', None),                               # anchored at the end
+    (DEPARTS, 'Departs in  min', None),
+    ('{a}{b}', 'xy', ['x', 'y']),
+    ('Next stop', 'Next stop', ['Next stop']),
+    ('Next stop', 'Next stop Kendall', None),
+])
+def test_segments(pattern, text, segments):
+    assert Template(pattern).segments(text) == segments
+
+
+@pytest.mark.parametrize('pattern, literals', [
+    (ARRIVING, ['arriving at']),
+    (BOARD, ['Board', 'at']),
+    (DEPARTS, ['Departs in', 'min']),
+    ('{a}{b}', []),
+    ('Mind the gap', ['Mind the gap']),
+])
+def test_literals(pattern, literals):
+    assert Template(pattern).literals() == literals
+
+
+def test_special_characters_in_literals_are_matched_literally():
+    template = Template('{line} (shuttle) to {station}?')
+    assert template.segments('Red Line (shuttle) to Braintree?') == ['Red Line', '(shuttle) to', 'Braintree', '?']
+    assert template.segments('Red Line Xshuttle) to Braintree?') is None
+
+
+def test_template_segments_stitch_back_to_the_text():
+    for template in presynth.TEMPLATES:
+        for text in ['Red Line arriving at Park Street', 'Board Red Line at Park Street', 'Departs in 7 min']:
+            segments = template.segments(text)
+            if segments:
+                assert ' '.join(segments) == text
+
+
+STATIONS = [
+    {'name': 'Park Street', 'routes': ['Red', 'Green']},
+    {'name': 'Downtown Crossing', 'routes': ['Red', 'Orange']},
+    {'name': 'Park Street', 'routes': ['Red']},              # listed twice (two platforms)
+]
+ALERTS = [
+    {'header': 'Shuttle buses replace Red Line service'},
+    {'header': ''},
+    {'effect': 'DELAY'},
+    {'header': 'Shuttle buses replace Red Line service'},
+]
+
+
+@pytest.mark.parametrize('phrase, expected', [
+    ('arriving at', True),
+    ('Board', True),
+    ('Departs in', True),
+    ('min', True),
+    ('Orange Line', True),
+    ('Downtown Crossing', True),
+    ('1', True),
+    (str(presynth.MAX_MINUTES), True),
+    (str(presynth.MAX_MINUTES + 1), False),
+    ('0', False),
+    ('Board Green Line at Park Street', True),
+    ('Board Orange Line at Downtown Crossing', True),
+    ('Board Orange Line at Park Street', False),             # not a route of that station
+    ('Shuttle buses replace Red Line service', True),
+    ('', False),
+])
+def test_collect_phrases_contents(phrase, expected):
+    assert (phrase in presynth.collect_phrases(STATIONS, ALERTS)) == expected
+
+
+def test_collect_phrases_order_and_duplicates():
+    phrases = presynth.collect_phrases(STATIONS, ALERTS)
+    assert len(phrases) == len(set(phrases))
+    literals = [literal for t in presynth.TEMPLATES for literal in t.literals()]
+    assert phrases[:len(literals)] == literals                # template segments first
+    assert phrases.index('Red Line') < phrases.index('Downtown Crossing') < phrases.index('Park Street')
+    assert phrases.index('Park Street') < phrases.index('1') < phrases.index('Board Red Line at Park Street')
+    assert phrases[-1] == 'Shuttle buses replace Red Line service'
+
+
+def test_collect_phrases_without_the_accessibus_server(monkeypatch):
+    def down(url, **kwargs):
+        raise ConnectionError('refused')
+    monkeypatch.setattr(presynth.upstream, 'get', down)
+    phrases = presynth.collect_phrases()
+    # Template segments, lines and minutes can still be warmed.
+    assert 'arriving at' in phrases and 'Blue Line' in phrases and '30' in phrases
+    assert not any(p.startswith('Board ') and p != 'Board' for p in phrases)
@@ -0,0 +1,161 @@
+import json
+import threading
+
+import pytest
+
+import push
+from server import _parse_vehicles
+
+
+def resource(vid, lat=42.3555, lng=-71.0605, bearing=90, status='IN_TRANSIT_TO', route='Red'):
+    """One vehicle as it arrives on the MBTA stream (JSON:API)."""
+    return {
+        'type': 'vehicle', 'id': vid,
+        'attributes': {'latitude': lat, 'longitude': lng, 'bearing': bearing, 'current_status': status},
+        'relationships': {'route': {'data': {'type': 'route', 'id': route}}},
+    }
+
+
+@pytest.fixture
+def hub():
+    return push.VehicleHub(_parse_vehicles)
+
+
+def ids(vehicles):
+    return sorted(v['id'] for v in vehicles)
+
+
+def test_subscribe_and_unsubscribe(hub):
+    a, b = hub.subscribe(), hub.subscribe()
+    assert hub.stats()['subscribers'] == 2
+    a.close()
+    assert a.closed and hub.stats()['subscribers'] == 1
+    hub.unsubscribe(b)
+    hub.unsubscribe(b)                      # twice is harmless
+    assert hub.stats()['subscribers'] == 0
+    assert not hub.stats()['polling']       # fed by the stream, nothing to poll
+
+
+def test_snapshot_then_deltas(hub):
+    subscriber = hub.subscribe()
+    assert subscriber.take() is None        # nothing to send before the first reset
+    hub.on_stream_event('reset', [resource('R-1'), resource('R-2'), {'type': 'trip', 'id': 't'}])
+
+    snapshot = subscriber.take()
+    assert snapshot['type'] == 'snapshot'
+    assert ids(snapshot['vehicles']) == ['R-1', 'R-2']
+    assert snapshot['version'] == hub.version
+    assert subscriber.take() is None
+
+    hub.on_stream_event('update', [resource('R-1', lat=42.3600)])
+    delta = subscriber.take()
+    assert delta['type'] == 'delta'
+    assert delta['changed'] == [{'id': 'R-1', 'lat': 42.36, 'lng': -71.0605, 'bearing': 90,
+                                 'route': 'Red', 'status': 'IN_TRANSIT_TO'}]
+    assert delta['removed'] == []
+
+    hub.on_stream_event('remove', [{'type': 'vehicle', 'id': 'R-2'}, {'type': 'vehicle', 'id': 'gone'}])
+    assert subscriber.take() == {'type': 'delta', 'version': hub.version, 'changed': [], 'removed': ['R-2']}
+
+
+@pytest.mark.parametrize('change, pushed', [
+    ({'lat': 42.3555 + 1e-7}, False),       # GPS jitter below COORD_PRECISION
+    ({'lat': 42.3556}, True),
+    ({'bearing': 180}, True),
+    ({'status': 'STOPPED_AT'}, True),
+    ({'route': 'Mattapan'}, True),
+    ({}, False),
+])
+def test_only_meaningful_changes_are_pushed(hub, change, pushed):
+    hub.on_stream_event('reset', [resource('R-1')])
+    subscriber = hub.subscribe()
+    subscriber.take()
+    version = hub.version
+    hub.on_stream_event('update', [resource('R-1', **change)])
+    assert (subscriber.take() is not None) == pushed
+    assert (hub.version > version) == pushed
+
+
+def test_reset_removes_vehicles_it_no_longer_lists(hub):
+    hub.on_stream_event('reset', [resource('R-1'), resource('R-2')])
+    subscriber = hub.subscribe()
+    subscriber.take()
+    hub.on_stream_event('reset', [resource('R-2')])
+    assert subscriber.take()['removed'] == ['R-1']
+    assert hub.stats()['vehicles'] == 1
+
+
+def test_changes_fan_out_to_every_subscriber(hub):
+    hub.on_stream_event('reset', [resource('R-1')])
+    subscribers = [hub.subscribe() for _ in range(3)]
+    gone = hub.subscribe()
+    for s in subscribers + [gone]:
+        s.take()
+    gone.close()
+
+    hub.on_stream_event('update', [resource('R-1', bearing=270)])
+    for s in subscribers:
+        assert s.take()['changed'][0]['bearing'] == 270
+    assert gone.take() is None
+
+
+def test_slow_consumer_gets_only_the_latest_state(hub):
+    hub.on_stream_event('reset', [resource('R-1'), resource('R-2')])
+    slow = hub.subscribe()
+    slow.take()
+    for i in range(100):
+        hub.on_stream_event('update', [resource('R-1', lat=42.30 + i / 1000)])
+    hub.on_stream_event('update', [resource('R-2', bearing=0)])
+    hub.on_stream_event('remove', [{'type': 'vehicle', 'id': 'R-2'}])
+
+    assert len(slow.pending) == 2           # bounded by the fleet, not the number of updates
+    delta = slow.take()
+    assert [v['id'] for v in delta['changed']] == ['R-1']
+    assert delta['changed'][0]['lat'] == pytest.approx(42.399)
+    assert delta['removed'] == ['R-2']
+    assert hub.stats()['coalesced'] == 100
+    assert slow.take() is None
+
+
+def test_subscriber_fields_are_projected(hub):
+    hub.on_stream_event('reset', [resource('R-1')])
+    subscriber = hub.subscribe(fields=['lat', 'lng'])
+    assert subscriber.take()['vehicles'] == [{'id': 'R-1', 'lat': 42.3555, 'lng': -71.0605}]
+
+
+def test_wait_wakes_on_a_change(hub):
+    hub.on_stream_event('reset', [resource('R-1')])
+    subscriber = hub.subscribe()
+    subscriber.take()
+    assert not subscriber.wait(0.01)
+    threading.Timer(0.05, hub.on_stream_event, ('update', [resource('R-1', bearing=1)])).start()
+    assert subscriber.wait(5)
+
+
+def test_sse_stream_closes_its_subscriber(hub):
+    hub.on_stream_event('reset', [resource('R-1')])
+    subscriber = hub.subscribe()
+    events = push.sse_events(subscriber)
+    assert next(events) == 'retry: 3000\n\n'
+    frame = next(events)
+    assert frame.startswith('event: snapshot\ndata: ') and frame.endswith('\n\n')
+    assert ids(json.loads(frame.split('data: ', 1)[1])['vehicles']) == ['R-1']
+    events.close()
+    assert subscriber.closed
+    assert hub.stats()['subscribers'] == 0
+
+
+def test_poller_runs_only_while_subscribed():
+    polled = threading.Event()
+    hub = push.VehicleHub(_parse_vehicles, poll_interval=0.01,
+                          poll=lambda: polled.set() or _parse_vehicles({'data': [resource('R-1')]}))
+    subscriber = hub.subscribe()
+    assert polled.wait(5)
+    assert subscriber.wait(5)
+    assert subscriber.take()['type'] == 'snapshot'
+    poller = hub._poller
+    subscriber.close()
+    poller.join(5)
+    assert not poller.is_alive()
+    # Its fleet state went with it; the next subscriber waits for a fresh poll.
+    assert hub.stats()['ready'] is False and hub.stats()['vehicles'] == 0
@@ -0,0 +1,91 @@
+import dataclasses
+import gzip
+import uuid
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+import pytest
+
+import responses
+
+
+@dataclasses.dataclass
+class Stop:
+    id: str
+    lat: float
+
+
+PAYLOAD = {
+    'at': datetime(2026, 6, 4, 8, 30, tzinfo=timezone.utc),
+    'day': date(2026, 6, 4),
+    'fare': Decimal('2.40'),
+    'trip': uuid.UUID(int=1),
+    'stop': Stop('place-pktrm', 42.356),
+}
+EXPECTED = {
+    'at': '2026-06-04T08:30:00+00:00',
+    'day': '2026-06-04',
+    'fare': '2.40',
+    'trip': '00000000-0000-0000-0000-000000000001',
+    'stop': {'id': 'place-pktrm', 'lat': 42.356},
+}
+
+
+@pytest.mark.parametrize('use_orjson', [True, False])
+def test_dumps_encodes_extra_types_the_same_with_either_encoder(monkeypatch, use_orjson):
+    if use_orjson and responses.orjson is None:
+        pytest.skip('orjson not installed')
+    if not use_orjson:
+        monkeypatch.setattr(responses, 'orjson', None)
+    assert responses.loads(responses.dumps(PAYLOAD)) == EXPECTED
+
+
+def test_default_rejects_unknown_types():
+    with pytest.raises(TypeError):
+        responses.default(object())
+
+
+def test_projection():
+    records = [{'id': 1, 'lat': 42.0, 'lng': -71.0}, {'id': 2, 'lat': 42.1}]
+    assert responses.parse_fields('id, lng,,') == ['id', 'lng']
+    assert responses.parse_fields('') is None
+    assert responses.project(records, ['id', 'lng']) == [{'id': 1, 'lng': -71.0}, {'id': 2}]
+    assert responses.project(records, None) is records
+
+
+@pytest.mark.parametrize('raw, expected', [(None, None), ('', None), ('0', 0), (15, 15), ('22', 22)])
+def test_parse_zoom(raw, expected):
+    assert responses.parse_zoom(raw) == expected
+
+
+@pytest.mark.parametrize('raw', ['-1', '23', 'close', [3]])
+def test_parse_zoom_rejects(raw):
+    with pytest.raises(ValueError):
+        responses.parse_zoom(raw)
+
+
+def test_parse_path_format():
+    assert responses.parse_path_format(None) == 'points'
+    with pytest.raises(ValueError):
+        responses.parse_path_format('svg')
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('gzip, deflate', 'gzip'),
+    ('gzip;q=0', None),
+    ('identity', None),
+    ('', None),
+])
+def test_choose_encoding_without_brotli(monkeypatch, header, expected):
+    monkeypatch.setattr(responses, 'brotli', None)
+    assert responses.choose_encoding(header) == expected
+    assert responses.choose_encoding('br, gzip') == 'gzip'
+
+
+def test_compress_only_large_bodies(monkeypatch):
+    monkeypatch.setattr(responses, 'brotli', None)
+    small = b'{}'
+    assert responses.compress(small, 'gzip') == (small, None)
+    big = b'{"data": "' + b'x' * responses.COMPRESS_MIN_BYTES + b'"}'
+    body, encoding = responses.compress(big, 'gzip')
+    assert encoding == 'gzip' and gzip.decompress(body) == big
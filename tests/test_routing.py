@@ -0,0 +1,106 @@
+from datetime import datetime
+
+import pytest
+
+from routing import Timetable
+
+# Alpha has two platforms ~1.2 km apart: p1 (Red Line to Quebec) and
+# p2 (Green Line to Delta).
+FEED = {
+    'routes.txt': """route_id,route_short_name,route_long_name,route_type
+R,,Red Line,1
+G,,Green Line,0
+B,,Bus 1,3
+""",
+    'trips.txt': """route_id,service_id,trip_id
+R,S1,r1
+G,S1,g1
+B,S1,b1
+""",
+    'stops.txt': """stop_id,stop_name,stop_lat,stop_lon,parent_station
+place-alpha,Alpha,42.0,-70.99,
+p1,Alpha,42.000,-71.000,place-alpha
+p2,Alpha,42.000,-70.985,place-alpha
+q,Quebec,42.05,-71.0,
+d,Delta,42.10,-70.985,
+""",
+    'stop_times.txt': """trip_id,arrival_time,departure_time,stop_id,stop_sequence
+r1,08:50:00,08:50:00,p1,1
+r1,09:05:00,09:05:00,q,2
+g1,09:00:00,09:00:00,p2,1
+g1,09:10:00,09:10:00,d,2
+b1,08:40:00,08:40:00,p1,1
+b1,08:45:00,08:45:00,d,2
+""",
+    'calendar.txt': """service_id,monday,tuesday,wednesday,thursday,friday,saturday,sunday,start_date,end_date
+S1,1,1,1,1,1,0,0,20250101,20251231
+""",
+}
+
+WEEKDAY = datetime(2025, 6, 4)      # a Wednesday
+NEAR_P1 = (42.001, -71.0)
+NEAR_Q = (42.051, -71.0)
+# Only reachable from p1 by walking over to p2 first.
+SOUTH_OF_P1 = (41.990, -71.0)
+NEAR_D = (42.101, -70.985)
+WALK = 1.4
+
+
+@pytest.fixture(scope='module')
+def timetable(tmp_path_factory):
+    path = tmp_path_factory.mktemp('gtfs')
+    for name, body in FEED.items():
+        (path / name).write_text(body)
+    return Timetable(str(path))
+
+
+def kinds(journey):
+    return [part[0] for part in journey['parts']]
+
+
+def test_loads_only_subway_and_light_rail(timetable):
+    assert timetable.stats()['trips'] == 2
+    assert timetable.stats()['connections'] == 2
+    assert timetable.stop_parent[timetable.stop_index['p1']] == 'place-alpha'
+
+
+def test_direct_ride(timetable):
+    journey = timetable.earliest_arrival(NEAR_P1, NEAR_Q, WALK, WEEKDAY.replace(hour=8, minute=30))
+    assert kinds(journey) == ['walk', 'ride', 'walk']
+    assert timetable.boarding_station(journey) == 'place-alpha'
+    route = timetable.to_route(journey, 0, NEAR_P1, NEAR_Q)
+    assert route['summary'] == 'Via Red Line'
+    assert route['path'][0] == {'lat': NEAR_P1[0], 'lng': NEAR_P1[1]}
+
+
+def test_boarding_buffer_is_enforced(timetable):
+    # Two minutes' walk to p1 leaves less than BOARDING_BUFFER before 08:50.
+    assert timetable.earliest_arrival(NEAR_P1, NEAR_Q, WALK, WEEKDAY.replace(hour=8, minute=48)) is None
+
+
+def test_footpath_from_walk_reachable_origin_stop(timetable):
+    journey = timetable.earliest_arrival(SOUTH_OF_P1, NEAR_D, WALK, WEEKDAY.replace(hour=8))
+    assert kinds(journey) == ['walk', 'transfer', 'ride', 'walk']
+    assert timetable.trip_route[timetable.conn_trip[journey['parts'][2][1]]] == 'Green Line'
+    route = timetable.to_route(journey, 0, SOUTH_OF_P1, NEAR_D)
+    assert route['summary'] == 'Via Green Line'
+    assert route['station_eta'].startswith('Reach Alpha by')
+
+
+def test_slow_walkers_miss_the_transfer(timetable):
+    assert timetable.earliest_arrival(SOUTH_OF_P1, NEAR_D, 0.5, WEEKDAY.replace(hour=8)) is None
+
+
+def test_no_service_outside_the_calendar(timetable):
+    saturday = datetime(2025, 6, 7, 8, 30)
+    assert timetable.plan(NEAR_P1, NEAR_Q, WALK, saturday) == []
+
+
+def test_plan_stops_after_the_last_train(timetable):
+    journeys = timetable.plan(NEAR_P1, NEAR_Q, WALK, WEEKDAY.replace(hour=8, minute=30))
+    assert len(journeys) == 1
+
+
+def test_find_stop(timetable):
+    assert timetable.find_stop('  quebec ') == (42.05, -71.0)
+    assert timetable.find_stop('Nowhere') is None
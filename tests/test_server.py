@@ -0,0 +1,78 @@
+import pytest
+
+import favorites
+import server
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    store = favorites.FavoritesStore(str(tmp_path / 'favorites.db'))
+    monkeypatch.setattr(server, 'favorites_store', store)
+    monkeypatch.setattr(server, 'precomputer', favorites.Precomputer(store, lambda favorite: None))
+    return server.app.test_client()
+
+
+USER = {'X-User-Id': 'u1'}
+
+
+@pytest.mark.parametrize('method', ['post', 'delete'])
+@pytest.mark.parametrize('body', [[1, 2], 'Park Street', 3])
+def test_favorites_rejects_bodies_that_are_not_objects(client, method, body):
+    response = getattr(client, method)('/api/favorites', json=body, headers=USER)
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+
+def test_favorites_round_trip(client):
+    response = client.post('/api/favorites', json={'origin': 'Park Street', 'destination': 'Harvard'}, headers=USER)
+    assert response.status_code == 201
+    favorite_id = response.get_json()['data']['id']
+    listed = client.get('/api/favorites', headers=USER).get_json()['data']
+    assert [f['id'] for f in listed] == [favorite_id]
+    assert listed[0]['trips'] is None
+    assert client.delete('/api/favorites', json={'id': favorite_id}, headers=USER).status_code == 200
+    assert client.delete(f'/api/favorites?id={favorite_id}', headers=USER).status_code == 404
+
+
+def test_favorites_needs_a_user(client):
+    assert client.get('/api/favorites').status_code == 400
+
+
+def test_favorites_with_secret_need_a_signed_token(client, monkeypatch):
+    monkeypatch.setattr(server, 'FAVORITES_SECRET', 's3cret')
+    assert client.get('/api/favorites', headers=USER).status_code == 401
+    forged = {'X-User-Token': 'u1.' + '0' * 64}
+    assert client.get('/api/favorites', headers=forged).status_code == 401
+    signed = {'X-User-Token': server.sign_user('u1')}
+    body = {'origin': 'Park Street', 'destination': 'Harvard'}
+    assert client.post('/api/favorites', json=body, headers=signed).status_code == 201
+    assert len(client.get('/api/favorites', headers=signed).get_json()['data']) == 1
+    other = {'X-User-Token': server.sign_user('u2')}
+    assert client.get('/api/favorites', headers=other).get_json()['data'] == []
+
+
+@pytest.mark.parametrize('query', ['limit=soon', 'direction_id=north', 'direction_id=2', ''])
+def test_batch_predictions_rejects_bad_queries(client, query):
+    stops = 'stops=place-pktrm&' if query else ''
+    response = client.get(f'/api/mbta/predictions?{stops}{query}')
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+
+def test_batch_predictions_limit_is_clamped():
+    args = {'stops': 'place-pktrm', 'limit': '-2'}
+    assert server._prediction_query(args) == (['place-pktrm'], 1, None, None)
+    args['limit'] = '1000'
+    assert server._prediction_query(args)[1] == server.MAX_PREDICTIONS_PER_STOP
+
+
+@pytest.mark.parametrize('options', [{'path_format': 'svg'}, {'zoom': 'close'}, {'zoom': 40}, {'zoom': [3]}])
+def test_directions_rejects_bad_path_options(client, options):
+    response = client.post('/api/directions', json=dict({'origin': 'Park Street', 'destination': 'Harvard'}, **options))
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+
+@pytest.mark.parametrize('query', ['path_format=svg', 'zoom=close'])
+def test_favorites_rejects_bad_path_options(client, query):
+    assert client.get(f'/api/favorites?{query}', headers=USER).status_code == 400
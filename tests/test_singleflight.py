@@ -0,0 +1,52 @@
+import threading
+import time
+
+import pytest
+
+from cache import UpstreamError
+from singleflight import SingleFlight, make_key
+
+
+def test_singleflight_shares_one_call_between_concurrent_callers():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return {'value': 42}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do('k', fetch))) for _ in range(5)]
+    threads[0].start()
+    while 'k' not in flight._calls:
+        time.sleep(0.001)
+    for thread in threads[1:]:
+        thread.start()
+    while flight._calls['k'].callers < 5:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert len(results) == 5 and all(r is results[0] for r in results)
+    stats = flight.stats()
+    assert stats['fetches'] == 1 and stats['callers'] == 5 and stats['in_flight'] == 0
+
+
+def test_singleflight_propagates_errors_and_forgets_the_call():
+    flight = SingleFlight()
+
+    def boom():
+        raise UpstreamError('down')
+
+    with pytest.raises(UpstreamError):
+        flight.do('k', boom)
+    assert flight.do('k', lambda: 'ok') == 'ok'
+
+
+def test_make_key_is_independent_of_param_order():
+    assert make_key('u', {'b': 2, 'a': 1}) == make_key('u', {'a': 1, 'b': 2}) == 'u?a=1&b=2'
+    assert make_key('u') == 'u'
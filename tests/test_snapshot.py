@@ -0,0 +1,94 @@
+import pytest
+
+import snapshot
+
+
+class Source:
+    def __init__(self, data, updated_at=100.0):
+        self.data, self.updated_at = data, updated_at
+
+    def __call__(self):
+        return self.data, self.updated_at
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'live.bin')
+
+
+def test_write_then_read_round_trip(path):
+    stations = Source([{'id': 'place-pktrm', 'lat': 42.356, 'lng': -71.062}])
+    alerts = Source([])
+    writer = snapshot.SnapshotWriter(path, {'stations': stations, 'alerts': alerts})
+    writer.run_once()
+
+    applied = {}
+    reader = snapshot.SnapshotReader(path, lambda name, data, at: applied.__setitem__(name, (data, at)))
+    assert reader.refresh()
+    assert applied == {'stations': (stations.data, 100.0), 'alerts': ([], 100.0)}
+    assert reader.sequence == 1
+    assert not reader.refresh()
+
+
+def test_version_moves_only_when_content_changes(path):
+    source = Source({'n': 1})
+    writer = snapshot.SnapshotWriter(path, {'vehicles': source})
+    reader = snapshot.SnapshotReader(path, lambda *args: applied.append(args),
+                                     touch=lambda *args: touched.append(args))
+    applied, touched = [], []
+    writer.run_once()
+    reader.refresh()
+
+    source.updated_at = 200.0               # same content, re-confirmed
+    writer.run_once()
+    assert writer.sections['vehicles'].version == 1
+    assert reader.refresh()
+    assert len(applied) == 1
+    assert touched == [('vehicles', 200.0)]
+
+    source.data, source.updated_at = {'n': 2}, 300.0
+    writer.run_once()
+    assert writer.sections['vehicles'].version == 2
+    reader.refresh()
+    assert applied[-1] == ('vehicles', {'n': 2}, 300.0)
+
+
+def test_failing_source_keeps_previous_section(path):
+    def down():
+        raise RuntimeError('upstream down')
+
+    writer = snapshot.SnapshotWriter(path, {'alerts': Source(['a'])})
+    writer.run_once()
+    writer.sources['alerts'] = down
+    writer.run_once()
+    assert writer.counters['errors'] == 1
+    with open(path, 'rb') as f:
+        _, _, sections = snapshot.read_header(f.read())
+    assert sections['alerts'].data() == ['a']
+
+
+def test_stale_section_is_reported(path, monkeypatch):
+    writer = snapshot.SnapshotWriter(path, {'vehicles': Source([], updated_at=100.0)})
+    writer.run_once()
+    stale = []
+    reader = snapshot.SnapshotReader(path, lambda *args: None, on_stale=stale.append, max_age={'vehicles': 30})
+    monkeypatch.setattr(snapshot.time, 'time', lambda: 200.0)
+    reader.refresh()
+    assert stale == ['vehicles']
+
+
+def test_warm_start_adopts_existing_file(path):
+    snapshot.SnapshotWriter(path, {'stations': Source(['x'])}).run_once()
+    writer = snapshot.SnapshotWriter(path, {})
+    sections = writer.load()
+    assert sections['stations'].data() == ['x']
+    assert writer.sequence == 1
+
+
+def test_rejects_files_that_are_not_snapshots(path):
+    with open(path, 'wb') as f:
+        f.write(b'not a snapshot at all, just some bytes')
+    with pytest.raises(snapshot.SnapshotError):
+        snapshot.SnapshotReader(path, lambda *args: None).refresh()
+    with pytest.raises(snapshot.SnapshotError):
+        snapshot.read_header(b'ABSN')
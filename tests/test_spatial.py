@@ -0,0 +1,61 @@
+import random
+
+from spatial import GridIndex, haversine_m
+
+
+def make_points(n=500, seed=7):
+    rng = random.Random(seed)
+    return [{'id': i, 'lat': 42.2 + rng.random() * 0.3, 'lng': -71.2 + rng.random() * 0.3} for i in range(n)]
+
+
+def brute_nearest(points, lat, lng, k):
+    return sorted(points, key=lambda p: haversine_m(lat, lng, p['lat'], p['lng']))[:k]
+
+
+def test_nearest_matches_brute_force():
+    points = make_points()
+    index = GridIndex(points)
+    rng = random.Random(1)
+    for _ in range(50):
+        lat, lng = 42.2 + rng.random() * 0.3, -71.2 + rng.random() * 0.3
+        found = [item['id'] for _, item in index.nearest(lat, lng, k=5)]
+        assert found == [p['id'] for p in brute_nearest(points, lat, lng, 5)]
+
+
+def test_nearest_far_from_the_data_scans_occupied_cells():
+    points = make_points()
+    index = GridIndex(points)
+    found = index.nearest(0.0, 0.0, k=3)
+    assert [item['id'] for _, item in found] == [p['id'] for p in brute_nearest(points, 0.0, 0.0, 3)]
+    assert found[0][0] < found[1][0] < found[2][0]
+
+
+def test_nearest_on_empty_index():
+    assert GridIndex([]).nearest(42.3, -71.1) == []
+
+
+def test_items_without_coordinates_are_skipped():
+    index = GridIndex([{'lat': None, 'lng': -71.0}, {'lat': 42.3, 'lng': -71.0}])
+    assert index.size == 1
+
+
+def test_within_radius_matches_brute_force():
+    points = make_points()
+    index = GridIndex(points)
+    lat, lng, radius = 42.35, -71.05, 1500
+    found = index.within_radius(lat, lng, radius)
+    expected = {p['id'] for p in points if haversine_m(lat, lng, p['lat'], p['lng']) <= radius}
+    assert {item['id'] for _, item in found} == expected
+    assert [d for d, _ in found] == sorted(d for d, _ in found)
+    assert index.within_radius(lat, lng, -1) == []
+
+
+def test_within_bbox():
+    points = make_points()
+    index = GridIndex(points)
+    south, west, north, east = 42.3, -71.1, 42.4, -71.0
+    expected = {p['id'] for p in points if south <= p['lat'] <= north and west <= p['lng'] <= east}
+    assert {item['id'] for item in index.within_bbox(south, west, north, east)} == expected
+    # A box far larger than the data walks the occupied cells, not the whole range.
+    assert len(index.within_bbox(-90, -180, 90, 180)) == len(points)
+    assert index.within_bbox(42.4, -71.0, 42.3, -71.1) == []
@@ -0,0 +1,124 @@
+import glob
+import os
+import threading
+
+import pytest
+
+from audio_cache import AudioCache
+
+TEXT = 'Shuttle buses replace service'
+
+
+class FakeStream:
+    """A streamed ElevenLabs response: yields `chunks`, pausing at `gate` before the last one."""
+
+    def __init__(self, status, chunks=(), gate=None, fail_after=None):
+        self.status_code = status
+        self._chunks = list(chunks)
+        self.gate = gate
+        self.fail_after = fail_after
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        for i, chunk in enumerate(self._chunks):
+            if i == self.fail_after:
+                raise ConnectionError('stream reset')
+            if self.gate is not None and i == len(self._chunks) - 1:
+                self.gate.wait(5)
+            yield chunk
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.closed = True
+
+
+@pytest.fixture
+def tv(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)     # importing textvoice creates audio_cache/ in the cwd
+    import textvoice
+    monkeypatch.setattr(textvoice, 'audio_cache', AudioCache(str(tmp_path / 'cache'), 10_000_000))
+    return textvoice
+
+
+def fake_upstream(tv, monkeypatch, stream):
+    """Routes ElevenLabs calls to `stream`; returns the list of texts sent."""
+    posts = []
+
+    def post(url, **kwargs):
+        posts.append(kwargs['json']['text'])
+        return stream
+    monkeypatch.setattr(tv.upstream, 'post', post)
+    return posts
+
+
+def wait_until_idle(tv):
+    for _ in range(500):
+        if not tv._inflight:
+            return
+        threading.Event().wait(0.01)
+    raise AssertionError('synthesis still in flight')
+
+
+def part_files(tv):
+    return glob.glob(os.path.join(tv.audio_cache.root, '**', '*.part'), recursive=True)
+
+
+def test_concurrent_identical_requests_share_one_synthesis(tv, monkeypatch):
+    gate = threading.Event()
+    stream = FakeStream(200, [b'ID3', b'-audio-', b'-end'], gate=gate)
+    posts = fake_upstream(tv, monkeypatch, stream)
+    client = tv.app.test_client()
+
+    first = client.post('/stream-tts', json={'text': TEXT})
+    second = client.post('/stream-tts', json={'text': TEXT})     # joins the running stream
+    gate.set()
+    assert first.status_code == second.status_code == 200
+    assert first.get_data() == second.get_data() == b'ID3-audio--end'
+    assert posts == [TEXT]
+
+    wait_until_idle(tv)
+    assert stream.closed
+    assert not part_files(tv)
+    # Stored: the next request is a cache hit, not another synthesis.
+    assert client.post('/stream-tts', json={'text': TEXT}).get_data() == b'ID3-audio--end'
+    assert posts == [TEXT]
+
+
+def test_error_status_is_passed_on_and_nothing_is_cached(tv, monkeypatch):
+    stream = FakeStream(429)
+    fake_upstream(tv, monkeypatch, stream)
+    response = tv.app.test_client().post('/stream-tts', json={'text': TEXT})
+    assert response.status_code == 429
+    wait_until_idle(tv)
+    assert stream.closed
+    assert not part_files(tv)
+    assert tv.audio_cache.stats()['entries'] == 0
+
+
+def test_stream_dropped_midway_is_cleaned_up(tv, monkeypatch):
+    stream = FakeStream(200, [b'ID3', b'-audio-', b'-end'], fail_after=2)
+    fake_upstream(tv, monkeypatch, stream)
+    synthesis, started = tv.get_synthesis(tv.text_key(TEXT), TEXT)
+    assert started
+    assert not synthesis.wait()
+    assert b''.join(synthesis.chunks()) == b''      # a failed synthesis sends nothing more
+    assert stream.closed
+    assert not part_files(tv)
+    assert not os.path.exists(synthesis.file_path)
+    assert tv.audio_cache.stats()['entries'] == 0
+
+
+def test_joiner_after_the_stored_file_was_evicted(tv, monkeypatch):
+    fake_upstream(tv, monkeypatch, FakeStream(200, [b'ID3']))
+    synthesis, _ = tv.get_synthesis(tv.text_key(TEXT), TEXT)
+    assert synthesis.wait()
+    os.remove(synthesis.file_path)                  # evicted before the joiner opened it
+    assert synthesis.open() is None
+    assert list(synthesis.chunks()) == []
+
+    monkeypatch.setattr(tv, 'get_synthesis', lambda key, text: (synthesis, False))
+    monkeypatch.setattr(tv.audio_cache, 'lookup', lambda key: None)
+    response = tv.app.test_client().post('/stream-tts', json={'text': TEXT})
+    assert response.status_code == 503
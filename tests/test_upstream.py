@@ -0,0 +1,98 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import upstream
+
+
+class Scripted(BaseHTTPRequestHandler):
+    """Answers with the next status in server.statuses (200 once they run out)."""
+
+    def _answer(self):
+        self.server.hits.append(self.command)
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        body = b'{"ok": true}'
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = _answer
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Scripted)
+    httpd.statuses, httpd.hits = [], []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.url = f'http://127.0.0.1:{httpd.server_address[1]}'
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_one_session_per_host():
+    a = upstream.session_for('https://api-v3.mbta.com/stops')
+    assert upstream.session_for('https://api-v3.mbta.com/alerts?x=1') is a
+    assert upstream.session_for('https://maps.googleapis.com/maps/api/directions/json') is not a
+
+
+def test_pool_sized_per_host():
+    adapter = upstream.session_for('https://maps.googleapis.com/x').get_adapter('https://maps.googleapis.com/x')
+    assert adapter._pool_maxsize == upstream.POOL_SIZES['maps.googleapis.com']
+    # http and https share the adapter, so connections are counted once.
+    session = upstream.session_for('https://api.elevenlabs.io/v1')
+    assert session.get_adapter('http://api.elevenlabs.io') is session.get_adapter('https://api.elevenlabs.io')
+
+
+def test_retry_policy():
+    retry = upstream.session_for('https://api-v3.mbta.com/').get_adapter('https://api-v3.mbta.com/').max_retries
+    assert retry.total == upstream.MAX_RETRIES
+    assert retry.backoff_factor == upstream.BACKOFF_FACTOR
+    assert set(retry.status_forcelist) == {500, 502, 503, 504}
+    assert retry.respect_retry_after_header
+    assert retry.is_retry('GET', 503)
+    assert not retry.is_retry('GET', 404)
+    assert not retry.is_retry('POST', 503)
+
+
+def test_get_is_retried_on_5xx(server):
+    server.statuses = [503]
+    response = upstream.get(f'{server.url}/stops')
+    assert response.status_code == 200
+    assert server.hits == ['GET', 'GET']
+    host = server.url.split('://')[1]
+    assert upstream.stats()[host]['retries'] == 1
+
+
+def test_post_is_not_retried(server):
+    server.statuses = [503]
+    response = upstream.post(f'{server.url}/v1/text-to-speech', json={'text': 'hi'})
+    assert response.status_code == 503
+    assert server.hits == ['POST']
+
+
+def test_default_and_explicit_timeouts(monkeypatch):
+    seen = []
+    session = upstream.session_for('https://api-v3.mbta.com/')
+
+    class Response:
+        status_code = 200
+        headers = {}
+        raw = None
+
+    def fake_request(method, url, **kwargs):
+        seen.append(kwargs['timeout'])
+        return Response()
+
+    monkeypatch.setattr(session, 'request', fake_request)
+    upstream.get('https://api-v3.mbta.com/stops')
+    upstream.get('https://api-v3.mbta.com/stops', timeout=1.5)
+    upstream.get('https://api-v3.mbta.com/stops', timeout=(1, 2))
+    assert seen == [(upstream.CONNECT_TIMEOUT, upstream.READ_TIMEOUT), 1.5, (1, 2)]
@@ -3,11 +3,19 @@ from flask import Flask, request, Response, send_file
 from flask_cors import CORS
 from elevenlabs.client import ElevenLabs
 from elevenlabs import VoiceSettings
-import os
+from pydub import AudioSegment
 import hashlib
-import requests
+import os
+import threading
+import uuid
+
+import metrics
+import presynth
+import upstream
+from audio_cache import AudioCache, cache_key
 
 app = Flask(__name__)
+metrics.instrument(app)
 CORS(app)
 
 load_dotenv()
@@ -15,11 +23,221 @@ load_dotenv()
 # Configuration
 ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
 VOICE_ID = "21m00Tcm4TlvDq8ikWAM"
+MODEL_ID = "eleven_turbo_v2" # Use turbo for speed
+VOICE_SETTINGS = {"stability": 0.5, "similarity_boost": 0.5}
+# What every flat audio_cache/<md5(text)>.mp3 from before the sharded cache
+# was synthesized with; those files are adopted only while this still matches.
+LEGACY_VOICE = ("21m00Tcm4TlvDq8ikWAM", "eleven_turbo_v2", {"stability": 0.5, "similarity_boost": 0.5})
 CACHE_DIR = "audio_cache"
+CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_MB", "500")) * 1024 * 1024
+CACHE_HOT_MAX_BYTES = int(os.getenv("TTS_CACHE_HOT_MB", "16")) * 1024 * 1024
+ELEVENLABS_BASE_URL = os.getenv("ELEVENLABS_BASE_URL", "https://api.elevenlabs.io")
+CHUNK_SIZE = 4096
+STITCH_GAP_MS = 80 # Pause between stitched segments
+PRESYNTH_ON_START = os.getenv("TTS_PRESYNTH", "0") == "1"
+
+# text hash -> Synthesis currently streaming from ElevenLabs
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+# Sharded, size-capped audio cache (creates CACHE_DIR and indexes what's in it)
+audio_cache = AudioCache(CACHE_DIR, CACHE_MAX_BYTES, hot_max_bytes=CACHE_HOT_MAX_BYTES)
+
+class Synthesis:
+    """
+    One in-progress ElevenLabs stream. The upstream audio is teed into a
+    temp file as it arrives; every request for the same text reads that
+    file as it grows instead of starting a second synthesis.
+    """
+
+    def __init__(self, key, file_path):
+        self.key = key
+        self.file_path = file_path
+        self.tmp_path = f"{file_path}.{uuid.uuid4().hex}.part"
+        self.status = None          # upstream HTTP status, set before any audio
+        self.written = 0
+        self.done = False
+        self.failed = False
+        self.cond = threading.Condition()
+        open(self.tmp_path, "wb").close()
+
+    def run(self, text):
+        url = f"{ELEVENLABS_BASE_URL}/v1/text-to-speech/{VOICE_ID}/stream"
+        headers = {
+            "Accept": "audio/mpeg",
+            "Content-Type": "application/json",
+            "xi-api-key": ELEVENLABS_API_KEY
+        }
+        payload = {
+            "text": text,
+            "model_id": MODEL_ID,
+            "voice_settings": VOICE_SETTINGS
+        }
+        try:
+            # Closed on every path, so an error response hands its pooled connection back.
+            with upstream.post(url, json=payload, headers=headers, stream=True) as response:
+                self._set(status=response.status_code)
+                if response.status_code != 200:
+                    raise RuntimeError(f"ElevenLabs returned {response.status_code}")
+                with open(self.tmp_path, "ab") as f:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        if chunk:
+                            f.write(chunk)
+                            f.flush()
+                            self._set(written=self.written + len(chunk))
+            # Only complete files ever appear under the cache name.
+            os.replace(self.tmp_path, self.file_path)
+            audio_cache.add(self.key, self.file_path)
+            self._set(done=True)
+        except Exception as e:
+            print(f"ElevenLabs stream failed: {e}")
+            # Removed before waiters are told, so none of them finds a leftover .part.
+            if os.path.exists(self.tmp_path):
+                os.remove(self.tmp_path)
+            if self.status is None:
+                self._set(status=502)
+            self._set(failed=True, done=True)
+        finally:
+            with _inflight_lock:
+                _inflight.pop(self.key, None)
+
+    def wait(self):
+        """Blocks until the file is stored (True) or the synthesis failed (False)."""
+        with self.cond:
+            self.cond.wait_for(lambda: self.done)
+        return not self.failed
+
+    def wait_for_status(self):
+        with self.cond:
+            self.cond.wait_for(lambda: self.status is not None)
+        return self.status
+
+    def open(self):
+        """
+        The audio opened from the start: the growing temp file, or the stored
+        file if it was renamed meanwhile. None when neither exists any more
+        (failed and cleaned up, or stored and already evicted).
+        """
+        for path in (self.tmp_path, self.file_path):
+            try:
+                return open(path, "rb")
+            except FileNotFoundError:
+                continue
+        return None
+
+    def chunks(self, f=None):
+        """Yields the audio from the start of `f` (default: open()), following the file as it grows."""
+        f = f or self.open()
+        if f is None:
+            return
+        with f:
+            sent = 0
+            while True:
+                with self.cond:
+                    self.cond.wait_for(lambda: self.written > sent or self.done)
+                    available, done, failed = self.written, self.done, self.failed
+                if failed:
+                    return
+                while sent < available:
+                    data = f.read(min(CHUNK_SIZE, available - sent))
+                    if not data:
+                        break
+                    sent += len(data)
+                    yield data
+                if done and sent >= available:
+                    return
+
+    def _set(self, **fields):
+        with self.cond:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self.cond.notify_all()
+
+
+def text_key(text):
+    """Cache key for text in the configured voice."""
+    return cache_key(text, VOICE_ID, MODEL_ID, VOICE_SETTINGS)
+
+
+def adopt_legacy(text, key):
+    """Moves a pre-shard md5(text).mp3 to key's shard if it was made with today's voice. True if it did."""
+    if (VOICE_ID, MODEL_ID, VOICE_SETTINGS) != LEGACY_VOICE:
+        return False
+    return audio_cache.adopt_legacy(hashlib.md5(text.encode()).hexdigest(), key)
+
+
+def cached_path(text):
+    """Disk path of text's audio in the configured voice, or None."""
+    key = text_key(text)
+    path = audio_cache.path_if_cached(key)
+    if path is None and adopt_legacy(text, key):
+        path = audio_cache.path_if_cached(key)
+    return path
+
+
+def get_synthesis(key, text):
+    """The in-progress synthesis for this cache key, starting one if needed."""
+    with _inflight_lock:
+        synthesis = _inflight.get(key)
+        if synthesis is not None:
+            return synthesis, False
+        synthesis = Synthesis(key, audio_cache.path_for(key))
+        _inflight[key] = synthesis
+    threading.Thread(target=synthesis.run, args=(text,), daemon=True).start()
+    return synthesis, True
+
+
+stitch_counters = {'stitched': 0, 'stitch_failed': 0}
+
+def stitch(text, key):
+    """
+    Builds `text` from cached segments when it matches one of the
+    presynth templates ("Red Line arriving at Park Street" from "Red Line",
+    "arriving at" and "Park Street"), and stores the result under `key`.
+    Returns the file path, or None if any segment isn't cached yet.
+    """
+    for template in presynth.TEMPLATES:
+        segments = template.segments(text)
+        if not segments:
+            continue
+        paths = [cached_path(s) for s in segments]
+        if None in paths:
+            continue
+
+        file_path = audio_cache.path_for(key)
+        tmp_path = f"{file_path}.{uuid.uuid4().hex}.part"
+        try:
+            gap = AudioSegment.silent(duration=STITCH_GAP_MS)
+            audio = AudioSegment.empty()
+            for i, path in enumerate(paths):
+                if i:
+                    audio += gap
+                audio += AudioSegment.from_file(path, format="mp3")
+            audio.export(tmp_path, format="mp3")
+            os.replace(tmp_path, file_path)
+        except Exception as e:
+            print(f"Stitching failed: {e}")
+            stitch_counters['stitch_failed'] += 1
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return None
+        audio_cache.add(key, file_path)
+        stitch_counters['stitched'] += 1
+        return file_path
+    return None
+
+
+def synthesize_and_store(text):
+    """Synthesizes text into the cache (joining any in-progress stream) and waits for it."""
+    synthesis, _ = get_synthesis(text_key(text), text)
+    return synthesis.wait()
+
+
+warmup = presynth.WarmupJob(
+    is_cached=lambda text: cached_path(text) is not None,
+    synthesize=synthesize_and_store,
+)
 
-# Ensure cache directory exists
-if not os.path.exists(CACHE_DIR):
-    os.makedirs(CACHE_DIR)
 
 @app.route('/stream-tts', methods=['POST'])
 def stream_tts():
@@ -29,39 +247,90 @@ def stream_tts():
     if not text:
         return {"error": "No text provided"}, 400
 
-    # Create a unique filename based on the text and voice
-    text_hash = hashlib.md5(text.encode()).hexdigest()
-    file_path = os.path.join(CACHE_DIR, f"{text_hash}.mp3")
+    # Cache key covers the text, voice, model and voice settings
+    key = text_key(text)
 
     # --- CHECK CACHE ---
-    if os.path.exists(file_path):
-        print(f"Serving from cache: {file_path}")
-        return send_file(file_path, mimetype="audio/mpeg")
-
-    # --- FETCH FROM ELEVENLABS ---
-    print("Fetching from ElevenLabs...")
-    url = f"https://api.elevenlabs.io/v1/text-to-speech/{VOICE_ID}"
-    headers = {
-        "Accept": "audio/mpeg",
-        "Content-Type": "application/json",
-        "xi-api-key": ELEVENLABS_API_KEY
-    }
-    payload = {
-        "text": text,
-        "model_id": "eleven_turbo_v2", # Use turbo for speed
-        "voice_settings": {"stability": 0.5, "similarity_boost": 0.5}
-    }
-
-    response = requests.post(url, json=payload, headers=headers)
-
-    if response.status_code == 200:
-        # Save to cache
-        with open(file_path, "wb") as f:
-            f.write(response.content)
-        # Return the newly saved file
-        return send_file(file_path, mimetype="audio/mpeg")
-    else:
-        return {"error": "Failed to fetch from ElevenLabs"}, response.status_code
+    with metrics.span('cache_lookup'):
+        cached = audio_cache.lookup(key)
+        if cached is None and adopt_legacy(text, key):
+            cached = audio_cache.lookup(key)
+    if cached is not None:
+        tier, value = cached
+        print(f"Serving from cache ({tier}): {key}")
+        if tier == 'hot':
+            return Response(value, mimetype="audio/mpeg")
+        return send_file(value, mimetype="audio/mpeg")
+
+    # --- STITCH FROM CACHED SEGMENTS ---
+    with metrics.span('stitch'):
+        stitched = stitch(text, key)
+    if stitched is not None:
+        print(f"Stitched from cached segments: {key}")
+        return send_file(stitched, mimetype="audio/mpeg")
+
+    # --- STREAM FROM ELEVENLABS (or join a stream already in progress) ---
+    synthesis, started = get_synthesis(key, text)
+    print("Fetching from ElevenLabs..." if started else f"Joining in-progress synthesis: {key}")
+
+    with metrics.span('first_audio'):
+        status = synthesis.wait_for_status()
+    if status != 200:
+        return {"error": "Failed to fetch from ElevenLabs"}, status
+
+    # Opened now, so a file evicted right after it was stored can't fail mid-response.
+    audio = synthesis.open()
+    if audio is None:
+        return {"error": "Audio is no longer available, try again"}, 503
+
+    # The synthesis thread keeps writing the cache file even if this client disconnects.
+    return Response(synthesis.chunks(audio), mimetype="audio/mpeg")
+
+@app.route('/tts-cache/stats', methods=['GET'])
+def tts_cache_stats():
+    """Hit/miss/eviction counters and size of the audio cache."""
+    out = audio_cache.stats()
+    out.update(stitch_counters)
+    out['warmup'] = warmup.stats()
+    return out
+
+@app.route('/metrics', methods=['GET'])
+def tts_metrics():
+    """Prometheus text exposition: request/upstream latency plus audio cache counters."""
+    stats = audio_cache.stats()
+    families = [
+        ('tts_cache_hits_total', 'counter', 'Audio served from the cache, by tier.',
+         [({'tier': 'hot'}, stats['hot_hits']), ({'tier': 'disk'}, stats['disk_hits'])]),
+        ('tts_cache_misses_total', 'counter', 'Audio that had to be stitched or synthesized.',
+         [({}, stats['misses'])]),
+        ('tts_cache_hit_ratio', 'gauge', 'Share of audio lookups served from the cache.',
+         [({}, stats['hit_ratio'])]),
+        ('tts_cache_bytes', 'gauge', 'Audio cache size on disk and in the RAM tier.',
+         [({'tier': 'disk'}, stats['bytes']), ({'tier': 'hot'}, stats['hot_bytes'])]),
+        ('tts_stitched_total', 'counter', 'Phrases assembled from cached segments.',
+         [({'result': 'ok'}, stitch_counters['stitched']), ({'result': 'failed'}, stitch_counters['stitch_failed'])]),
+        ('tts_inflight', 'gauge', 'ElevenLabs syntheses currently streaming.',
+         [({}, len(_inflight))]),
+    ]
+    return Response(metrics.render(families), mimetype="text/plain; version=0.0.4")
+
+@app.route('/tts-warmup', methods=['POST'])
+def tts_warmup():
+    """
+    Starts the pre-synthesis job in the background. With no body it warms
+    station names, lines, template segments and current alert headers;
+    {"texts": [...]} warms just those phrases.
+    """
+    data = request.get_json(silent=True) or {}
+    texts = data.get("texts")
+    if texts is not None and not isinstance(texts, list):
+        return {"error": "texts must be a list"}, 400
+    if not warmup.start(texts):
+        return {"status": "already running", "warmup": warmup.stats()}, 409
+    return {"status": "started"}, 202
+
+if PRESYNTH_ON_START:
+    warmup.start()
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,248 @@
+"""
+Shared HTTP client for every upstream the backend talks to
+(MBTA V3 API, Google Directions, ElevenLabs).
+
+One pooled requests.Session is kept per host for the whole process, so
+repeat calls reuse an open keep-alive connection instead of paying a
+fresh DNS + TCP + TLS handshake each time. The async serving mode
+(asgi.py) gets the same per-host pooling from httpx.AsyncClient via
+aget() and shares the stats counters.
+
+Every call is admitted by governor.py first (per-key quota with priority
+classes, per-host circuit breaker); pass priority='directions' etc. to
+say how important it is. A refused call raises governor.Rejected without
+touching the network.
+"""
+import os
+import threading
+import time
+
+import anyio
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import governor
+import metrics
+
+# ============================================
+# 1. CONFIGURATION
+# ============================================
+CONNECT_TIMEOUT = float(os.getenv('UPSTREAM_CONNECT_TIMEOUT', '3.05'))
+READ_TIMEOUT = float(os.getenv('UPSTREAM_READ_TIMEOUT', '10'))
+MAX_RETRIES = int(os.getenv('UPSTREAM_MAX_RETRIES', '2'))
+BACKOFF_FACTOR = float(os.getenv('UPSTREAM_BACKOFF', '0.3'))
+
+# Pool size per host. MBTA gets hit by every live-data endpoint, Google only
+# by /api/directions, so they are sized differently.
+POOL_SIZES = {
+    'api-v3.mbta.com': int(os.getenv('MBTA_POOL_SIZE', '20')),
+    'maps.googleapis.com': int(os.getenv('GOOGLE_POOL_SIZE', '10')),
+    'api.elevenlabs.io': int(os.getenv('ELEVENLABS_POOL_SIZE', '4')),
+}
+DEFAULT_POOL_SIZE = 10
+
+_sessions = {}
+_async_clients = {}
+_lock = threading.Lock()
+_stats = {}
+
+
+def _host_of(url):
+    return url.split('://', 1)[-1].split('/', 1)[0]
+
+
+def _make_session(host):
+    pool_size = POOL_SIZES.get(host, DEFAULT_POOL_SIZE)
+    # Only idempotent GETs are retried; POSTs (TTS synthesis) are never replayed.
+    retry = Retry(
+        total=MAX_RETRIES,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=frozenset(['GET']),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def session_for(url):
+    """Returns the process-wide pooled session for the host of `url`."""
+    host = _host_of(url)
+    session = _sessions.get(host)
+    if session is None:
+        with _lock:
+            session = _sessions.get(host)
+            if session is None:
+                session = _make_session(host)
+                _sessions[host] = session
+                _init_stats(host)
+    return session
+
+
+def _init_stats(host):
+    if host not in _stats:
+        _stats[host] = {
+            'requests': 0,
+            'errors': 0,
+            'retries': 0,
+            'in_flight': 0,
+            'total_ms': 0.0,
+            'last_ok_at': None,
+        }
+
+
+def _record(host, elapsed_ms, status=None, retries=0):
+    """Counts a finished call (status None: no response came back)."""
+    error = status is None or status >= 500
+    with _lock:
+        s = _stats[host]
+        s['requests'] += 1
+        s['total_ms'] += elapsed_ms
+        s['retries'] += retries
+        if error:
+            s['errors'] += 1
+        else:
+            s['last_ok_at'] = time.time()
+    metrics.observe('upstream_seconds', elapsed_ms / 1000, host=host, status=str(status or 'error'))
+
+
+def _api_key(kwargs):
+    """The API key a request is billed to (MBTA header or Google query param)."""
+    headers = kwargs.get('headers') or {}
+    params = kwargs.get('params') or {}
+    return headers.get('x-api-key') or headers.get('xi-api-key') or params.get('key')
+
+
+def request(method, url, timeout=None, priority=None, **kwargs):
+    """
+    Sends a request through the pooled session for the url's host.
+    Same signature as requests.request, plus default connect/read timeouts
+    and the governor priority class.
+    """
+    session = session_for(url)
+    host = _host_of(url)
+    kwargs.setdefault('timeout', timeout or (CONNECT_TIMEOUT, READ_TIMEOUT))
+    governor.acquire(host, _api_key(kwargs), priority)
+
+    with _lock:
+        _stats[host]['in_flight'] += 1
+    start = time.perf_counter()
+    try:
+        with metrics.span('upstream'):
+            response = session.request(method, url, **kwargs)
+    except requests.RequestException:
+        _record(host, (time.perf_counter() - start) * 1000)
+        governor.report(host)
+        raise
+    except BaseException:
+        governor.release(host)
+        raise
+    finally:
+        with _lock:
+            _stats[host]['in_flight'] -= 1
+
+    history = getattr(response.raw, 'retries', None)
+    retries = len(history.history) if history is not None else 0
+    _record(host, (time.perf_counter() - start) * 1000, response.status_code, retries=retries)
+    governor.report(host, response.status_code, response.headers.get('Retry-After'))
+    return response
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+
+def async_client_for(url):
+    """Returns the process-wide pooled httpx.AsyncClient for the host of `url`."""
+    host = _host_of(url)
+    client = _async_clients.get(host)
+    if client is None:
+        pool_size = POOL_SIZES.get(host, DEFAULT_POOL_SIZE)
+        limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        # httpx transports only retry failed connects, not 5xx responses.
+        transport = httpx.AsyncHTTPTransport(retries=MAX_RETRIES, limits=limits)
+        client = httpx.AsyncClient(
+            transport=transport,
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+        )
+        with _lock:
+            _async_clients[host] = client
+            _init_stats(host)
+    return client
+
+
+async def aget(url, priority=None, **kwargs):
+    """Async GET through the pooled client for the url's host."""
+    client = async_client_for(url)
+    host = _host_of(url)
+    key = _api_key(kwargs)
+    _, max_wait = governor.PRIORITIES.get(priority or governor.DEFAULT_PRIORITY,
+                                          governor.PRIORITIES[governor.DEFAULT_PRIORITY])
+    deadline = time.monotonic() + max_wait
+    while (wait := governor.check(host, key, priority)) > 0:
+        if time.monotonic() + wait > deadline:
+            governor.throttle(host, key, priority)
+        governor.waited(host, key, wait)
+        await anyio.sleep(wait)
+
+    with _lock:
+        _stats[host]['in_flight'] += 1
+    start = time.perf_counter()
+    try:
+        with metrics.span('upstream'):
+            response = await client.get(url, **kwargs)
+    except httpx.HTTPError:
+        _record(host, (time.perf_counter() - start) * 1000)
+        governor.report(host)
+        raise
+    except BaseException:
+        # Cancelled mid-request: don't leave a half-open probe slot taken.
+        governor.release(host)
+        raise
+    finally:
+        with _lock:
+            _stats[host]['in_flight'] -= 1
+    _record(host, (time.perf_counter() - start) * 1000, response.status_code)
+    governor.report(host, response.status_code, response.headers.get('Retry-After'))
+    return response
+
+
+async def aclose():
+    """Closes every async client (ASGI lifespan shutdown)."""
+    for client in list(_async_clients.values()):
+        await client.aclose()
+    _async_clients.clear()
+
+
+def stats():
+    """Per-host request counters plus live urllib3 pool usage."""
+    out = {}
+    with _lock:
+        for host, s in _stats.items():
+            entry = dict(s)
+            entry['avg_ms'] = round(s['total_ms'] / s['requests'], 2) if s['requests'] else 0.0
+            entry['total_ms'] = round(s['total_ms'], 2)
+            entry['pool_maxsize'] = POOL_SIZES.get(host, DEFAULT_POOL_SIZE)
+            if host in _sessions:
+                entry['connections_opened'] = _connections_opened(_sessions[host])
+            out[host] = entry
+    return out
+
+
+def _connections_opened(session):
+    total = 0
+    # http:// and https:// are mounted on the same adapter; count it once.
+    for adapter in {id(a): a for a in session.adapters.values()}.values():
+        for pool in adapter.poolmanager.pools._container.values():
+            total += pool.num_connections
+    return total